@@ -0,0 +1,370 @@
+"""
+Load test of PTBPersistence with several workers, as a bot behind a webhook load balancer.
+
+Every worker process runs a CustomApplication with a PTBPersistence, and processes
+synthetic updates (commands and messages of random users, some of them in a persistent
+ConversationHandler) with ``process_update``, from concurrent requests. The Bot API is
+not contacted. Reports the throughput of all workers, the latency of ``process_update``
+and the data store calls made per update.
+
+With ``--store memory``, every worker keeps its data in its own process, with ``--latency``
+simulating a round trip to a database. With ``--store mongodb`` (Motor) or ``--store pymongo``,
+the workers share the collections prefixed with ``load_`` of ``--database``, which are
+dropped at the end.
+
+Usage:
+python benchmarks/load_test.py [--workers 4] [--updates 5000] [--concurrency 16] [--users 1000] \
+    [--store memory] [--latency 0.0005] [--uri mongodb://localhost:27017 --database benchmarks]
+"""
+from ptb_persistence import PTBPersistence
+from ptb_persistence.abc import DataStore
+from ptb_persistence.datastores.memory import MemoryDataStore
+from ptb_persistence.instrumentation import account
+from ptb_persistence.utils.ptb import CustomApplication
+from telegram import Update
+from telegram.ext import (
+    Application,
+    CommandHandler,
+    ContextTypes,
+    ConversationHandler,
+    MessageHandler,
+    filters
+    )
+from telegram.request import BaseRequest, RequestData
+from collections import Counter
+from dataclasses import dataclass, field
+from logging import getLogger
+import multiprocessing
+import statistics
+import argparse
+import asyncio
+import random
+import json
+import time
+
+
+
+STORES = ('memory', 'mongodb', 'pymongo')
+COLLECTIONS = {
+    'collection_userdata': 'load_userdata',
+    'collection_chatdata': 'load_chatdata',
+    'collection_botdata': 'load_botdata',
+    'collection_conversationsdata': 'load_conversations',
+}
+
+# Share of each kind of synthetic update.
+MESSAGES = {
+    '/start': 0.3,
+    '/order': 0.2,
+    'some text': 0.4,
+    '/cancel': 0.1,
+}
+
+ASK_ITEM, ASK_QUANTITY = range(2)
+
+
+
+class OfflineRequest(BaseRequest):
+    """Answers the Bot API requests locally: getMe with a fake bot, anything else with True."""
+
+    async def initialize(self) -> None:
+        return
+
+
+    async def shutdown(self) -> None:
+        return
+
+
+    @property
+    def read_timeout(self) -> float | None:
+        return None
+
+
+    async def do_request(self,
+            url: str,
+            method: str,
+            request_data: RequestData | None = None,
+            read_timeout: float | None = None,
+            write_timeout: float | None = None,
+            connect_timeout: float | None = None,
+            pool_timeout: float | None = None
+            ) -> tuple[int, bytes]:
+        if url.endswith('/getMe'):
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Load test', 'username': 'load_test_bot'}
+        else:
+            result = True
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+
+
+@dataclass
+class WorkerResult:
+    latencies: list[float] = field(default_factory=list)
+    round_trips: list[int] = field(default_factory=list)
+    payload_bytes: int = 0
+    store_time: float = 0.0
+    calls: Counter = field(default_factory=Counter)
+    errors: int = 0
+    started_at: float = 0.0
+    finished_at: float = 0.0
+
+
+
+# Handlers: they only change data, replies would need the Bot API.
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    context.user_data['starts'] = context.user_data.get('starts', 0) + 1
+    context.chat_data['last_start'] = update.message.date.timestamp()
+
+
+async def order(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    context.user_data['order'] = {}
+    return ASK_ITEM
+
+
+async def ask_item(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    context.user_data.setdefault('order', {})['item'] = update.message.text
+    return ASK_QUANTITY
+
+
+async def ask_quantity(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    context.user_data.setdefault('orders', []).append(context.user_data.pop('order', {}))
+    # Keep the data at a steady size.
+    del context.user_data['orders'][:-10]
+    context.bot_data['orders'] = context.bot_data.get('orders', 0) + 1
+    return ConversationHandler.END
+
+
+async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    context.user_data.pop('order', None)
+    return ConversationHandler.END
+
+
+async def echo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    context.chat_data['messages'] = context.chat_data.get('messages', 0) + 1
+
+
+
+def build_data_store(args: argparse.Namespace) -> DataStore:
+    if args.store == 'memory':
+        return MemoryDataStore(latency=args.latency)
+    elif args.store == 'mongodb':
+        from ptb_persistence.datastores.mongodb import MongoDBDataStore
+        return MongoDBDataStore(
+            client_or_uri=args.uri,
+            database=args.database,
+            **COLLECTIONS
+        )
+    from ptb_persistence.datastores.pymongo_async import PyMongoDataStore
+    return PyMongoDataStore(
+        client_or_uri=args.uri,
+        database=args.database,
+        **COLLECTIONS
+    )
+
+
+def build_application(args: argparse.Namespace, result: WorkerResult) -> Application:
+    persistence = PTBPersistence(
+        data_store=build_data_store(args),
+        update_interval=args.update_interval
+    )
+    application = (
+        Application
+        .builder()
+        .application_class(CustomApplication)
+        .token('1:load-test')
+        .request(OfflineRequest())
+        .get_updates_request(OfflineRequest())
+        .persistence(persistence)
+        .build()
+    )
+
+    application.add_handler(
+        ConversationHandler(
+            entry_points=[CommandHandler('order', order)],
+            states={
+                ASK_ITEM: [MessageHandler(filters.TEXT & ~filters.COMMAND, ask_item)],
+                ASK_QUANTITY: [MessageHandler(filters.TEXT & ~filters.COMMAND, ask_quantity)],
+            },
+            fallbacks=[CommandHandler('cancel', cancel)],
+            name='order',
+            persistent=True
+        )
+    )
+    application.add_handler(CommandHandler('start', start), group=1)
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, echo), group=1)
+
+    async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
+        result.errors += 1
+        if result.errors == 1:
+            getLogger(__name__).error('Handler failed', exc_info=context.error)
+
+    application.add_error_handler(error_handler)
+    return application
+
+
+def make_update(update_id: int, user_id: int, text: str, application: Application) -> Update:
+    entities = []
+    if text.startswith('/'):
+        entities.append({'type': 'bot_command', 'offset': 0, 'length': len(text)})
+    return Update.de_json(
+        {
+            'update_id': update_id,
+            'message': {
+                'message_id': update_id,
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private'},
+                'from': {'id': user_id, 'is_bot': False, 'first_name': 'User'},
+                'text': text,
+                'entities': entities,
+            },
+        },
+        application.bot
+    )
+
+
+async def run_worker(
+        index: int,
+        args: argparse.Namespace,
+        barrier: multiprocessing.Barrier
+        ) -> WorkerResult:
+    result = WorkerResult()
+    application = build_application(args, result)
+
+    rng = random.Random(index)
+    texts, weights = zip(*MESSAGES.items())
+    updates = [
+        (index * args.updates + number, rng.randrange(args.users), text)
+        for number, text in enumerate(rng.choices(texts, weights, k=args.updates))
+    ]
+    queue = iter(updates)
+
+    async def client() -> None:
+        for update_id, user_id, text in queue:
+            update = make_update(update_id, user_id, text, application)
+            started = time.perf_counter()
+            with account() as accounting:
+                await application.process_update(update)
+            result.latencies.append(time.perf_counter() - started)
+            result.round_trips.append(accounting.operations)
+            result.payload_bytes += accounting.bytes_in + accounting.bytes_out
+            result.store_time += accounting.store_time
+            result.calls.update(accounting.calls)
+
+    async with application:
+        await application.start()
+
+        # Start measuring once every worker has loaded its data.
+        await asyncio.to_thread(barrier.wait)
+        result.started_at = time.time()
+        await asyncio.gather(*(client() for _ in range(args.concurrency)))
+        result.finished_at = time.time()
+
+        await application.stop()
+
+    return result
+
+
+def worker_main(
+        index: int,
+        args: argparse.Namespace,
+        barrier: multiprocessing.Barrier,
+        results: multiprocessing.Queue
+        ) -> None:
+    try:
+        results.put((index, asyncio.run(run_worker(index, args, barrier))))
+    except BaseException as error:
+        barrier.abort()
+        results.put((index, error))
+        raise
+
+
+async def drop_collections(args: argparse.Namespace) -> None:
+    data_store = build_data_store(args)
+    await data_store.post_init(logger=getLogger(__name__))
+    for collection in COLLECTIONS.values():
+        await data_store._database.drop_collection(collection)
+    await data_store.flush()
+
+
+def report(args: argparse.Namespace, results: list[WorkerResult]) -> None:
+    latencies = sorted(latency for result in results for latency in result.latencies)
+    round_trips = [count for result in results for count in result.round_trips]
+    updates = len(latencies)
+    elapsed = (
+        max(result.finished_at for result in results) -
+        min(result.started_at for result in results)
+    )
+    p50, p99 = (
+        latencies[min(updates - 1, int(updates * q))] * 1000
+        for q in (0.5, 0.99)
+    )
+    calls = sum((result.calls for result in results), Counter())
+
+    print(
+        f'{args.workers} workers x {args.concurrency} concurrent requests,'
+        f' {args.store} store, {args.users} users'
+    )
+    print(f'updates            {updates}')
+    print(f'elapsed            {elapsed:.2f} s')
+    print(f'throughput         {updates / elapsed:.0f} updates/s')
+    print(f'latency mean       {statistics.fmean(latencies) * 1000:.3f} ms')
+    print(f'latency p50        {p50:.3f} ms')
+    print(f'latency p99        {p99:.3f} ms')
+    print(f'round trips        {statistics.fmean(round_trips):.2f} per update (max {max(round_trips)})')
+    for method, count in calls.most_common():
+        print(f'  {method:<20} {count / updates:.2f} per update')
+    print(f'data store time    {sum(r.store_time for r in results) / updates * 1000:.3f} ms per update')
+    print(f'payload            {sum(r.payload_bytes for r in results) / updates:.0f} bytes per update')
+    print(f'handler errors     {sum(result.errors for result in results)}')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog='python benchmarks/load_test.py'
+    )
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--updates', type=int, default=5000, help='Updates per worker.')
+    parser.add_argument('--concurrency', type=int, default=16, help='Concurrent requests per worker.')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--store', choices=STORES, default='memory')
+    parser.add_argument('--latency', type=float, default=0.0, help='Simulated round trip of the memory store, in seconds.')
+    parser.add_argument('--update-interval', type=float, default=5.0, help='Seconds between persistence updates.')
+    parser.add_argument('--uri')
+    parser.add_argument('--database')
+    args = parser.parse_args()
+
+    if args.store != 'memory' and not (args.uri and args.database):
+        parser.error(f'--store {args.store} requires --uri and --database')
+
+    if args.store != 'memory':
+        asyncio.run(drop_collections(args))
+
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(args.workers)
+    results_queue = context.Queue()
+    workers = [
+        context.Process(target=worker_main, args=(index, args, barrier, results_queue))
+        for index in range(args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+
+    try:
+        results = []
+        for _ in workers:
+            index, result = results_queue.get()
+            if isinstance(result, BaseException):
+                raise SystemExit(f'Worker {index} failed: {result!r}')
+            results.append(result)
+    finally:
+        for worker in workers:
+            worker.join()
+        if args.store != 'memory':
+            asyncio.run(drop_collections(args))
+
+    report(args, results)
+
+
+
+if __name__ == '__main__':
+    main()
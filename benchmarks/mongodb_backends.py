@@ -0,0 +1,173 @@
+"""
+Compare the latency and throughput of the Motor and PyMongo asyncio MongoDB data stores.
+
+Both data stores run the same operations against the same server, on collections
+prefixed with ``bench_`` that are dropped at the end.
+
+Usage:
+python benchmarks/mongodb_backends.py --uri mongodb://localhost:27017 --database benchmarks \
+    [--documents 1000] [--operations 5000] [--concurrency 1 16 64]
+"""
+from ptb_persistence.datastores.mongodb import MongoDBDataStore
+from ptb_persistence.datastores.pymongo_async import PyMongoDataStore
+from dataclasses import dataclass
+from logging import getLogger
+from typing import (
+    Awaitable,
+    Callable
+    )
+import statistics
+import argparse
+import asyncio
+import random
+import time
+
+
+
+BACKENDS: dict[str, type[MongoDBDataStore]] = {
+    'motor': MongoDBDataStore,
+    'pymongo': PyMongoDataStore,
+}
+
+
+
+@dataclass
+class Result:
+    backend: str
+    operation: str
+    concurrency: int
+    latencies: list[float]
+    elapsed: float
+
+
+    def row(self) -> str:
+        latencies = sorted(self.latencies)
+        p50, p99 = (
+            latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000
+            for q in (0.5, 0.99)
+        )
+        return (
+            f'{self.backend:<8} {self.operation:<16} {self.concurrency:>5}'
+            f' {statistics.fmean(latencies) * 1000:>9.3f} {p50:>9.3f} {p99:>9.3f}'
+            f' {len(latencies) / self.elapsed:>10.0f}'
+        )
+
+
+
+async def measure(
+        operation: Callable[[int], Awaitable[None]],
+        operations: int,
+        concurrency: int
+        ) -> tuple[list[float], float]:
+    """Run ``operations`` calls from ``concurrency`` concurrent workers."""
+    latencies: list[float] = []
+    counter = iter(range(operations))
+
+    async def worker() -> None:
+        for index in counter:
+            started = time.perf_counter()
+            await operation(index)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - started
+
+
+async def run_backend(
+        name: str,
+        uri: str,
+        database: str,
+        documents: int,
+        operations: int,
+        concurrency_levels: list[int]
+        ) -> list[Result]:
+    data_store = BACKENDS[name](
+        client_or_uri=uri,
+        database=database,
+        collection_userdata=f'bench_{name}',
+        ensure_indexes=False
+    )
+    await data_store.post_init(logger=getLogger(__name__))
+
+    user_ids = list(range(documents))
+    for user_id in user_ids:
+        await data_store.update_data(
+            data_type='user',
+            data_id=user_id,
+            local_data={'user_id': user_id, 'history': list(range(20)), 'counter': 0}
+        )
+
+    async def refresh(index: int) -> None:
+        # Empty local data, so the document is always fetched.
+        await data_store.refresh_data(
+            data_type='user',
+            data_id=random.choice(user_ids),
+            local_data={}
+        )
+
+    async def update(index: int) -> None:
+        user_id = random.choice(user_ids)
+        await data_store.update_data(
+            data_type='user',
+            data_id=user_id,
+            local_data={'user_id': user_id, 'history': list(range(20)), 'counter': index}
+        )
+
+    results = []
+    try:
+        for operation_name, operation in (('refresh_data', refresh), ('update_data', update)):
+            # Warm up the connection pool.
+            await measure(operation, operations=max(concurrency_levels), concurrency=max(concurrency_levels))
+
+            for concurrency in concurrency_levels:
+                latencies, elapsed = await measure(
+                    operation,
+                    operations=operations,
+                    concurrency=concurrency
+                )
+                results.append(
+                    Result(name, operation_name, concurrency, latencies, elapsed)
+                )
+    finally:
+        await data_store._user_data.collection.drop()
+        await data_store.flush()
+
+    return results
+
+
+async def run(args: argparse.Namespace) -> None:
+    print(
+        f'{"backend":<8} {"operation":<16} {"conc.":>5}'
+        f' {"mean ms":>9} {"p50 ms":>9} {"p99 ms":>9} {"ops/s":>10}'
+    )
+    for name in args.backends:
+        results = await run_backend(
+            name=name,
+            uri=args.uri,
+            database=args.database,
+            documents=args.documents,
+            operations=args.operations,
+            concurrency_levels=args.concurrency
+        )
+        for result in results:
+            print(result.row())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog='python benchmarks/mongodb_backends.py'
+    )
+    parser.add_argument('--uri', required=True)
+    parser.add_argument('--database', required=True)
+    parser.add_argument('--documents', type=int, default=1000)
+    parser.add_argument('--operations', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 16, 64])
+    parser.add_argument('--backends', nargs='+', choices=list(BACKENDS), default=list(BACKENDS))
+
+    asyncio.run(run(parser.parse_args()))
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import (
+    Any,
+    Callable,
+    Hashable
+    )
+import itertools
+import pickle
+import sys
+
+
+
+@dataclass
+class BoundedDataStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+
+
+def _estimate_size(value: object) -> int:
+    try:
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return sys.getsizeof(value)
+
+
+
+class BoundedDataDict(defaultdict):
+    """
+    A defaultdict that keeps track of the least recently used entries.
+
+    It does not evict anything by itself. :meth:`eviction_candidates` returns the
+    coldest entries while the mapping is over its entry count or byte budget, and
+    :meth:`evict` removes an entry if it was not used since it was selected.
+
+    An entry is used when :meth:`touch` is called for it, i.e. when it is refreshed
+    for an update or a job. Plain reads, like the copies PTB makes to update the
+    persistence, leave the order of the entries as it is.
+
+    Accessing a missing (e.g. evicted) key creates a new entry, just like the
+    defaultdict used by PTB, and it is filled again by the next refresh.
+    """
+
+    def __init__(self,
+            default_factory: Callable[[], Any] | None = None,
+            max_entries: int | None = None,
+            max_bytes: int | None = None
+            ) -> None:
+        super().__init__(default_factory)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stats = BoundedDataStats()
+
+        self._clock = itertools.count()
+        # Last access tick per key, ordered from least to most recently used.
+        self._ticks: dict[Hashable, int] = {}
+        # Estimated size of entries not used since it was last computed.
+        self._sizes: dict[Hashable, int] = {}
+        self._total_bytes = 0
+        # Entries created by a read since they were last touched.
+        self._created: set[Hashable] = set()
+
+
+    def _touch(self, key: Hashable) -> None:
+        self._ticks.pop(key, None)
+        self._ticks[key] = next(self._clock)
+        self._total_bytes -= self._sizes.pop(key, 0)
+
+
+    def _forget(self, key: Hashable) -> None:
+        self._ticks.pop(key, None)
+        self._total_bytes -= self._sizes.pop(key, 0)
+        self._created.discard(key)
+
+
+    def __missing__(self, key: Hashable) -> Any:
+        value = super().__missing__(key)
+        self._created.add(key)
+        return value
+
+
+    def touch(self, key: Hashable) -> None:
+        """
+        Mark ``key`` as used. Counts a miss if the entry was not in memory (it was
+        created since it was last touched, or it does not exist), a hit otherwise.
+        """
+        if key in self._created or not dict.__contains__(self, key):
+            self.stats.misses += 1
+        else:
+            self.stats.hits += 1
+        self._created.discard(key)
+        if dict.__contains__(self, key):
+            self._touch(key)
+
+
+    def __setitem__(self, key: Hashable, value: Any) -> None:
+        self._touch(key)
+        super().__setitem__(key, value)
+
+
+    def __delitem__(self, key: Hashable) -> None:
+        super().__delitem__(key)
+        self._forget(key)
+
+
+    def pop(self, key: Hashable, *args: Any) -> Any:
+        self._forget(key)
+        return super().pop(key, *args)
+
+
+    def popitem(self) -> tuple[Hashable, Any]:
+        key, value = super().popitem()
+        self._forget(key)
+        return key, value
+
+
+    def clear(self) -> None:
+        super().clear()
+        self._ticks.clear()
+        self._sizes.clear()
+        self._created.clear()
+        self._total_bytes = 0
+
+
+    def update(self, *args: Any, **kwargs: Any) -> None:
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+
+    def setdefault(self, key: Hashable, default: Any = None) -> Any:
+        self._touch(key)
+        return super().setdefault(key, default)
+
+
+    def peek(self, key: Hashable) -> Any:
+        """Return an entry without marking it as used."""
+        return dict.__getitem__(self, key)
+
+
+    def tick(self, key: Hashable) -> int | None:
+        return self._ticks.get(key)
+
+
+    def total_bytes(self) -> int:
+        """Estimated size of all entries, computing it for entries used since the last call."""
+        for key in self._ticks:
+            if key not in self._sizes:
+                size = _estimate_size(dict.__getitem__(self, key))
+                self._sizes[key] = size
+                self._total_bytes += size
+        return self._total_bytes
+
+
+    def eviction_candidates(self) -> list[Hashable]:
+        """The least recently used keys to evict to get back under the limits."""
+        over_entries = 0
+        if self.max_entries is not None:
+            over_entries = len(self) - self.max_entries
+
+        over_bytes = 0
+        if self.max_bytes is not None:
+            over_bytes = self.total_bytes() - self.max_bytes
+
+        candidates = []
+        for key in self._ticks:
+            if over_entries <= 0 and over_bytes <= 0:
+                break
+            candidates.append(key)
+            over_entries -= 1
+            over_bytes -= self._sizes.get(key, 0)
+        return candidates
+
+
+    def evict(self, key: Hashable, tick: int | None) -> bool:
+        """Remove ``key`` unless it was used after ``tick`` was taken."""
+        if tick is None or self._ticks.get(key) != tick:
+            return False
+        dict.pop(self, key, None)
+        self._forget(key)
+        self.stats.evictions += 1
+        return True
@@ -1,36 +1,23 @@
 from typing import (
+    Callable,
+    ContextManager,
+    Literal,
+    Sequence,
     Union,
     Tuple,
     Dict,
     Any
     )
-import functools
 from .abc import DataStore
-from ._types import ConversationDict
+from ._types import CallbackData, ConversationDict
+from .instrumentation import QueryBudget, UpdateAccounting, account, log_method
+from ._bounded import BoundedDataDict, BoundedDataStats
 from logging import getLogger, Logger
 from telegram.ext import BasePersistence
 
-import time
-
-
-
-def log_method(method):
-    method_name: str = method.__name__
-
-    @functools.wraps(method)
-    async def wrapper(self: 'PTBPersistence', *args, **kwargs):
-        self._logger.debug(
-            f'PTBPersistence: Calling {method_name!r} method. Args: {args=} Kwargs: {kwargs=}'
-            )
-        start_time = time.time()
-        result = await method(self, *args, **kwargs)
-        elapsed_time = time.time() - start_time
-        self._logger.debug(
-            f'PTBPersistence: Result of {method_name!r} method: {result!r} (Elapsed Time: {elapsed_time:.4f} seconds)'
-            )
-        return result
-
-    return wrapper
+import contextlib
+import asyncio
+import copy
 
 
 
@@ -40,7 +27,16 @@ class PTBPersistence(BasePersistence):
             self,
             data_store: DataStore,
             update_interval: float = 60,
-            logger: Logger | None = None
+            logger: Logger | None = None,
+            lazy_user_data: bool = False,
+            lazy_chat_data: bool = False,
+            max_user_data_entries: int | None = None,
+            max_user_data_bytes: int | None = None,
+            max_chat_data_entries: int | None = None,
+            max_chat_data_bytes: int | None = None,
+            refresh_on_update: bool = True,
+            account_updates: bool = False,
+            query_budget: QueryBudget | None = None
             ) -> None:
         """
         Persistent data class for PTB.
@@ -63,12 +59,82 @@ class PTBPersistence(BasePersistence):
             seconds.
 
         :param logger (:obj: `Logger`): A logger for logs. If None, it will be using getLogger(__name__)
+
+        :param lazy_user_data (:obj:`bool`, optional): If True, user data is not loaded at
+            startup. An entry is fetched from the data store the first time it is refreshed,
+            which PTB does before running handlers and jobs for that user. Defaults to ``False``.
+
+        :param lazy_chat_data (:obj:`bool`, optional): Same as ``lazy_user_data``, for chat data.
+            Defaults to ``False``.
+
+        :param max_user_data_entries (:obj:`int`, optional): Maximum number of user data entries
+            kept in memory. After each persistence update, the least recently used entries over
+            the limit (an entry is used when it is refreshed for an update or a job) are written
+            through the data store and evicted. An evicted entry is loaded
+            again on its next refresh. Requires :class:`ptb_persistence.utils.ptb.CustomApplication`.
+            Defaults to ``None`` (unbounded).
+
+        :param max_user_data_bytes (:obj:`int`, optional): Like ``max_user_data_entries``, but
+            limits the estimated (pickled) size of all user data entries. Defaults to ``None``.
+
+        :param max_chat_data_entries (:obj:`int`, optional): Same as ``max_user_data_entries``,
+            for chat data. Defaults to ``None``.
+
+        :param max_chat_data_bytes (:obj:`int`, optional): Same as ``max_user_data_bytes``,
+            for chat data. Defaults to ``None``.
+
+        :param refresh_on_update (:obj:`bool`, optional): If False and the data store watches
+            for changes (e.g. ``MongoDBDataStore(..., watch_changes=True)``), data already in
+            memory is not refreshed before handlers and jobs run, since changes made by other
+            processes are pushed into it. Requires :class:`ptb_persistence.utils.ptb.CustomApplication`.
+            Defaults to ``True``.
+
+        :param account_updates (:obj:`bool`, optional): If True, the data store calls made while
+            processing each update (count, documents, estimated bytes read and written, time) are
+            accounted. Handlers and error handlers get the accounting of their update with
+            :func:`ptb_persistence.instrumentation.current_accounting`. Estimating sizes pickles
+            the data of every call. Requires :class:`ptb_persistence.utils.ptb.CustomApplication`.
+            Defaults to ``False``.
+
+        :param query_budget (:obj:`QueryBudget`, optional): Limits on the data store calls of
+            each update, which log a warning or raise when exceeded (see
+            :class:`ptb_persistence.instrumentation.QueryBudget`). Implies ``account_updates``.
+            Defaults to ``None``.
         """
 
         self._inited: bool = False
         self._data_store = data_store
         self._logger = logger or getLogger(__name__)
 
+        self._lazy_data_types: set[str] = set()
+        if lazy_user_data:
+            self._lazy_data_types.add('user')
+        if lazy_chat_data:
+            self._lazy_data_types.add('chat')
+        self._refresh_on_update = refresh_on_update
+        self._account_updates = account_updates or query_budget is not None
+        self._query_budget = query_budget
+        # Whether the data store pushes remote changes into the in-memory data.
+        self._watching = False
+
+        # Ids of lazy data (or of any data, without refresh_on_update) already
+        # fetched from the data store by this process.
+        self._loaded_data_ids: Dict[str, set[int]] = {
+            'user': set(),
+            'chat': set()
+        }
+        # Ids of evicted data not fetched again since.
+        self._evicted_data_ids: Dict[str, set[int]] = {
+            'user': set(),
+            'chat': set()
+        }
+
+        self._data_limits: Dict[str, Tuple[int | None, int | None]] = {
+            'user': (max_user_data_entries, max_user_data_bytes),
+            'chat': (max_chat_data_entries, max_chat_data_bytes)
+        }
+        self._data_mappings: Dict[str, BoundedDataDict] = {}
+
         self.store_data = self._data_store.build_persistence_input()
         super().__init__(
             store_data=self.store_data,
@@ -86,18 +152,204 @@ class PTBPersistence(BasePersistence):
         self._inited = True
 
 
+    async def _load_missing_data(self, data_type: str, data_id: int, data: dict) -> dict:
+        """
+        In lazy mode, merge the stored data into ``data`` if this process never loaded it.
+
+        This keeps an update for an entry that was never refreshed (e.g. one marked
+        manually with ``mark_data_for_update_persistence``) from replacing the stored
+        entry with partial data.
+        """
+        loaded_ids = self._loaded_data_ids[data_type]
+        evicted_ids = self._evicted_data_ids[data_type]
+        if data_id not in evicted_ids and (
+                not self._tracks_loaded(data_type) or data_id in loaded_ids
+                ):
+            return data
+
+        stored_data = {}
+        await self._data_store.refresh_data(
+            data_type=data_type,
+            data_id=data_id,
+            local_data=stored_data
+        )
+        stored_data.update(data)
+        self._mark_loaded(data_type, data_id)
+        return stored_data
+
+
+    def _tracks_loaded(self, data_type: str) -> bool:
+        return data_type in self._lazy_data_types or not self._refresh_on_update
+
+
+    def _mark_loaded(self, data_type: str, data_id: int) -> None:
+        self._evicted_data_ids[data_type].discard(data_id)
+        if self._tracks_loaded(data_type):
+            self._loaded_data_ids[data_type].add(data_id)
+
+
+    def _skip_refresh(self) -> bool:
+        """Whether in-memory data is kept up to date by the data store."""
+        return self._watching and not self._refresh_on_update
+
+
+    def _touch_data(self, data_type: str, data_id: int | None) -> None:
+        """Mark an entry of a bounded mapping as used by an update or a job."""
+        mapping = self._data_mappings.get(data_type)
+        if mapping is not None and data_id is not None:
+            mapping.touch(data_id)
+
+
+    def _needs_refresh(self, data_type: str, data_id: int) -> bool:
+        if not self._skip_refresh():
+            return True
+        return (
+            data_id in self._evicted_data_ids[data_type] or
+            data_id not in self._loaded_data_ids[data_type]
+        )
+
+
+    async def watch(self,
+            user_data: Dict[int, Any] | None = None,
+            chat_data: Dict[int, Any] | None = None,
+            bot_data: dict | None = None,
+            conversations: Dict[str, ConversationDict] | None = None
+            ) -> bool:
+        """
+        Ask the data store to push changes made by other processes into the given
+        in-memory data (the application's mappings). Called by
+        :class:`ptb_persistence.utils.ptb.CustomApplication` once initialized.
+
+        Returns False if the data store does not watch for changes.
+        """
+        await self._post_init()
+
+        data = {}
+        if self.store_data.user_data and user_data is not None:
+            data['user'] = user_data
+        if self.store_data.chat_data and chat_data is not None:
+            data['chat'] = chat_data
+        if self.store_data.bot_data and bot_data is not None:
+            data['bot'] = {self.bot.id: bot_data}
+
+        self._watching = await self._data_store.watch(
+            data=data,
+            conversations=conversations
+        )
+        if not self._watching and not self._refresh_on_update:
+            self._logger.warning(
+                'PTBPersistence: The data store does not watch for changes,'
+                ' data is refreshed on every update.'
+            )
+        return self._watching
+
+
+    def build_data_mapping(self,
+            data_type: Literal['user', 'chat'],
+            default_factory: Callable[[], Any]
+            ) -> BoundedDataDict | None:
+        """
+        Build the bounded mapping to use in place of the application's user/chat data.
+
+        Returns None if no limit is configured for ``data_type``.
+        """
+        max_entries, max_bytes = self._data_limits[data_type]
+        if max_entries is None and max_bytes is None:
+            return None
+
+        mapping = BoundedDataDict(
+            default_factory,
+            max_entries=max_entries,
+            max_bytes=max_bytes
+        )
+        self._data_mappings[data_type] = mapping
+        return mapping
+
+
+    def account_update(self) -> ContextManager[UpdateAccounting | None]:
+        """
+        Context manager accounting for the data store calls made while processing an
+        update, if ``account_updates`` or ``query_budget`` is set. Used by
+        :class:`ptb_persistence.utils.ptb.CustomApplication`.
+        """
+        if not self._account_updates:
+            return contextlib.nullcontext()
+        return account(budget=self._query_budget)
+
+
+    def get_data_stats(self, data_type: Literal['user', 'chat']) -> BoundedDataStats | None:
+        """Hit/miss/eviction counters of the bounded mapping of ``data_type``, if any."""
+        mapping = self._data_mappings.get(data_type)
+        return mapping.stats if mapping is not None else None
+
+
+    async def evict_data(self,
+            data_type: Literal['user', 'chat'],
+            ids_to_update: set[int]
+            ) -> None:
+        """
+        Evict the least recently used entries over the limits of ``data_type``.
+
+        Entries still waiting in ``ids_to_update`` (the application's set of ids to
+        update in persistence) are written through the data store first.
+        """
+        mapping = self._data_mappings.get(data_type)
+        if mapping is None:
+            return
+
+        async def _evict(data_id: int) -> None:
+            tick = mapping.tick(data_id)
+            if data_id in ids_to_update:
+                ids_to_update.discard(data_id)
+                try:
+                    await self._update_data(
+                        data_type, data_id, copy.deepcopy(mapping.peek(data_id))
+                    )
+                except Exception:
+                    ids_to_update.add(data_id)
+                    self._logger.exception(
+                        f'PTBPersistence: Failed to write {data_type} data {data_id!r} before eviction'
+                    )
+                    return
+
+            if mapping.evict(data_id, tick):
+                self._data_store.forget_data(
+                    data_type=data_type,
+                    data_id=data_id
+                )
+                self._loaded_data_ids[data_type].discard(data_id)
+                self._evicted_data_ids[data_type].add(data_id)
+
+        await asyncio.gather(*(
+            _evict(data_id) for data_id in mapping.eviction_candidates()
+        ))
+
+
+    async def _update_data(self, data_type: str, data_id: int, data: dict) -> None:
+        if data_type == 'user':
+            await self.update_user_data(data_id, data)
+        else:
+            await self.update_chat_data(data_id, data)
+
+
     # User methods
     @log_method
     async def get_user_data(self) -> Dict[int, Any]:
         await self._post_init()
-        return await self._data_store.get_data(
+        if 'user' in self._lazy_data_types:
+            return {}
+        data = await self._data_store.get_data(
             data_type='user'
         )
+        if self._tracks_loaded('user'):
+            self._loaded_data_ids['user'].update(data)
+        return data
 
 
     @log_method
     async def update_user_data(self, user_id: int, data: dict) -> None:
         await self._post_init()
+        data = await self._load_missing_data('user', user_id, data)
         return await self._data_store.update_data(
             data_type='user',
             data_id=user_id,
@@ -108,16 +360,22 @@ class PTBPersistence(BasePersistence):
     @log_method
     async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
         await self._post_init()
-        return await self._data_store.refresh_data(
+        self._touch_data('user', user_id)
+        if not self._needs_refresh('user', user_id):
+            return
+        await self._data_store.refresh_data(
             data_type='user',
             data_id=user_id,
             local_data=user_data
         )
+        self._mark_loaded('user', user_id)
 
 
     @log_method
     async def drop_user_data(self, user_id: int) -> None:
         await self._post_init()
+        self._loaded_data_ids['user'].discard(user_id)
+        self._evicted_data_ids['user'].discard(user_id)
         return await self._data_store.drop_data(
             data_type='user',
             data_id=user_id
@@ -128,14 +386,20 @@ class PTBPersistence(BasePersistence):
     # Chat methods
     async def get_chat_data(self) -> Dict[int, Any]:
         await self._post_init()
-        return await self._data_store.get_data(
+        if 'chat' in self._lazy_data_types:
+            return {}
+        data = await self._data_store.get_data(
             data_type='chat'
         )
+        if self._tracks_loaded('chat'):
+            self._loaded_data_ids['chat'].update(data)
+        return data
     
 
     @log_method
     async def update_chat_data(self, chat_id: int, data: dict) -> None:
         await self._post_init()
+        data = await self._load_missing_data('chat', chat_id, data)
         return await self._data_store.update_data(
             data_type='chat',
             data_id=chat_id,
@@ -146,16 +410,22 @@ class PTBPersistence(BasePersistence):
     @log_method
     async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
         await self._post_init()
-        return await self._data_store.refresh_data(
+        self._touch_data('chat', chat_id)
+        if not self._needs_refresh('chat', chat_id):
+            return
+        await self._data_store.refresh_data(
             data_type='chat',
             data_id=chat_id,
             local_data=chat_data
         )
+        self._mark_loaded('chat', chat_id)
 
 
     @log_method
     async def drop_chat_data(self, chat_id: int) -> None:
         await self._post_init()
+        self._loaded_data_ids['chat'].discard(chat_id)
+        self._evicted_data_ids['chat'].discard(chat_id)
         return await self._data_store.drop_data(
             data_type='chat',
             data_id=chat_id
@@ -164,11 +434,13 @@ class PTBPersistence(BasePersistence):
 
     # Bot methods
     @log_method
-    async def get_bot_data(self) -> Dict[int, Any]:
+    async def get_bot_data(self) -> Dict[Any, Any]:
         await self._post_init()
-        return await self._data_store.get_data(
-            data_type='bot'
+        data = await self._data_store.get_data(
+            data_type='bot',
+            data_id=self.bot.id
         )
+        return data.get(self.bot.id, {})
     
 
     @log_method
@@ -184,6 +456,8 @@ class PTBPersistence(BasePersistence):
     @log_method
     async def refresh_bot_data(self, bot_data: dict) -> None:
         await self._post_init()
+        if self._skip_refresh():
+            return
         return await self._data_store.refresh_data(
             data_type='bot',
             data_id=self.bot.id,
@@ -191,6 +465,65 @@ class PTBPersistence(BasePersistence):
         )
     
 
+    # Combined methods
+    @log_method
+    async def refresh_many(
+        self,
+        user_id: int | None = None,
+        user_data: dict | None = None,
+        chat_id: int | None = None,
+        chat_data: dict | None = None,
+        bot_data: dict | None = None,
+        conversations: Sequence[
+            Tuple[str, Tuple[Union[int, str], ...], ConversationDict]
+        ] = (),
+        ) -> None:
+        """
+        Refresh the user, chat and bot data and the conversations of an update with a
+        single data store call. Data not stored by this persistence is skipped.
+        """
+        await self._post_init()
+        self._touch_data('chat', chat_id)
+        self._touch_data('user', user_id)
+
+        if (
+                chat_id is not None and
+                self.store_data.chat_data and
+                not self._needs_refresh('chat', chat_id)
+                ):
+            chat_id = None
+        if (
+                user_id is not None and
+                self.store_data.user_data and
+                not self._needs_refresh('user', user_id)
+                ):
+            user_id = None
+        if self._skip_refresh():
+            bot_data = None
+            conversations = ()
+
+        data = []
+        if self.store_data.bot_data and bot_data is not None:
+            data.append(('bot', self.bot.id, bot_data))
+        if self.store_data.chat_data and chat_id is not None:
+            data.append(('chat', chat_id, chat_data))
+        if self.store_data.user_data and user_id is not None:
+            data.append(('user', user_id, user_data))
+
+        if not data and not conversations:
+            return
+
+        await self._data_store.refresh_many(
+            data=data,
+            conversations=conversations
+        )
+
+        if self.store_data.chat_data and chat_id is not None:
+            self._mark_loaded('chat', chat_id)
+        if self.store_data.user_data and user_id is not None:
+            self._mark_loaded('user', user_id)
+
+
     # Conversation methods
     @log_method
     async def get_conversations(self, name: str) -> dict:
@@ -208,6 +541,8 @@ class PTBPersistence(BasePersistence):
         conversations_data: ConversationDict,
         ) -> None:
         await self._post_init()
+        if self._skip_refresh():
+            return
         return await self._data_store.refresh_conversation(
             name=name,
             key=key,
@@ -215,6 +550,22 @@ class PTBPersistence(BasePersistence):
         )
 
 
+    @log_method
+    async def refresh_conversations(
+        self,
+        conversations: Sequence[
+            Tuple[str, Tuple[Union[int, str], ...], ConversationDict]
+        ],
+        ) -> None:
+        """Refresh several (name, key, conversations_data) at once."""
+        await self._post_init()
+        if self._skip_refresh():
+            return
+        return await self._data_store.refresh_conversations(
+            conversations=conversations
+        )
+
+
     @log_method
     async def update_conversation(self,
             name: str,
@@ -231,17 +582,17 @@ class PTBPersistence(BasePersistence):
 
     # Callback methods
     @log_method
-    async def get_callback_data(self) -> tuple | None:
-        # TODO: Develop method
+    async def get_callback_data(self) -> CallbackData | None:
         await self._post_init()
-        return await super().get_callback_data()
+        return await self._data_store.get_callback_data()
 
 
     @log_method
-    async def update_callback_data(self, data: tuple) -> None:
-        # TODO: Develop method
+    async def update_callback_data(self, data: CallbackData) -> None:
         await self._post_init()
-        return await super().update_callback_data(data)
+        return await self._data_store.update_callback_data(
+            data=data
+        )
 
 
     # Flush methods
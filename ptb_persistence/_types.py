@@ -1,8 +1,13 @@
 from typing import (
+    Any,
+    Dict,
+    List,
     MutableMapping,
     Tuple,
     Union
     )
 
 ConversationKey = Tuple[Union[int, str], ...]
-ConversationDict = MutableMapping[ConversationKey, object]
\ No newline at end of file
+ConversationDict = MutableMapping[ConversationKey, object]
+# As in telegram.ext.BasePersistence: ([(keyboard uuid, access time, button data)], {query id: keyboard uuid})
+CallbackData = Tuple[List[Tuple[str, float, Dict[str, Any]]], Dict[str, str]]
\ No newline at end of file
@@ -1,6 +1,9 @@
-from ._types import ConversationDict
+from ._types import CallbackData, ConversationDict
 from typing import (
     Literal,
+    Mapping,
+    MutableMapping,
+    Sequence,
     Tuple,
     Union
     )
@@ -50,6 +53,27 @@ class DataStore(metaclass=ABCMeta):
         """
 
 
+    @abstractmethod
+    async def refresh_many(
+        self,
+        data: Sequence[
+            Tuple[Literal['user', 'chat', 'bot'], int, dict]
+        ],
+        conversations: Sequence[
+            Tuple[str, Tuple[Union[int, str], ...], ConversationDict]
+        ],
+        ) -> None:
+        """
+        Refresh several data entries and conversations at once, ideally in about one
+        round trip.
+
+        :param data: (data_type, data_id, local_data) for each entry,
+                as for :meth:`refresh_data`
+        :param conversations: (name, key, local_data) for each conversation,
+                as for :meth:`refresh_conversation`
+        """
+
+
     @abstractmethod
     async def drop_data(self,
             data_type: Literal['user', 'chat', 'bot'],
@@ -58,6 +82,16 @@ class DataStore(metaclass=ABCMeta):
         """
 
 
+    @abstractmethod
+    def forget_data(self,
+            data_type: Literal['user', 'chat', 'bot'],
+            data_id: int) -> None:
+        """
+        Called when the local data of ``data_id`` is discarded from memory (e.g. evicted),
+        so the data store drops anything it remembers about that local copy.
+        """
+
+
     @abstractmethod
     async def get_conversations(self, name: str) -> dict:
         """
@@ -75,6 +109,21 @@ class DataStore(metaclass=ABCMeta):
         """
 
 
+    @abstractmethod
+    async def refresh_conversations(
+        self,
+        conversations: Sequence[
+            Tuple[str, Tuple[Union[int, str], ...], ConversationDict]
+        ],
+        ) -> None:
+        """
+        Refresh several conversations at once.
+
+        :param conversations: (name, key, local_data) for each conversation,
+                as for :meth:`refresh_conversation`
+        """
+
+
     @abstractmethod
     async def update_conversation(self,
             name: str,
@@ -85,6 +134,39 @@ class DataStore(metaclass=ABCMeta):
         """
 
 
+    @abstractmethod
+    async def watch(self,
+            data: Mapping[
+                Literal['user', 'chat', 'bot'], MutableMapping[int, dict]
+            ],
+            conversations: Mapping[str, ConversationDict] | None = None
+            ) -> bool:
+        """
+        Start pushing changes made by other processes into the in-memory data.
+
+        :param data: The in-memory entries by id, for each data type
+        :param conversations: The states of each persistent ConversationHandler by name
+
+        Returns False if the data store can not watch for changes, in which case the
+        data must still be refreshed before use.
+        """
+
+
+    @abstractmethod
+    async def get_callback_data(self) -> CallbackData | None:
+        """
+        Return the stored callback data of ``telegram.ext.CallbackDataCache``,
+        or None if there is none.
+        """
+
+
+    @abstractmethod
+    async def update_callback_data(self, data: CallbackData) -> None:
+        """
+        Store the current callback data of ``telegram.ext.CallbackDataCache``.
+        """
+
+
     @abstractmethod
     async def flush(self) -> None:
         """
@@ -0,0 +1,239 @@
+from dataclasses import dataclass, field
+from typing import (
+    Any,
+    Callable,
+    Literal
+    )
+
+import functools
+import pickle
+import json
+import zlib
+
+
+
+# Fields of a document stored as a blob.
+CODEC_FIELD = '_codec'
+BLOB_FIELD = '_blob'
+
+
+Serializer = Literal['pickle', 'msgpack', 'json']
+Compressor = Literal['zlib', 'zstd', 'lz4']
+
+
+_INSTALL_HINTS = {
+    'msgpack': 'pip install msgpack',
+    'zstd': 'pip install zstandard',
+    'lz4': 'pip install lz4',
+}
+
+
+def _require(name: str) -> None:
+    """Raise ImportError if the optional package behind ``name`` is missing."""
+    try:
+        if name == 'msgpack':
+            import msgpack  # noqa: F401
+        elif name == 'zstd':
+            import zstandard  # noqa: F401
+        elif name == 'lz4':
+            import lz4.frame  # noqa: F401
+    except ImportError as error:  # Optional dependency
+        raise ImportError(
+            f'The {name!r} codec requires an optional package.'
+            f' Install it with: {_INSTALL_HINTS[name]}'
+        ) from error
+
+
+def _dumps(serializer: str, data: dict) -> bytes:
+    if serializer == 'pickle':
+        return pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+    elif serializer == 'msgpack':
+        import msgpack
+        return msgpack.packb(data, use_bin_type=True)
+    elif serializer == 'json':
+        return json.dumps(data, separators=(',', ':')).encode()
+    raise ValueError(f'Invalid serializer: {serializer}')
+
+
+def _loads(serializer: str, payload: bytes) -> dict:
+    if serializer == 'pickle':
+        return pickle.loads(payload)
+    elif serializer == 'msgpack':
+        import msgpack
+        return msgpack.unpackb(payload, raw=False, strict_map_key=False)
+    elif serializer == 'json':
+        return json.loads(payload)
+    raise ValueError(f'Invalid serializer: {serializer}')
+
+
+def _compress(compressor: str, payload: bytes, level: int | None) -> bytes:
+    if compressor == 'zlib':
+        return zlib.compress(payload, -1 if level is None else level)
+    elif compressor == 'zstd':
+        import zstandard
+        return zstandard.ZstdCompressor(level=3 if level is None else level).compress(payload)
+    elif compressor == 'lz4':
+        import lz4.frame
+        return lz4.frame.compress(payload, compression_level=0 if level is None else level)
+    raise ValueError(f'Invalid compressor: {compressor}')
+
+
+def _decompress(compressor: str, payload: bytes) -> bytes:
+    if compressor == 'zlib':
+        return zlib.decompress(payload)
+    elif compressor == 'zstd':
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(payload)
+    elif compressor == 'lz4':
+        import lz4.frame
+        return lz4.frame.decompress(payload)
+    raise ValueError(f'Invalid compressor: {compressor}')
+
+
+
+@dataclass
+class CodecStats:
+    # Documents written as a blob, and their size before and after compression.
+    encoded: int = 0
+    raw_bytes: int = 0
+    stored_bytes: int = 0
+    # Documents written as they are, below the threshold.
+    plain: int = 0
+    # Blobs read from the data store, and those actually decoded.
+    loaded: int = 0
+    decoded: int = 0
+
+
+    @property
+    def compression_ratio(self) -> float | None:
+        """Stored size of the blobs divided by their serialized size (lower is better)."""
+        if not self.raw_bytes:
+            return None
+        return self.stored_bytes / self.raw_bytes
+
+
+
+@dataclass(frozen=True)
+class ValueCodec:
+    """
+    How documents over a size threshold are stored.
+
+    Such a document is serialized, compressed and stored as a single binary field,
+    next to the name of the codec used, so documents written with another codec
+    (or none) stay readable.
+
+
+    :param serializer: 'pickle' (any picklable value), 'msgpack' (requires msgpack)
+            or 'json'. msgpack and json only support their own types, and json turns
+            keys into strings. Defaults to 'pickle'.
+    :param compressor: 'zlib', 'zstd' (requires zstandard), 'lz4' (requires lz4) or
+            None to store the serialized document as it is. Defaults to 'zlib'.
+    :param threshold: Documents whose encoded size is at least this number of bytes
+            are stored as a blob. Documents that the data store can not encode by
+            itself are always stored as a blob. Defaults to 16 KiB.
+    :param level: The compression level. If None, the compressor's default.
+    """
+    serializer: Serializer = 'pickle'
+    compressor: Compressor | None = 'zlib'
+    threshold: int = 16 * 1024
+    level: int | None = None
+    name: str = field(init=False)
+
+
+    def __post_init__(self) -> None:
+        if self.serializer not in ('pickle', 'msgpack', 'json'):
+            raise ValueError(f'Invalid serializer: {self.serializer}')
+        if self.compressor not in ('zlib', 'zstd', 'lz4', None):
+            raise ValueError(f'Invalid compressor: {self.compressor}')
+
+        _require(self.serializer)
+        if self.compressor is not None:
+            _require(self.compressor)
+
+        name = self.serializer
+        if self.compressor is not None:
+            name += '+' + self.compressor
+        object.__setattr__(self, 'name', name)
+
+
+    def encode(self, data: dict) -> tuple[str, bytes, int]:
+        """
+        Serialize and compress ``data``.
+
+        Returns the name of the codec actually used, the blob and its serialized size.
+        Compression is left out when it does not make the blob smaller.
+        """
+        payload = _dumps(self.serializer, data)
+        if self.compressor is None:
+            return self.serializer, payload, len(payload)
+
+        compressed = _compress(self.compressor, payload, self.level)
+        if len(compressed) >= len(payload):
+            return self.serializer, payload, len(payload)
+        return self.name, compressed, len(payload)
+
+
+    @staticmethod
+    def decode(name: str, blob: bytes) -> dict:
+        """Decode a blob written with the codec ``name``."""
+        serializer, _, compressor = name.partition('+')
+        if compressor:
+            blob = _decompress(compressor, blob)
+        return _loads(serializer, blob)
+
+
+
+class LazyDocument(dict):
+    """
+    A dict filled by ``loader`` the first time it is used.
+
+    Copying or pickling it returns a plain dict.
+    """
+
+    def __init__(self, loader: Callable[[], dict]) -> None:
+        super().__init__()
+        self._loader: Callable[[], dict] | None = loader
+
+
+    def loaded(self) -> bool:
+        return self._loader is None
+
+
+    def _load(self) -> None:
+        loader = self._loader
+        if loader is None:
+            return
+        self._loader = None
+        dict.update(self, loader())
+
+
+    def __reduce_ex__(self, protocol: Any) -> tuple:
+        self._load()
+        return dict, (dict.copy(self),)
+
+
+    def __repr__(self) -> str:
+        if self._loader is not None:
+            return f'{type(self).__name__}(<not loaded>)'
+        return dict.__repr__(self)
+
+
+
+def _loading(name: str) -> Callable:
+    method = getattr(dict, name)
+
+    @functools.wraps(method)
+    def wrapper(self: LazyDocument, *args, **kwargs):
+        self._load()
+        return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+for _name in (
+        '__getitem__', '__setitem__', '__delitem__', '__contains__', '__iter__',
+        '__reversed__', '__len__', '__eq__', '__ne__', '__or__', '__ror__', '__ior__',
+        '__sizeof__', 'get', 'keys', 'values', 'items', 'pop', 'popitem', 'setdefault',
+        'update', 'clear', 'copy'
+        ):
+    setattr(LazyDocument, _name, _loading(_name))
@@ -0,0 +1,69 @@
+import hashlib
+
+
+
+class Partitioning:
+    """
+    How partitioned (bot) data is split into documents: each top-level key is
+    stored in the partition its hash maps to.
+
+    A partition is addressed by its key, ``(data_id, partition)``, and stored in the
+    document with the _id ``{'bot': data_id, 'partition': partition}``.
+    """
+
+    def __init__(self, partitions: int) -> None:
+        self.partitions = partitions
+
+
+    @staticmethod
+    def doc_id(data_id: int, partition: int) -> dict:
+        """The _id of a partition of partitioned (bot) data."""
+        return {'bot': data_id, 'partition': partition}
+
+
+    @staticmethod
+    def data_id_of(doc_id: object) -> int:
+        """The data id of a partition, or of data stored as one document."""
+        return doc_id['bot'] if isinstance(doc_id, dict) else doc_id
+
+
+    def partition_of(self, key: object) -> int:
+        """The partition a top-level key of partitioned data is stored in."""
+        digest = hashlib.blake2b(repr(key).encode(), digest_size=8).digest()
+        return int.from_bytes(digest, 'big') % self.partitions
+
+
+    def keys(self, data_id: int) -> list[tuple[int, int]]:
+        return [
+            (data_id, partition)
+            for partition in range(self.partitions)
+        ]
+
+
+    def key_of(self, doc_id: object) -> tuple[int, int] | None:
+        """The key of the document ``doc_id``, or None if it is not a current partition."""
+        if (
+            not isinstance(doc_id, dict) or
+            doc_id.get('partition', self.partitions) >= self.partitions
+            ):
+            return None
+        return (doc_id['bot'], doc_id['partition'])
+
+
+    def split(self, data: dict) -> list[dict]:
+        """The data of every partition."""
+        partition_data: list[dict] = [{} for _ in range(self.partitions)]
+        for key, value in data.items():
+            partition_data[self.partition_of(key)][key] = value
+        return partition_data
+
+
+    def stale_filter(self, data_id: int) -> dict:
+        """
+        The filter of the documents of ``data_id`` that are not current partitions:
+        written with a greater number of partitions or as one document.
+        """
+        return {'$or': [
+            {'_id': data_id},
+            {'_id.bot': data_id, '_id.partition': {'$gte': self.partitions}}
+        ]}
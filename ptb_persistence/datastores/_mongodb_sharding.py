@@ -0,0 +1,52 @@
+from motor.motor_asyncio import AsyncIOMotorCollection
+from typing import Sequence
+import hashlib
+
+
+
+class ShardRouter:
+    """
+    Routes the documents of a data type to one of its collections, by rendezvous
+    hashing of their key.
+
+    Keys are routed by the full name of the collections, so the order they are given
+    in does not matter. Equal names (e.g. the same database on several clients) are
+    told apart by their order. Adding or removing a collection only moves the keys
+    routed to it.
+    """
+
+    def __init__(self, collections: Sequence[AsyncIOMotorCollection]) -> None:
+        self.collections = list(collections)
+
+        seen_names: dict[str, int] = {}
+        self._shard_names: list[bytes] = []
+        for collection in self.collections:
+            name = collection.full_name
+            seen_names[name] = seen_names.get(name, -1) + 1
+            if seen_names[name]:
+                name += f'#{seen_names[name]}'
+            self._shard_names.append(name.encode())
+
+
+    def shard_of(self, key: object) -> int:
+        """The index of the collection storing ``key``."""
+        if len(self.collections) == 1:
+            return 0
+
+        encoded_key = repr(key).encode()
+        scores = [
+            hashlib.blake2b(name + b'\0' + encoded_key, digest_size=8).digest()
+            for name in self._shard_names
+        ]
+        return scores.index(max(scores))
+
+
+    def collection_for(self, key: object) -> AsyncIOMotorCollection:
+        return self.collections[self.shard_of(key)]
+
+
+    def group_by_shard(self, keys: Sequence[object]) -> dict[int, list[object]]:
+        shards: dict[int, list[object]] = {}
+        for key in keys:
+            shards.setdefault(self.shard_of(key), []).append(key)
+        return shards
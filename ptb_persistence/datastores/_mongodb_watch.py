@@ -0,0 +1,80 @@
+from motor.motor_asyncio import AsyncIOMotorChangeStream, AsyncIOMotorCollection
+from typing import Awaitable, Callable
+from logging import Logger
+import asyncio
+import pymongo.errors
+
+
+
+# Errors after which a change stream can not be resumed from its resume token:
+# ChangeStreamFatalError, ChangeStreamHistoryLost and InvalidResumeToken.
+RESUME_FAILED_CODES = (280, 286, 260)
+# The $changeStream stage is only supported on replica sets.
+CHANGE_STREAMS_NOT_SUPPORTED = 40573
+
+# The changes to documents, leaving out those to the collection itself.
+CHANGE_PIPELINE = [
+    {'$match': {
+        'operationType': {'$in': ['insert', 'update', 'replace', 'delete']}
+    }}
+]
+
+
+async def follow_change_stream(
+        collection: AsyncIOMotorCollection,
+        open_change_stream: Callable[..., Awaitable[AsyncIOMotorChangeStream]],
+        apply_change: Callable[[dict], None],
+        reload: Callable[[], Awaitable[None]],
+        logger: Logger,
+        retry_delay: float
+        ) -> None:
+    """
+    Follow the change stream of a collection, resuming after the last seen change.
+
+    Whenever the stream is (re)opened without a resume token, i.e. at start, after
+    an invalidate event or when the server no longer has the history to resume,
+    the in-memory data is reloaded to catch up with what the stream did not report.
+    """
+    collection_name = collection.name
+    resume_token = None
+    while True:
+        try:
+            async with await open_change_stream(
+                    collection,
+                    pipeline=list(CHANGE_PIPELINE),
+                    full_document='updateLookup',
+                    resume_after=resume_token
+                    ) as stream:
+                if resume_token is None:
+                    await reload()
+
+                change: dict
+                async for change in stream:
+                    apply_change(change)
+                    resume_token = stream.resume_token
+
+            # The stream was invalidated (e.g. the collection was dropped).
+            resume_token = None
+
+        except asyncio.CancelledError:
+            raise
+        except pymongo.errors.OperationFailure as error:
+            if error.code == CHANGE_STREAMS_NOT_SUPPORTED:
+                logger.error(
+                    f'MongoDBDataStore: Can not watch {collection_name!r}:'
+                    ' change streams require a replica set or a sharded cluster.'
+                )
+                return
+            if error.code in RESUME_FAILED_CODES:
+                resume_token = None
+            logger.warning(
+                f'MongoDBDataStore: Change stream on {collection_name!r} failed: {error!r}.'
+                f' Reopening in {retry_delay} seconds.'
+            )
+            await asyncio.sleep(retry_delay)
+        except Exception:
+            logger.exception(
+                f'MongoDBDataStore: Change stream on {collection_name!r} failed.'
+                f' Reopening in {retry_delay} seconds.'
+            )
+            await asyncio.sleep(retry_delay)
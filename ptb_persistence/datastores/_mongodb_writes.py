@@ -0,0 +1,123 @@
+from typing import Literal, Tuple
+import pymongo
+import copy
+
+
+
+# A write is one of:
+#   ('replace', <document>)
+#   ('update', <update document with $set/$unset>)
+#   ('delete', None)
+Write = Tuple[Literal['replace', 'update', 'delete'], dict | None]
+
+
+def merge_writes(earlier: Write, later: Write) -> Write:
+    """Combine two writes to the same document into one equivalent write."""
+    later_kind, later_doc = later
+    if later_kind != 'update':
+        return later
+
+    set_fields: dict = later_doc.get('$set', {})
+    unset_fields: dict = later_doc.get('$unset', {})
+
+    earlier_kind, earlier_doc = earlier
+    if earlier_kind in ('replace', 'delete'):
+        document = dict(earlier_doc or {})
+        document.update(set_fields)
+        for key in unset_fields:
+            document.pop(key, None)
+        return ('replace', document)
+
+    merged_set = {
+        key: value
+        for key, value in earlier_doc.get('$set', {}).items()
+        if key not in unset_fields
+    }
+    merged_set.update(set_fields)
+    merged_unset = {
+        key: value
+        for key, value in earlier_doc.get('$unset', {}).items()
+        if key not in set_fields
+    }
+    merged_unset.update(unset_fields)
+
+    update = {}
+    if merged_set:
+        update['$set'] = merged_set
+    if merged_unset:
+        update['$unset'] = merged_unset
+    return ('update', update)
+
+
+def apply_write(document: dict | None, write: Write) -> dict | None:
+    """Return ``document`` as it will be once ``write`` is applied to it."""
+    kind, write_doc = write
+    if kind == 'delete':
+        return None
+    elif kind == 'replace':
+        return copy.deepcopy(write_doc)
+
+    document = dict(document or {})
+    document.update(copy.deepcopy(write_doc.get('$set', {})))
+    for key in write_doc.get('$unset', {}):
+        document.pop(key, None)
+    return document
+
+
+def to_operation(
+        doc_filter: dict,
+        write: Write
+        ) -> pymongo.ReplaceOne | pymongo.UpdateOne | pymongo.DeleteOne:
+    kind, document = write
+    if kind == 'replace':
+        return pymongo.ReplaceOne(doc_filter, document, upsert=True)
+    elif kind == 'update':
+        return pymongo.UpdateOne(doc_filter, document, upsert=True)
+    return pymongo.DeleteOne(doc_filter)
+
+
+
+class WriteQueue:
+    """
+    The writes of a data type waiting to be sent (write-behind), at most one per
+    document: a write to a document already in the queue is merged into it.
+    """
+
+    def __init__(self) -> None:
+        # {key: (filter, write)}, in the order they are to be sent.
+        self._pending: dict[object, tuple[dict, Write]] = {}
+
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+
+    def put(self, key: object, doc_filter: dict, write: Write) -> int:
+        """Queue a write, merging it with any pending write for the same key."""
+        pending = self._pending.get(key)
+        if pending is not None:
+            write = merge_writes(pending[1], write)
+        self._pending[key] = (doc_filter, write)
+        return len(self._pending)
+
+
+    def requeue(self, writes: list[tuple[object, dict, Write]]) -> None:
+        """Put back writes that could not be sent, before any newer ones."""
+        for key, doc_filter, write in writes:
+            pending = self._pending.get(key)
+            if pending is not None:
+                write = merge_writes(write, pending[1])
+            self._pending[key] = (doc_filter, write)
+
+
+    def take(self, limit: int) -> list[tuple[object, dict, Write]]:
+        writes = []
+        for key in list(self._pending)[:limit]:
+            doc_filter, write = self._pending.pop(key)
+            writes.append((key, doc_filter, write))
+        return writes
+
+
+    def get(self, key: object) -> Write | None:
+        pending = self._pending.get(key)
+        return pending[1] if pending is not None else None
@@ -1,5 +1,56 @@
 from ..abc import DataStore
+from .._types import CallbackData, ConversationDict
 from logging import Logger
+from typing import (
+    Literal,
+    Mapping,
+    MutableMapping,
+    Sequence,
+    Tuple,
+    Union
+    )
+from telegram.ext._utils.trackingdict import TrackingDict
+import asyncio
+
+
+def _set_conversation_state(
+        conversations: ConversationDict,
+        key: Tuple[Union[int, str], ...],
+        state: object | None
+        ) -> None:
+    """Set (or remove, if None) a state without marking it for the next persistence update."""
+    if isinstance(conversations, TrackingDict):
+        if state is None:
+            conversations.data.pop(key, None)
+        else:
+            conversations.update_no_track({key: state})
+    elif state is None:
+        conversations.pop(key, None)
+    else:
+        conversations[key] = state
+
+
+def _has_unsaved_state(
+        conversations: ConversationDict,
+        key: Tuple[Union[int, str], ...]
+        ) -> bool:
+    """Whether the state of ``key`` changed since PTB last passed it to ``update_conversation``."""
+    return (
+        isinstance(conversations, TrackingDict) and
+        key in conversations._write_access_keys
+    )
+
+
+def _remove_ended_conversation(
+        conversations: ConversationDict,
+        key: Tuple[Union[int, str], ...]
+        ) -> None:
+    """
+    Remove the local state of a conversation the data store does not hold (ended by
+    another worker, or never started), unless PTB has not saved it yet.
+    """
+    if not _has_unsaved_state(conversations, key):
+        _set_conversation_state(conversations, key, None)
 
 
 class BaseDataStore(DataStore):
@@ -14,4 +65,66 @@ class BaseDataStore(DataStore):
         
         self._logger = logger
         self._inited = True
-        
\ No newline at end of file
+        
+
+
+    def forget_data(self, data_type, data_id: int) -> None:
+        return
+
+
+    async def refresh_many(
+        self,
+        data: Sequence[
+            Tuple[Literal['user', 'chat', 'bot'], int, dict]
+        ],
+        conversations: Sequence[
+            Tuple[str, Tuple[Union[int, str], ...], ConversationDict]
+        ],
+        ) -> None:
+        refreshes = [
+            self.refresh_data(
+                data_type=data_type,
+                data_id=data_id,
+                local_data=local_data
+            )
+            for data_type, data_id, local_data in data
+        ]
+        if conversations:
+            refreshes.append(
+                self.refresh_conversations(
+                    conversations=conversations
+                )
+            )
+        # Run every refresh concurrently.
+        await asyncio.gather(*refreshes)
+
+
+    async def refresh_conversations(
+        self,
+        conversations: Sequence[
+            Tuple[str, Tuple[Union[int, str], ...], ConversationDict]
+        ],
+        ) -> None:
+        for name, key, local_data in conversations:
+            await self.refresh_conversation(
+                name=name,
+                key=key,
+                local_data=local_data
+            )
+
+
+    async def watch(self,
+            data: Mapping[
+                Literal['user', 'chat', 'bot'], MutableMapping[int, dict]
+            ],
+            conversations: Mapping[str, ConversationDict] | None = None
+            ) -> bool:
+        return False
+
+
+    async def get_callback_data(self) -> CallbackData | None:
+        return None
+
+
+    async def update_callback_data(self, data: CallbackData) -> None:
+        return
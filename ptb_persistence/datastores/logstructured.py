@@ -0,0 +1,909 @@
+from .base import BaseDataStore, _remove_ended_conversation
+from .._types import ConversationDict
+from ..instrumentation import log_method
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import (
+    Any,
+    Callable,
+    Iterator,
+    Literal,
+    Tuple,
+    Union
+    )
+
+from telegram.ext import PersistenceInput
+from logging import Logger
+import functools
+import asyncio
+import secrets
+import struct
+import pickle
+import json
+import mmap
+import zlib
+import os
+
+
+
+# Record: crc32, kind, key length, value length, key, value.
+# The crc covers everything after it.
+_RECORD_HEADER = struct.Struct('<IBII')
+# Hint entry: kind, key length, value offset, value length, record size, key.
+_HINT_ENTRY = struct.Struct('<BIQII')
+# Hint header: segment token, segment size covered by the hint.
+_HINT_HEADER = struct.Struct('<16sQ')
+
+# The first record of every segment. Its value is
+# {"token": <hex>, "supersedes": [<segment id>, ...]}.
+_KIND_SEGMENT = 0
+_KIND_PUT = 1
+_KIND_DELETE = 2
+
+_LOG_SUFFIX = '.log'
+_HINT_SUFFIX = '.hint'
+_TEMP_SUFFIX = '.compact'
+
+# (segment id, value offset, value length, record size)
+Location = Tuple[int, int, int, int]
+# 'user', 'chat', 'bot' or ('conversations', <name>)
+Namespace = Union[str, Tuple[str, str]]
+
+
+def _encode_key(namespace: Namespace, ident: object) -> bytes:
+    if isinstance(namespace, tuple):
+        key = [namespace[0], namespace[1], list(ident)]
+    else:
+        key = [namespace, ident]
+    return json.dumps(key, separators=(',', ':')).encode()
+
+
+def _decode_key(key: bytes) -> Tuple[Namespace, object]:
+    key = json.loads(key)
+    if key[0] == 'conversations':
+        return ('conversations', key[1]), tuple(key[2])
+    return key[0], key[1]
+
+
+def _encode_record(kind: int, key: bytes, value: bytes) -> bytes:
+    body = _RECORD_HEADER.pack(0, kind, len(key), len(value))[4:] + key + value
+    return struct.pack('<I', zlib.crc32(body)) + body
+
+
+def _iter_records(data: bytes | mmap.mmap, start: int = 0) -> Iterator[Tuple[int, int, bytes, int, int]]:
+    """
+    Yield (record offset, kind, key, value offset, value length) of the valid records.
+
+    Stops at the first incomplete or corrupted record, i.e. at a torn write.
+    """
+    offset = start
+    size = len(data)
+    while offset + _RECORD_HEADER.size <= size:
+        crc, kind, key_length, value_length = _RECORD_HEADER.unpack_from(data, offset)
+        end = offset + _RECORD_HEADER.size + key_length + value_length
+        if end > size or zlib.crc32(data[offset + 4:end]) != crc:
+            return
+        key_offset = offset + _RECORD_HEADER.size
+        yield (
+            offset,
+            kind,
+            bytes(data[key_offset:key_offset + key_length]),
+            key_offset + key_length,
+            value_length
+        )
+        offset = end
+
+
+def _segment_path(directory: str, segment_id: int, suffix: str) -> str:
+    return os.path.join(directory, f'{segment_id:010d}{suffix}')
+
+
+def _segment_header(supersedes: list[int]) -> Tuple[bytes, bytes]:
+    """Return the token and the first record of a new segment."""
+    token = secrets.token_bytes(16)
+    value = json.dumps({'token': token.hex(), 'supersedes': supersedes}).encode()
+    return token, _encode_record(_KIND_SEGMENT, b'', value)
+
+
+def _write_hint(path: str, token: bytes, size: int, entries: list[Tuple[int, bytes, int, int, int]]) -> None:
+    temp_path = path + _TEMP_SUFFIX
+    with open(temp_path, 'wb') as file:
+        file.write(_HINT_HEADER.pack(token, size))
+        for kind, key, value_offset, value_length, record_size in entries:
+            file.write(
+                _HINT_ENTRY.pack(kind, len(key), value_offset, value_length, record_size) + key
+            )
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+
+
+
+class _Segment:
+    """A log file, read with pread while it is appended to, then through a memory map."""
+
+    def __init__(self, directory: str, segment_id: int, size: int, token: bytes) -> None:
+        self.id = segment_id
+        self.path = _segment_path(directory, segment_id, _LOG_SUFFIX)
+        self.hint_path = _segment_path(directory, segment_id, _HINT_SUFFIX)
+        self.size = size
+        self.token = token
+        # Bytes of records that are no longer the latest for their key.
+        self.garbage = 0
+        # True while it is the active segment.
+        self.appending = False
+        self._file = None
+        self._mmap: mmap.mmap | None = None
+
+
+    def read(self, offset: int, length: int) -> bytes:
+        if self._file is None:
+            self._file = open(self.path, 'rb')
+        if self.appending:
+            # A map of a growing file would have to be remapped after every append.
+            return os.pread(self._file.fileno(), length, offset)
+        if self._mmap is None:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap[offset:offset + length]
+
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+
+@dataclass
+class _WriteBatch:
+    """Records waiting to be appended together, in order."""
+    future: asyncio.Future
+    records: list[Tuple[int, Namespace, object, bytes, bytes]] = field(default_factory=list)
+
+
+
+@dataclass
+class DataType:
+    store: bool = True
+    ignore_keys: list[str] = field(default_factory=list)
+
+
+    def exists(self) -> bool:
+        return self.store
+
+
+    def cleanup_local_data(self, data: dict) -> None:
+        for item in self.ignore_keys:
+            data.pop(item, None)
+
+
+
+class LogStructuredDataStore(BaseDataStore):
+
+    def __init__(self,
+            directory: str,
+            store_user_data: bool = True,
+            store_chat_data: bool = True,
+            store_bot_data: bool = True,
+            store_conversations: bool = True,
+            ignore_general_keys: list[str] = None,
+            ignore_user_keys: list[str] = None,
+            ignore_chat_keys: list[str] = None,
+            ignore_bot_keys: list[str] = None,
+            segment_size: int = 64 * 1024 * 1024,
+            compaction_threshold: float = 0.5,
+            compaction_min_size: int = 16 * 1024 * 1024,
+            fsync: bool = False,
+            ) -> None:
+        """
+        A data store that appends every write to a log in ``directory``.
+
+        An index in memory holds the location of the latest value of every key, and
+        values are read from memory-mapped log files. The log is split in segments;
+        when a segment is closed, a hint file with its index entries is written, so
+        that startup reads the hint files instead of the whole log.
+
+        Once enough of the closed segments is made of overwritten or deleted values,
+        they are compacted in a background thread into a single segment holding the
+        latest values only.
+
+
+        :param directory: Directory of the log files (created if missing)
+
+        :param store_user_data: If False, user data will not be persisted
+        :param store_chat_data: If False, chat data will not be persisted
+        :param store_bot_data: If False, bot data will not be persisted
+        :param store_conversations: If False, conversations will not be persisted
+
+        :param ignore_general_keys: A list of keys to not persist in the data store.
+                Ex: ['_cache', 'ignored-key'] (Will be applied to all)
+        :param ignore_user_keys: A list of keys to not persist in the user data store
+        :param ignore_chat_keys: A list of keys to not persist in the chat data store
+        :param ignore_bot_keys: A list of keys to not persist in the bot data store
+
+        :param segment_size: Size (in bytes) after which a new segment is started.
+                Defaults to 64 MiB.
+        :param compaction_threshold: Fraction of the closed segments that must be
+                garbage to start a compaction. Defaults to 0.5.
+        :param compaction_min_size: Total size (in bytes) the closed segments must
+                reach before they are compacted. Defaults to 16 MiB.
+        :param fsync: If True, every write is synced to disk before returning.
+                Otherwise, it is left to the OS. Defaults to False.
+        """
+
+        self._directory = directory
+
+        ignore_general_keys = ignore_general_keys or []
+        ignore_user_keys = ignore_user_keys or []
+        ignore_chat_keys = ignore_chat_keys or []
+        ignore_bot_keys = ignore_bot_keys or []
+
+        self._user_data = DataType(
+            store=store_user_data,
+            ignore_keys=ignore_general_keys + ignore_user_keys,
+        )
+
+        self._chat_data = DataType(
+            store=store_chat_data,
+            ignore_keys=ignore_general_keys + ignore_chat_keys,
+        )
+
+        self._bot_data = DataType(
+            store=store_bot_data,
+            ignore_keys=ignore_general_keys + ignore_bot_keys,
+        )
+
+        self._store_conversations = store_conversations
+
+        self._segment_size = segment_size
+        self._compaction_threshold = compaction_threshold
+        self._compaction_min_size = compaction_min_size
+        self._fsync = fsync
+
+        # Changed on the event loop only, once post_init is done.
+        self._index: dict[Namespace, dict[object, Location]] = {}
+        self._segments: dict[int, _Segment] = {}
+        self._active: _Segment | None = None
+
+        # Owned by the writer thread, which runs one batch at a time.
+        self._active_file = None
+        self._active_hints: list[Tuple[int, bytes, int, int, int]] = []
+
+        self._writer: ThreadPoolExecutor | None = None
+        self._compactor: ThreadPoolExecutor | None = None
+        self._write_batch: _WriteBatch | None = None
+        # The batch in the writer thread, that the next one waits for.
+        self._append_lock = asyncio.Lock()
+        self._write_tasks: set[asyncio.Task] = set()
+        self._compaction_task: asyncio.Task | None = None
+
+        super().__init__()
+
+
+    async def post_init(self, logger: Logger) -> None:
+        if self._inited:
+            return
+
+        self._logger = logger
+        self._writer = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='LogStructuredDataStore-writer'
+        )
+        self._compactor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='LogStructuredDataStore-compactor'
+        )
+
+        await self._run(self._writer, self._open)
+
+        await super().post_init(
+            logger=logger
+        )
+
+
+    async def _run(self, executor: ThreadPoolExecutor, function: Callable, *args: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(
+            executor, functools.partial(function, *args)
+        )
+
+
+    def _check_inited(self) -> None:
+        """Raise RuntimeError if not yet initialized."""
+        if not self._inited:
+            raise RuntimeError(
+                'The DataStore must be initialized before any use.'
+                ' Initialize it with the .post_init(...) method.'
+            )
+
+
+    # Startup (runs in the writer thread)
+
+    def _open(self) -> None:
+        os.makedirs(self._directory, exist_ok=True)
+
+        segment_ids = []
+        for name in os.listdir(self._directory):
+            if name.endswith(_TEMP_SUFFIX):
+                # Left over by an interrupted compaction.
+                os.remove(os.path.join(self._directory, name))
+            elif name.endswith(_LOG_SUFFIX):
+                segment_ids.append(int(name[:-len(_LOG_SUFFIX)]))
+        segment_ids.sort()
+
+        headers = {}
+        for segment_id in segment_ids:
+            headers[segment_id] = self._read_segment_header(segment_id)
+
+        # Segments replaced by a compaction that was interrupted before removing them.
+        superseded = {
+            superseded_id
+            for token, supersedes in headers.values()
+            for superseded_id in supersedes
+        }
+        for segment_id in segment_ids:
+            if segment_id in superseded:
+                self._remove_segment_files(segment_id)
+
+        for segment_id in segment_ids:
+            if segment_id not in superseded:
+                self._load_segment(segment_id, headers[segment_id][0])
+
+        next_id = segment_ids[-1] + 1 if segment_ids else 1
+        self._add_segment(self._start_segment(next_id))
+
+
+    def _read_segment_header(self, segment_id: int) -> Tuple[bytes | None, list[int]]:
+        path = _segment_path(self._directory, segment_id, _LOG_SUFFIX)
+        with open(path, 'rb') as file:
+            data = file.read(64 * 1024)
+        for _, kind, _, value_offset, value_length in _iter_records(data):
+            if kind == _KIND_SEGMENT:
+                header = json.loads(data[value_offset:value_offset + value_length])
+                return bytes.fromhex(header['token']), header['supersedes']
+            break
+        return None, []
+
+
+    def _remove_segment_files(self, segment_id: int) -> None:
+        for suffix in (_LOG_SUFFIX, _HINT_SUFFIX):
+            path = _segment_path(self._directory, segment_id, suffix)
+            if os.path.exists(path):
+                os.remove(path)
+
+
+    def _load_segment(self, segment_id: int, token: bytes | None) -> None:
+        path = _segment_path(self._directory, segment_id, _LOG_SUFFIX)
+        size = os.path.getsize(path)
+        segment = _Segment(self._directory, segment_id, size, token)
+        self._segments[segment_id] = segment
+
+        entries = self._read_hint(segment) if token is not None else None
+        if entries is None:
+            entries, valid_size = self._replay_segment(segment)
+            if valid_size < size:
+                self._logger.warning(
+                    f'LogStructuredDataStore: Truncating {path!r} after a torn write'
+                    f' ({size - valid_size} bytes).'
+                )
+                with open(path, 'r+b') as file:
+                    file.truncate(valid_size)
+                segment.size = valid_size
+            if token is not None:
+                _write_hint(segment.hint_path, token, segment.size, entries)
+
+        for kind, key, value_offset, value_length, record_size in entries:
+            self._index_record(segment, kind, key, value_offset, value_length, record_size)
+
+
+    def _read_hint(self, segment: _Segment) -> list[Tuple[int, bytes, int, int, int]] | None:
+        if not os.path.exists(segment.hint_path):
+            return None
+        with open(segment.hint_path, 'rb') as file:
+            data = file.read()
+        if len(data) < _HINT_HEADER.size:
+            return None
+        token, size = _HINT_HEADER.unpack_from(data, 0)
+        if token != segment.token or size != segment.size:
+            # Written for another (e.g. not yet compacted) version of the segment.
+            return None
+
+        entries = []
+        offset = _HINT_HEADER.size
+        while offset < len(data):
+            kind, key_length, value_offset, value_length, record_size = _HINT_ENTRY.unpack_from(data, offset)
+            offset += _HINT_ENTRY.size
+            entries.append((kind, data[offset:offset + key_length], value_offset, value_length, record_size))
+            offset += key_length
+        return entries
+
+
+    def _replay_segment(self, segment: _Segment) -> Tuple[list[Tuple[int, bytes, int, int, int]], int]:
+        entries = []
+        valid_size = 0
+        if segment.size == 0:
+            return entries, valid_size
+
+        with open(segment.path, 'rb') as file:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                for offset, kind, key, value_offset, value_length in _iter_records(data):
+                    record_size = value_offset + value_length - offset
+                    valid_size = offset + record_size
+                    if kind != _KIND_SEGMENT:
+                        entries.append((kind, key, value_offset, value_length, record_size))
+            finally:
+                data.close()
+        return entries, valid_size
+
+
+    def _index_record(self,
+            segment: _Segment,
+            kind: int,
+            key: bytes,
+            value_offset: int,
+            value_length: int,
+            record_size: int
+            ) -> None:
+        namespace, ident = _decode_key(key)
+        entries = self._index.setdefault(namespace, {})
+
+        previous = entries.pop(ident, None)
+        if previous is not None:
+            self._add_garbage(previous)
+
+        if kind == _KIND_PUT:
+            entries[ident] = (segment.id, value_offset, value_length, record_size)
+        else:
+            # Tombstones are only needed until the older segments are compacted.
+            segment.garbage += record_size
+
+
+    def _add_garbage(self, location: Location) -> None:
+        segment = self._segments.get(location[0])
+        if segment is not None:
+            segment.garbage += location[3]
+
+
+    def _start_segment(self, segment_id: int) -> _Segment:
+        """Create the file of a new active segment (runs in the writer thread)."""
+        token, header = _segment_header(supersedes=[])
+        path = _segment_path(self._directory, segment_id, _LOG_SUFFIX)
+        self._active_file = open(path, 'ab')
+        self._active_file.write(header)
+        self._active_file.flush()
+        self._active_hints = []
+
+        segment = _Segment(self._directory, segment_id, len(header), token)
+        segment.garbage = len(header)
+        return segment
+
+
+    def _add_segment(self, segment: _Segment) -> None:
+        """Make ``segment`` the active one."""
+        if self._active is not None:
+            self._active.appending = False
+        segment.appending = True
+        self._segments[segment.id] = segment
+        self._active = segment
+
+
+    def _close_active_segment(self, segment: _Segment) -> None:
+        """Write the hint file of the active segment and close it (runs in the writer thread)."""
+        self._active_file.flush()
+        os.fsync(self._active_file.fileno())
+        self._active_file.close()
+        self._active_file = None
+        _write_hint(
+            segment.hint_path,
+            segment.token,
+            segment.size,
+            self._active_hints
+        )
+
+
+    def _roll_over(self, segment: _Segment) -> _Segment:
+        """Close the full active segment and start the next one (runs in the writer thread)."""
+        self._close_active_segment(segment)
+        return self._start_segment(segment.id + 1)
+
+
+    # Writes
+
+    async def _write(self, kind: int, namespace: Namespace, ident: object, value: bytes) -> None:
+        """
+        Add a record to the current write batch and wait until it is appended.
+
+        The batch is appended once the calls made in the same event loop iteration
+        have added theirs.
+        """
+        batch = self._write_batch
+        if batch is None:
+            batch = self._write_batch = _WriteBatch(
+                future=asyncio.get_running_loop().create_future()
+            )
+            task = asyncio.create_task(self._send_batch(batch))
+            self._write_tasks.add(task)
+            task.add_done_callback(self._write_tasks.discard)
+
+        batch.records.append(
+            (kind, namespace, ident, _encode_key(namespace, ident), value)
+        )
+        await asyncio.shield(batch.future)
+
+
+    async def _send_batch(self, batch: _WriteBatch) -> None:
+        async with self._append_lock:
+            # Records written from now on go to the next batch.
+            self._write_batch = None
+            try:
+                if self._active.size >= self._segment_size:
+                    self._add_segment(
+                        await self._run(self._writer, self._roll_over, self._active)
+                    )
+                segment = self._active
+                locations, segment.size = await self._run(
+                    self._writer, self._append, segment, batch.records
+                )
+            except BaseException as error:
+                batch.future.set_exception(error)
+                # Retrieved here in case all callers were cancelled.
+                batch.future.exception()
+                if not isinstance(error, Exception):
+                    raise
+                return
+
+        for (kind, namespace, ident, _, _), location in zip(batch.records, locations):
+            entries = self._index.setdefault(namespace, {})
+            previous = entries.pop(ident, None)
+            if previous is not None:
+                self._add_garbage(previous)
+            if kind == _KIND_PUT:
+                entries[ident] = location
+            else:
+                segment.garbage += location[3]
+
+        batch.future.set_result(None)
+        self._maybe_compact()
+
+
+    def _append(self,
+            segment: _Segment,
+            records: list[Tuple[int, Namespace, object, bytes, bytes]]
+            ) -> Tuple[list[Location], int]:
+        """
+        Append the records to the active segment (runs in the writer thread).
+        Returns their locations and the new size of the segment.
+        """
+        chunks = []
+        locations = []
+        offset = segment.size
+        for kind, _, _, key, value in records:
+            record = _encode_record(kind, key, value)
+            value_offset = offset + _RECORD_HEADER.size + len(key)
+            chunks.append(record)
+            locations.append((segment.id, value_offset, len(value), len(record)))
+            self._active_hints.append((kind, key, value_offset, len(value), len(record)))
+            offset += len(record)
+
+        self._active_file.write(b''.join(chunks))
+        self._active_file.flush()
+        if self._fsync:
+            os.fsync(self._active_file.fileno())
+        return locations, offset
+
+
+    # Compaction
+
+    def _maybe_compact(self) -> None:
+        if self._compaction_task is not None:
+            return
+
+        closed = [
+            segment for segment in self._segments.values()
+            if segment is not self._active
+        ]
+        total = sum(segment.size for segment in closed)
+        garbage = sum(segment.garbage for segment in closed)
+        if (
+            total < self._compaction_min_size or
+            garbage < total * self._compaction_threshold
+            ):
+            return
+
+        self._compaction_task = asyncio.create_task(
+            self._compact(sorted(segment.id for segment in closed))
+        )
+
+
+    async def _compact(self, segment_ids: list[int]) -> None:
+        """Rewrite the latest values of the closed segments into the last one of them."""
+        try:
+            ids = set(segment_ids)
+            live = [
+                (namespace, ident, location)
+                for namespace, entries in self._index.items()
+                for ident, location in list(entries.items())
+                if location[0] in ids
+            ]
+            target_id = segment_ids[-1]
+
+            token, new_locations = await self._run(
+                self._compactor, self._write_compacted, segment_ids, live
+            )
+
+            # Commit point: the compacted segment replaces the last one and, through
+            # its header, supersedes the others until they are removed.
+            os.replace(
+                _segment_path(self._directory, target_id, _LOG_SUFFIX + _TEMP_SUFFIX),
+                _segment_path(self._directory, target_id, _LOG_SUFFIX)
+            )
+            os.replace(
+                _segment_path(self._directory, target_id, _HINT_SUFFIX + _TEMP_SUFFIX),
+                _segment_path(self._directory, target_id, _HINT_SUFFIX)
+            )
+            for segment_id in segment_ids:
+                # Open maps keep the replaced files readable until closed.
+                self._segments.pop(segment_id).close()
+            for segment_id in segment_ids[:-1]:
+                self._remove_segment_files(segment_id)
+
+            size = os.path.getsize(_segment_path(self._directory, target_id, _LOG_SUFFIX))
+            segment = _Segment(self._directory, target_id, size, token)
+            segment.garbage = size - sum(location[3] for location in new_locations)
+            self._segments[target_id] = segment
+
+            for (namespace, ident, location), new_location in zip(live, new_locations):
+                entries = self._index.get(namespace, {})
+                if entries.get(ident) == location:
+                    entries[ident] = new_location
+                else:
+                    # Written again or dropped while compacting.
+                    segment.garbage += new_location[3]
+
+            self._logger.info(
+                f'LogStructuredDataStore: Compacted segments {segment_ids!r} into {size} bytes'
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self._logger.exception(
+                'LogStructuredDataStore: Compaction failed'
+            )
+        finally:
+            self._compaction_task = None
+
+
+    def _write_compacted(self,
+            segment_ids: list[int],
+            live: list[Tuple[Namespace, object, Location]]
+            ) -> Tuple[bytes, list[Location]]:
+        """Write the live records to temporary files (runs in the compaction thread)."""
+        target_id = segment_ids[-1]
+        token, header = _segment_header(supersedes=segment_ids[:-1])
+
+        sources = {
+            segment_id: open(_segment_path(self._directory, segment_id, _LOG_SUFFIX), 'rb')
+            for segment_id in segment_ids
+        }
+        locations = []
+        hints = []
+        try:
+            path = _segment_path(self._directory, target_id, _LOG_SUFFIX + _TEMP_SUFFIX)
+            with open(path, 'wb') as file:
+                file.write(header)
+                offset = len(header)
+                for namespace, ident, (segment_id, value_offset, value_length, record_size) in live:
+                    record_offset = value_offset + value_length - record_size
+                    record = os.pread(sources[segment_id].fileno(), record_size, record_offset)
+                    file.write(record)
+
+                    key_length = record_size - _RECORD_HEADER.size - value_length
+                    key = record[_RECORD_HEADER.size:_RECORD_HEADER.size + key_length]
+                    new_value_offset = offset + _RECORD_HEADER.size + key_length
+                    locations.append((target_id, new_value_offset, value_length, record_size))
+                    hints.append((_KIND_PUT, key, new_value_offset, value_length, record_size))
+                    offset += record_size
+
+                file.flush()
+                os.fsync(file.fileno())
+        finally:
+            for source in sources.values():
+                source.close()
+
+        _write_hint(
+            _segment_path(self._directory, target_id, _HINT_SUFFIX + _TEMP_SUFFIX),
+            token, offset, hints
+        )
+        return token, locations
+
+
+    # Reads
+
+    def _read(self, location: Location) -> object:
+        segment_id, value_offset, value_length, _ = location
+        return pickle.loads(
+            self._segments[segment_id].read(value_offset, value_length)
+        )
+
+
+    @log_method
+    async def get_data(self, data_type, data_id: int | None = None) -> dict:
+        self._check_inited()
+
+        data: dict = {}
+        data_type_name = data_type
+        data_type = self._get_data_type(data_type)
+        if not data_type.exists():
+            return data
+
+        entries = self._index.get(data_type_name, {})
+        if data_id is not None:
+            location = entries.get(data_id)
+            if location is not None:
+                data[data_id] = self._read(location)
+            return data
+
+        for count, data_id in enumerate(list(entries)):
+            # The location is looked up again, a compaction may have moved it.
+            location = entries.get(data_id)
+            if location is not None:
+                data[data_id] = self._read(location)
+            if count % 1000 == 999:
+                # Let other tasks run while loading a lot of data.
+                await asyncio.sleep(0)
+        return data
+
+
+    @log_method
+    async def update_data(self, data_type, data_id: int, local_data: dict) -> None:
+        self._check_inited()
+
+        data_type_name = data_type
+        data_type = self._get_data_type(data_type)
+        if not data_type.exists():
+            return
+
+        local_data = dict(local_data)
+        data_type.cleanup_local_data(local_data)
+
+        await self._write(
+            _KIND_PUT, data_type_name, data_id,
+            pickle.dumps(local_data, protocol=pickle.HIGHEST_PROTOCOL)
+        )
+
+
+    @log_method
+    async def refresh_data(self, data_type, data_id: int, local_data: dict) -> None:
+        self._check_inited()
+
+        data_type_name = data_type
+        if not self._get_data_type(data_type).exists():
+            return
+
+        location = self._index.get(data_type_name, {}).get(data_id)
+        if location is None: return
+
+        # Synchronize local data object with current data in the log.
+        local_data.update(
+            self._read(location)
+        )
+
+
+    @log_method
+    async def drop_data(self, data_type, data_id: int) -> None:
+        self._check_inited()
+
+        data_type_name = data_type
+        if not self._get_data_type(data_type).exists():
+            return
+
+        await self._write(_KIND_DELETE, data_type_name, data_id, b'')
+
+
+    @log_method
+    async def get_conversations(self, name: str) -> dict:
+        self._check_inited()
+
+        if not self._store_conversations:
+            return {}
+
+        return {
+            key: self._read(location)
+            for key, location in self._index.get(('conversations', name), {}).items()
+        }
+
+
+    @log_method
+    async def refresh_conversation(
+        self,
+        name: str,
+        key: Tuple[Union[int, str], ...],
+        local_data: ConversationDict
+        ) -> None:
+        self._check_inited()
+
+        if not self._store_conversations:
+            return
+
+        location = self._index.get(('conversations', name), {}).get(tuple(key))
+        if location is None:
+            _remove_ended_conversation(local_data, key)
+            return
+
+        # Synchronize local data object with current data in the log.
+        local_data.update(
+            {key: self._read(location)}
+        )
+
+
+    @log_method
+    async def update_conversation(self,
+            name: str,
+            key: Tuple[Union[int, str], ...],
+            local_state: object | None
+            ) -> None:
+        self._check_inited()
+
+        if not self._store_conversations:
+            return
+
+        namespace = ('conversations', name)
+        key = tuple(key)
+        if local_state is None:
+            # Remove unnecessary data from the index.
+            await self._write(_KIND_DELETE, namespace, key, b'')
+        else:
+            await self._write(
+                _KIND_PUT, namespace, key,
+                pickle.dumps(local_state, protocol=pickle.HIGHEST_PROTOCOL)
+            )
+
+
+    @log_method
+    async def flush(self) -> None:
+        if not self._inited:
+            return
+
+        if self._write_tasks:
+            await asyncio.gather(*self._write_tasks, return_exceptions=True)
+        if self._compaction_task is not None:
+            await asyncio.gather(self._compaction_task, return_exceptions=True)
+
+        await self._run(self._writer, self._close_active_segment, self._active)
+        for segment in self._segments.values():
+            segment.close()
+        self._segments = {}
+        self._index = {}
+        self._active = None
+
+        self._writer.shutdown(wait=False)
+        self._compactor.shutdown(wait=False)
+        self._inited = False
+
+
+    def build_persistence_input(self) -> PersistenceInput:
+        persistence_input = PersistenceInput(
+            bot_data=self._bot_data.exists(),
+            chat_data=self._chat_data.exists(),
+            user_data=self._user_data.exists(),
+            callback_data=False
+        )
+        return persistence_input
+
+
+    def _get_data_type(self,
+            data_type: Literal['user', 'chat', 'bot']
+            ) -> DataType:
+
+        if data_type == 'user':
+            return self._user_data
+
+        elif data_type == 'chat':
+            return self._chat_data
+
+        elif data_type == 'bot':
+            return self._bot_data
+
+        raise ValueError(f'Invalid Data Type: {data_type}')
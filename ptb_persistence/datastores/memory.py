@@ -0,0 +1,312 @@
+from .base import BaseDataStore, _remove_ended_conversation
+from .._types import CallbackData, ConversationDict
+from ..instrumentation import log_method
+
+from dataclasses import dataclass, field
+from typing import (
+    Literal,
+    Tuple,
+    Union
+    )
+
+from telegram.ext import PersistenceInput
+from logging import Logger
+import asyncio
+import copy
+
+
+
+@dataclass
+class MemoryStorage:
+    """
+    The stored data. Share one instance between several MemoryDataStore to
+    simulate workers using the same database.
+    """
+    user_data: dict[int, dict] = field(default_factory=dict)
+    chat_data: dict[int, dict] = field(default_factory=dict)
+    bot_data: dict[int, dict] = field(default_factory=dict)
+    conversations: dict[str, dict[Tuple[Union[int, str], ...], object]] = field(default_factory=dict)
+    callback_data: CallbackData | None = None
+
+
+
+@dataclass
+class DataType:
+    documents: dict[int, dict]
+    store: bool = True
+    ignore_keys: list[str] = field(default_factory=list)
+
+
+    def exists(self) -> bool:
+        return self.store
+
+
+    def cleanup_local_data(self, data: dict) -> None:
+        for item in self.ignore_keys:
+            data.pop(item, None)
+
+
+
+class MemoryDataStore(BaseDataStore):
+
+    def __init__(self,
+            storage: MemoryStorage | None = None,
+            store_user_data: bool = True,
+            store_chat_data: bool = True,
+            store_bot_data: bool = True,
+            store_conversations: bool = True,
+            store_callback_data: bool = False,
+            ignore_general_keys: list[str] = None,
+            ignore_user_keys: list[str] = None,
+            ignore_chat_keys: list[str] = None,
+            ignore_bot_keys: list[str] = None,
+            latency: float = 0.0,
+            ) -> None:
+        """
+        A data store that keeps the data in the memory of the process.
+
+        Data is copied in and out as with a database, so it behaves like the other data
+        stores. Useful for tests and as a baseline when measuring the overhead of the
+        persistence, apart from the network.
+
+
+        :param storage: Where the data is kept. Pass the same instance to several
+                data stores to share the data. If None, a new one is used.
+
+        :param store_user_data: If False, user data will not be persisted
+        :param store_chat_data: If False, chat data will not be persisted
+        :param store_bot_data: If False, bot data will not be persisted
+        :param store_conversations: If False, conversations will not be persisted
+        :param store_callback_data: If True, the data of ``arbitrary_callback_data``
+                is persisted. Defaults to False, like PTB.
+
+        :param ignore_general_keys: A list of keys to not persist in the data store.
+                Ex: ['_cache', 'ignored-key'] (Will be applied to all)
+        :param ignore_user_keys: A list of keys to not persist in the user data store
+        :param ignore_chat_keys: A list of keys to not persist in the chat data store
+        :param ignore_bot_keys: A list of keys to not persist in the bot data store
+
+        :param latency: Time (in seconds) every call waits before accessing the data,
+                to simulate a round trip to a database. Defaults to 0.
+        """
+
+        self._storage = storage or MemoryStorage()
+
+        ignore_general_keys = ignore_general_keys or []
+        ignore_user_keys = ignore_user_keys or []
+        ignore_chat_keys = ignore_chat_keys or []
+        ignore_bot_keys = ignore_bot_keys or []
+
+        self._user_data = DataType(
+            documents=self._storage.user_data,
+            store=store_user_data,
+            ignore_keys=ignore_general_keys + ignore_user_keys,
+        )
+
+        self._chat_data = DataType(
+            documents=self._storage.chat_data,
+            store=store_chat_data,
+            ignore_keys=ignore_general_keys + ignore_chat_keys,
+        )
+
+        self._bot_data = DataType(
+            documents=self._storage.bot_data,
+            store=store_bot_data,
+            ignore_keys=ignore_general_keys + ignore_bot_keys,
+        )
+
+        self._store_conversations = store_conversations
+        self._store_callback_data = store_callback_data
+        self._latency = latency
+
+        super().__init__()
+
+
+    def _check_inited(self) -> None:
+        """Raise RuntimeError if not yet initialized."""
+        if not self._inited:
+            raise RuntimeError(
+                'The DataStore must be initialized before any use.'
+                ' Initialize it with the .post_init(...) method.'
+            )
+
+
+    async def _round_trip(self) -> None:
+        if self._latency > 0:
+            await asyncio.sleep(self._latency)
+
+
+    @log_method
+    async def get_data(self, data_type, data_id: int | None = None) -> dict:
+        self._check_inited()
+
+        data_type = self._get_data_type(data_type)
+        if not data_type.exists():
+            return {}
+
+        await self._round_trip()
+
+        if data_id is not None:
+            if data_id not in data_type.documents:
+                return {}
+            return {data_id: copy.deepcopy(data_type.documents[data_id])}
+
+        return copy.deepcopy(data_type.documents)
+
+
+    @log_method
+    async def update_data(self, data_type, data_id: int, local_data: dict) -> None:
+        self._check_inited()
+
+        data_type = self._get_data_type(data_type)
+        if not data_type.exists():
+            return
+
+        local_data = copy.deepcopy(local_data)
+        data_type.cleanup_local_data(local_data)
+
+        await self._round_trip()
+        data_type.documents[data_id] = local_data
+
+
+    @log_method
+    async def refresh_data(self, data_type, data_id: int, local_data: dict) -> None:
+        self._check_inited()
+
+        data_type = self._get_data_type(data_type)
+        if not data_type.exists():
+            return
+
+        await self._round_trip()
+
+        db_data = data_type.documents.get(data_id)
+        if db_data is None: return
+
+        # Synchronize local data object with current data in storage.
+        local_data.update(
+            copy.deepcopy(db_data)
+        )
+
+
+    @log_method
+    async def drop_data(self, data_type, data_id: int) -> None:
+        self._check_inited()
+
+        data_type = self._get_data_type(data_type)
+        if not data_type.exists():
+            return
+
+        await self._round_trip()
+        data_type.documents.pop(data_id, None)
+
+
+    @log_method
+    async def get_conversations(self, name: str) -> dict:
+        self._check_inited()
+
+        if not self._store_conversations:
+            return {}
+
+        await self._round_trip()
+        return copy.deepcopy(
+            self._storage.conversations.get(name, {})
+        )
+
+
+    @log_method
+    async def refresh_conversation(
+        self,
+        name: str,
+        key: Tuple[Union[int, str], ...],
+        local_data: ConversationDict
+        ) -> None:
+        self._check_inited()
+
+        if not self._store_conversations:
+            return
+
+        await self._round_trip()
+
+        states = self._storage.conversations.get(name, {})
+        if key not in states:
+            _remove_ended_conversation(local_data, key)
+            return
+
+        # Synchronize local data object with current data in storage.
+        local_data.update(
+            {key: copy.deepcopy(states[key])}
+        )
+
+
+    @log_method
+    async def update_conversation(self,
+            name: str,
+            key: Tuple[Union[int, str], ...],
+            local_state: object | None
+            ) -> None:
+        self._check_inited()
+
+        if not self._store_conversations:
+            return
+
+        await self._round_trip()
+
+        states = self._storage.conversations.setdefault(name, {})
+        if local_state is None:
+            # Remove unnecessary data from the storage.
+            states.pop(key, None)
+        else:
+            states[key] = copy.deepcopy(local_state)
+
+
+    @log_method
+    async def get_callback_data(self) -> CallbackData | None:
+        self._check_inited()
+
+        if not self._store_callback_data:
+            return None
+
+        await self._round_trip()
+        return copy.deepcopy(self._storage.callback_data)
+
+
+    @log_method
+    async def update_callback_data(self, data: CallbackData) -> None:
+        self._check_inited()
+
+        if not self._store_callback_data:
+            return
+
+        await self._round_trip()
+        self._storage.callback_data = copy.deepcopy(data)
+
+
+    @log_method
+    async def flush(self) -> None:
+        return
+
+
+    def build_persistence_input(self) -> PersistenceInput:
+        persistence_input = PersistenceInput(
+            bot_data=self._bot_data.exists(),
+            chat_data=self._chat_data.exists(),
+            user_data=self._user_data.exists(),
+            callback_data=self._store_callback_data
+        )
+        return persistence_input
+
+
+    def _get_data_type(self,
+            data_type: Literal['user', 'chat', 'bot']
+            ) -> DataType:
+
+        if data_type == 'user':
+            return self._user_data
+
+        elif data_type == 'chat':
+            return self._chat_data
+
+        elif data_type == 'bot':
+            return self._bot_data
+
+        raise ValueError(f'Invalid Data Type: {data_type}')
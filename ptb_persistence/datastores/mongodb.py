@@ -1,59 +1,249 @@
-from .base import BaseDataStore
-from .._types import ConversationDict
+from .base import (
+    BaseDataStore,
+    _remove_ended_conversation,
+    _set_conversation_state
+    )
+from .._types import CallbackData, ConversationDict
+from ..instrumentation import _Truncated, log_method
+from ..codec import (
+    BLOB_FIELD,
+    CODEC_FIELD,
+    CodecStats,
+    LazyDocument,
+    ValueCodec
+    )
+from ._mongodb_partitions import Partitioning
+from ._mongodb_sharding import ShardRouter
+from ._mongodb_watch import follow_change_stream
+from ._mongodb_writes import Write, WriteQueue, apply_write, to_operation
 
 from motor.motor_asyncio import (
     AsyncIOMotorClient,
     AsyncIOMotorDatabase,
-    AsyncIOMotorCollection
+    AsyncIOMotorCollection,
+    AsyncIOMotorChangeStream,
+    AsyncIOMotorCommandCursor
 )
+from collections import deque
 from dataclasses import dataclass, field
 from typing import (
     Literal,
+    Mapping,
+    MutableMapping,
+    Sequence,
     Tuple,
     Union
     )
 
 from telegram.ext import PersistenceInput
+from telegram.ext._handlers.conversationhandler import PendingState
 from logging import Logger
 import functools
+import asyncio
+import hashlib
 import pymongo
+import time
+import pickle
+import bson
 import copy
 import ast
 
 
 
-def log_method(method):
-    method_name: str = method.__name__
+# Stamped with a new ObjectId on every write, so a refresh can skip documents
+# the local data already holds.
+_REVISION_FIELD = '_rev'
 
-    @functools.wraps(method)
-    async def wrapper(self: 'MongoDBDataStore', *args, **kwargs):
-        if self._logger:
-            self._logger.debug(
-                f'MongoDBDataStore: Calling {method_name!r} method. Args: {args=} Kwargs: {kwargs=}'
-                )
-            
-        result = await method(self, *args, **kwargs)
 
-        if self._logger:
-            self._logger.debug(
-                f'MongoDBDataStore: Result of {method_name!r} method: {result!r}'
-                )
-        return result
+# Queued writes failing with it are not sent again.
+_DUPLICATE_KEY_ERROR = 11000
+
+
+# _id prefixes of the two kinds of callback data documents.
+_KEYBOARD_PREFIX = 'keyboard:'
+_QUERY_PREFIX = 'query:'
+
+
+def _conversation_doc_id(name: str, key: Tuple[Union[int, str], ...]) -> dict:
+    """The _id of a conversation document. The key is stored as a BSON array."""
+    return {'name': name, 'key': list(key)}
+
+
+def _decode_conversation_key(key: list) -> Tuple[Union[int, str], ...]:
+    return tuple(key)
+
+
+def _fingerprint(value: object) -> bytes:
+    """Return a short digest of the BSON (or, for other values, pickle) encoding of ``value``."""
+    try:
+        encoded = bson.encode({'v': value})
+    except (bson.errors.InvalidDocument, OverflowError):
+        # Only stored by a codec.
+        encoded = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    return hashlib.blake2b(
+        encoded,
+        digest_size=16
+    ).digest()
+
 
-    return wrapper
+def _is_updatable_key(key: str) -> bool:
+    """Whether ``key`` can be used as a field name in $set/$unset."""
+    return bool(key) and '.' not in key and not key.startswith('$')
+
+
+def _query_shape(value: object) -> object:
+    """``value`` (a filter) with its values replaced by '?', keeping its fields and operators."""
+    if isinstance(value, Mapping):
+        return {key: _query_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)) and any(isinstance(item, Mapping) for item in value):
+        # e.g. the clauses of $or, or the _ids of partitions given to $in.
+        shapes = []
+        for item in value:
+            shape = _query_shape(item)
+            if shape not in shapes:
+                shapes.append(shape)
+        return shapes
+    return '?'
+
+
+def _plan_stages(plan: dict) -> str:
+    """The stages of a winning plan, e.g. 'FETCH > IXSCAN conversation_name'."""
+    # Plans of the slot-based engine wrap the classic plan.
+    plan = plan.get('queryPlan', plan)
+    stages = []
+    queue = [plan]
+    while queue:
+        stage = queue.pop(0)
+        name = stage.get('stage', '?')
+        if 'indexName' in stage:
+            name += f' {stage["indexName"]}'
+        stages.append(name)
+        if 'inputStage' in stage:
+            queue.append(stage['inputStage'])
+        queue.extend(stage.get('inputStages', []))
+    return ' > '.join(stages)
+
+
+def _bson_size(document: dict) -> int:
+    try:
+        return len(bson.encode(document))
+    except (bson.errors.InvalidDocument, OverflowError):
+        return 0
+
+
+
+@dataclass
+class SlowOperation:
+    """An operation of a MongoDBDataStore that took longer than its slow operation threshold."""
+    collection: str
+    operation: str
+    filter: dict | None
+    # time.time() when the operation started, and its duration in seconds.
+    started_at: float
+    duration: float
+    # Documents read or written, and their BSON size.
+    documents: int
+    document_bytes: int
+    # The filter with its values replaced by '?'.
+    shape: str | None = None
+    # The winning plan of the filter, explained for the first slow operation of its shape.
+    plan: dict | None = None
+
+
+
+class _OperationTimer:
+    """Times an operation of a MongoDBDataStore, and records it if it is slow."""
+
+    __slots__ = ('_store', '_collection', '_operation', '_doc_filter', '_documents', '_started_at', '_start')
+
+    def __init__(self,
+            store: 'MongoDBDataStore',
+            collection: AsyncIOMotorCollection,
+            operation: str,
+            doc_filter: dict | None
+            ) -> None:
+        self._store = store
+        self._collection = collection
+        self._operation = operation
+        self._doc_filter = doc_filter
+        self._documents: list[dict] = []
+
+
+    def add(self, document: dict | None) -> None:
+        """Count a document read or written by the operation."""
+        if document is not None:
+            self._documents.append(document)
+
+
+    def __enter__(self) -> '_OperationTimer':
+        self._started_at = time.time()
+        self._start = time.perf_counter()
+        return self
+
+
+    def __exit__(self, *exc_info) -> None:
+        duration = time.perf_counter() - self._start
+        if duration >= self._store._slow_operation_threshold:
+            self._store._record_slow_operation(
+                collection=self._collection,
+                operation=self._operation,
+                doc_filter=self._doc_filter,
+                started_at=self._started_at,
+                duration=duration,
+                documents=self._documents
+            )
+
+
+
+class _NullTimer:
+    """Used in place of an _OperationTimer when slow operations are not recorded."""
+
+    def add(self, document: dict | None) -> None:
+        return
+
+
+    def __enter__(self) -> '_NullTimer':
+        return self
+
+
+    def __exit__(self, *exc_info) -> None:
+        return
+
+
+_NULL_TIMER = _NullTimer()
 
 
 
 @dataclass
 class DataType:
     database: AsyncIOMotorDatabase
-    collection_input: AsyncIOMotorCollection | str | None = None
+    collection_input: (
+        AsyncIOMotorCollection | str | Sequence[AsyncIOMotorCollection | str] | None
+    ) = None
     collection: AsyncIOMotorCollection | None = None
+    collections: list[AsyncIOMotorCollection] = field(default_factory=list)
+    shards: ShardRouter | None = None
     ignore_keys: list[str] = field(default_factory=list)
+    indexes: list[pymongo.IndexModel] = field(default_factory=list)
+    absent_ttl: float | None = None
+    codec: ValueCodec | None = None
 
 
     def __post_init__(self) -> None:
         self._exist = self.collection_input is not None
+        # Fingerprints of the top-level keys last persisted per data id.
+        self._fingerprints: dict[int, dict[str, bytes]] = {}
+        # Write-behind queue.
+        self.writes = WriteQueue()
+        # Revision of the stored document that the local data is known to hold.
+        self._revisions: dict[object, bson.ObjectId] = {}
+        # Keys of documents known not to exist, with the time this expires.
+        # Ordered by expiry, since the ttl is the same for all of them.
+        self._absent: dict[object, float] = {}
+        # Data ids whose stored document is known to be a blob, which can not
+        # be updated field by field.
+        self._encoded: set[object] = set()
+        self.codec_stats = CodecStats()
 
 
     async def post_init(self) -> None:
@@ -62,10 +252,21 @@ class DataType:
         if self.collection_input is None:
             return
         
-        if not isinstance(self.collection_input, AsyncIOMotorCollection):
-            self.collection = self.database[self.collection_input]
+        if (
+            isinstance(self.collection_input, str) or
+            not isinstance(self.collection_input, Sequence)
+            ):
+            collection_inputs = [self.collection_input]
         else:
-            self.collection = self.collection_input
+            collection_inputs = list(self.collection_input)
+
+        self.collections = [
+            self.database[collection_input]
+            if isinstance(collection_input, str) else collection_input
+            for collection_input in collection_inputs
+        ]
+        self.collection = self.collections[0]
+        self.shards = ShardRouter(self.collections)
         
         self._exist = True
 
@@ -75,24 +276,235 @@ class DataType:
             data.pop(item, None)
 
 
+    def projection(self) -> dict | None:
+        """Projection excluding the ignored keys left over in stored documents."""
+        projection = {
+            key: False
+            for key in self.ignore_keys
+            if _is_updatable_key(key)
+        }
+        projection[_REVISION_FIELD] = False
+        return projection
+
+
     def exists(self) -> bool:
         return self._exist
 
 
+    def fingerprint(self, data: dict) -> dict[str, bytes]:
+        return {
+            key: _fingerprint(value)
+            for key, value in data.items()
+        }
+
+
+    def get_fingerprints(self, data_id: int) -> dict[str, bytes] | None:
+        return self._fingerprints.get(data_id)
+
+
+    def set_fingerprints(self, data_id: int, fingerprints: dict[str, bytes]) -> None:
+        self._fingerprints[data_id] = fingerprints
+
+
+    def forget_fingerprints(self, data_id: int) -> None:
+        self._fingerprints.pop(data_id, None)
+        self._encoded.discard(data_id)
+
+
+    def forget(self, data_id: int) -> None:
+        """Drop what is known about the document of ``data_id``, except its queued write."""
+        self.forget_fingerprints(data_id)
+        self.forget_revision(data_id)
+        self.forget_absent(data_id)
+
+
+    def set_encoded(self, data_id: int, encoded: bool) -> None:
+        if encoded:
+            self._encoded.add(data_id)
+        else:
+            self._encoded.discard(data_id)
+
+
+    def encode(self, data: dict) -> dict | None:
+        """
+        Return the blob document to store instead of ``data``, or None to store it as it is.
+
+        ``data`` is stored as a blob when it reaches the size threshold of the codec,
+        or when it can not be encoded as BSON.
+        """
+        if self.codec is None:
+            return None
+
+        try:
+            size = len(bson.encode(data))
+        except (bson.errors.InvalidDocument, OverflowError):
+            size = None
+
+        if size is not None and size < self.codec.threshold:
+            self.codec_stats.plain += 1
+            return None
+
+        name, blob, raw_size = self.codec.encode(data)
+        self.codec_stats.encoded += 1
+        self.codec_stats.raw_bytes += raw_size
+        self.codec_stats.stored_bytes += len(blob)
+        return {CODEC_FIELD: name, BLOB_FIELD: bson.Binary(blob)}
+
+
+    def decode(self, document: dict, lazy: bool = False) -> dict:
+        """
+        Return the data of a stored document, without its _id and revision.
+
+        With ``lazy``, a blob is only decoded when the returned dict is first used.
+        """
+        if BLOB_FIELD not in document:
+            return document
+
+        name = document.pop(CODEC_FIELD)
+        blob = document.pop(BLOB_FIELD)
+        # Fields set next to the blob by an update (of a process that did not know
+        # the document was replaced by a blob) are newer than the blob.
+        fields = document
+        self.codec_stats.loaded += 1
+
+        def load() -> dict:
+            self.codec_stats.decoded += 1
+            data = ValueCodec.decode(name, blob)
+            data.update(fields)
+            return data
+
+        if lazy:
+            return LazyDocument(load)
+        return load()
+
+
+    def get_revision(self, key: object) -> bson.ObjectId | None:
+        return self._revisions.get(key)
+
+
+    def set_revision(self, key: object, revision: bson.ObjectId | None) -> None:
+        if revision is None:
+            self._revisions.pop(key, None)
+        else:
+            self._revisions[key] = revision
+
+
+    def forget_revision(self, key: object) -> None:
+        self._revisions.pop(key, None)
+
+
+    def is_absent(self, key: object) -> bool:
+        expires = self._absent.get(key)
+        if expires is None:
+            return False
+        if expires <= time.monotonic():
+            del self._absent[key]
+            return False
+        return True
+
+
+    def mark_absent(self, key: object) -> None:
+        if self.absent_ttl is None:
+            return
+
+        now = time.monotonic()
+        # Drop the expired keys, which come first.
+        while self._absent:
+            oldest = next(iter(self._absent))
+            if self._absent[oldest] > now:
+                break
+            del self._absent[oldest]
+
+        self._absent.pop(key, None)
+        self._absent[key] = now + self.absent_ttl
+
+
+    def forget_absent(self, key: object) -> None:
+        self._absent.pop(key, None)
+
+
+    def clear_absent(self) -> None:
+        self._absent.clear()
+
+
+    def build_update(self,
+            data_id: int,
+            data: dict,
+            fingerprints: dict[str, bytes]
+            ) -> dict | None:
+        """
+        Build a minimal $set/$unset update from the last persisted fingerprints.
+
+        Returns None when a full replacement is required, either because nothing
+        is known about the persisted document or because a changed key cannot be
+        used as an update field name.
+        """
+        previous = self.get_fingerprints(data_id)
+        if previous is None or data_id in self._encoded:
+            return None
+
+        set_fields = {
+            key: data[key]
+            for key, digest in fingerprints.items()
+            if previous.get(key) != digest
+        }
+        unset_fields = {
+            key: ''
+            for key in previous
+            if key not in fingerprints
+        }
+
+        if not all(map(_is_updatable_key, [*set_fields, *unset_fields])):
+            return None
+
+        update = {}
+        if set_fields:
+            update['$set'] = copy.deepcopy(set_fields)
+        if unset_fields:
+            update['$unset'] = unset_fields
+        return update
+
+
+
 
 class MongoDBDataStore(BaseDataStore):
 
+    # The driver, replaced by subclasses built on another one.
+    _client_class: type = AsyncIOMotorClient
+    _database_class: type = AsyncIOMotorDatabase
+
     def __init__(self,
             client_or_uri: AsyncIOMotorClient | str,
             database: AsyncIOMotorDatabase | str,
-            collection_userdata: AsyncIOMotorCollection | str | None = None,
-            collection_chatdata: AsyncIOMotorCollection | str | None = None,
+            collection_userdata: (
+                AsyncIOMotorCollection | str | Sequence[AsyncIOMotorCollection | str] | None
+            ) = None,
+            collection_chatdata: (
+                AsyncIOMotorCollection | str | Sequence[AsyncIOMotorCollection | str] | None
+            ) = None,
             collection_botdata: AsyncIOMotorCollection | str | None = None,
             collection_conversationsdata: AsyncIOMotorCollection | str | None = None,
+            collection_callbackdata: AsyncIOMotorCollection | str | None = None,
             ignore_general_keys: list[str] = None,
             ignore_user_keys: list[str] = None,
             ignore_chat_keys: list[str] = None,
             ignore_bot_keys: list[str] = None,
+            write_behind: bool = False,
+            write_batch_size: int = 1000,
+            write_batch_delay: float = 1.0,
+            load_batch_size: int = 10000,
+            load_parallelism: int = 1,
+            ensure_indexes: bool = True,
+            watch_changes: bool = False,
+            watch_retry_delay: float = 5.0,
+            absent_cache_ttl: float | None = None,
+            callback_data_maxsize: int = 1024,
+            prune_callback_data: bool = False,
+            codec: ValueCodec | None = None,
+            bot_data_partitions: int | None = None,
+            slow_operation_threshold: float | None = None,
+            slow_operation_log_size: int = 100,
+            explain_slow_operations: bool = False,
             ) -> None:
         """
         A data store implementation for MongoDB.
@@ -102,37 +514,112 @@ class MongoDBDataStore(BaseDataStore):
         :param database: Database instance or name
 
         :param collection_userdata: Collection instance or name
-                (If None, data will not be persisted)
-        :param collection_chatdata: Collection instance or name
-                (If None, data will not be persisted)
+                (If None, data will not be persisted). A list of collections (names are
+                taken from ``database``, instances may belong to other databases or
+                clients) spreads the data over them, by a consistent hash of the user id.
+                Adding a collection to the list moves only the data routed to it, which
+                is not migrated: existing data must be moved by hand.
+        :param collection_chatdata: Collection instance or name, or a list of them as
+                for ``collection_userdata`` (If None, data will not be persisted)
         :param collection_botdata: Collection instance or name
                 (If None, data will not be persisted)
         :param collection_conversationsdata: Collection instance or name
                 (If None, data will not be persisted)
+        :param collection_callbackdata: Collection instance or name, for the data of
+                ``arbitrary_callback_data`` (If None, data will not be persisted)
 
         :param ignore_general_keys: A list of keys to not persist in the data store.
                 Ex: ['_cache', 'ignored-key'] (Will be applied to all)
         :param ignore_user_keys: A list of keys to not persist in the user data store
         :param ignore_chat_keys: A list of keys to not persist in the chat data store
         :param ignore_bot_keys: A list of keys to not persist in the bot data store
+
+        :param write_behind: If True, writes are queued per collection and sent in
+                the background as unordered bulk_write batches. Pending writes to the
+                same document are merged. Queued user, chat and bot data writes
+                replace the whole document. Defaults to False.
+        :param write_batch_size: Maximum number of operations per bulk_write.
+                Reaching it sends the queue without waiting. Defaults to 1000.
+        :param write_batch_delay: Maximum time (in seconds) a queued write waits
+                before being sent. Defaults to 1 second.
+
+        :param load_batch_size: Number of documents fetched per round trip when
+                loading a whole collection. Documents are streamed into the result,
+                so at most one batch of raw documents is held at once. Defaults to 10000.
+        :param load_parallelism: Number of concurrent range scans over _id used to
+                load a whole collection at startup. Defaults to 1 (a single scan).
+
+        :param ensure_indexes: If True, the indexes needed by the queries of this data
+                store are created in the background by post_init, if missing. Defaults to True.
+
+        :param watch_changes: If True, :meth:`watch` follows the change streams of the
+                configured collections and pushes changes made by other processes into
+                the in-memory data. Requires a replica set or sharded cluster. Defaults to False.
+        :param watch_retry_delay: Time (in seconds) to wait before reopening a change
+                stream that failed. Defaults to 5 seconds.
+
+        :param absent_cache_ttl: Time (in seconds) a document found missing (e.g. the
+                data of a first-time user) is remembered as missing, so refreshing it does
+                not query the database. Writes of this data store keep it up to date, and
+                so do the changes of other processes with ``watch_changes``. Without it, a
+                document created by another process is only seen once this time expires.
+                Defaults to None (disabled).
+
+        :param callback_data_maxsize: Maximum number of keyboards loaded from the callback
+                data collection, the most recently used first. Use the maxsize of the
+                bot's CallbackDataCache. Defaults to 1024.
+        :param prune_callback_data: If True, :meth:`get_callback_data` deletes the least
+                recently used keyboards over ``callback_data_maxsize`` and the callback
+                queries of the keyboards not loaded. With several workers sharing the
+                collection, a worker starting then deletes keyboards the others still
+                have in their cache, and buttons of these keyboards stop working once
+                those workers restart. Only enable it when a single worker uses the
+                collection. Defaults to False (old keyboards are kept).
+
+        :param codec: How large user, chat and bot data documents are stored, see
+                :class:`ptb_persistence.codec.ValueCodec`. Documents reaching its threshold
+                (or holding values BSON does not support) are stored compressed as a single
+                binary field, and documents loaded at startup are only decoded when used.
+                Statistics are returned by :meth:`get_codec_stats`. Defaults to None
+                (documents are stored as they are).
+
+        :param bot_data_partitions: If set, bot data is split into this number of
+                documents by the hash of its top-level keys, instead of being stored as
+                one document (limited to 16 MB). Only the partitions that changed are
+                written, and partitions are loaded concurrently. Bot data stored with
+                another number of partitions, or as one document, is moved on the next
+                update. Defaults to None (one document).
+
+        :param slow_operation_threshold: If set, the reads and writes of user, chat, bot,
+                conversation and callback data taking at least this time (in seconds) are
+                logged as warnings with their collection, filter, duration and the size of
+                the documents read or written, and kept for :meth:`get_slow_operations`.
+                Defaults to None (disabled).
+        :param slow_operation_log_size: Number of the most recent slow operations kept.
+                Defaults to 100.
+        :param explain_slow_operations: If True, the query plan of the filter of a slow
+                operation is fetched in the background with the explain command
+                ('queryPlanner' verbosity, the query is not run), once per collection and
+                filter shape (the filter with its values left out), and logged. Defaults to False.
         """
         
-        if not isinstance(client_or_uri, AsyncIOMotorClient):
-            self._client = AsyncIOMotorClient(client_or_uri)
+        if not isinstance(client_or_uri, self._client_class):
+            self._client = self._client_class(client_or_uri)
             self._close_client = True
         else:
             self._client = client_or_uri
             self._close_client = False
 
-        if not isinstance(database, AsyncIOMotorDatabase):
-            self._database = AsyncIOMotorDatabase(
-                self._client,
-                database
-                )
+        if not isinstance(database, self._database_class):
+            self._database = self._client[database]
         else:
             self._database = database
 
 
+        for collections in (collection_userdata, collection_chatdata):
+            if isinstance(collections, Sequence) and not isinstance(collections, str) and not collections:
+                raise ValueError('An empty list of collections was given.')
+
         ignore_general_keys = ignore_general_keys or []
         ignore_user_keys = ignore_user_keys or []
         ignore_chat_keys = ignore_chat_keys or []
@@ -142,26 +629,95 @@ class MongoDBDataStore(BaseDataStore):
             database=self._database,
             collection_input=collection_userdata,
             ignore_keys=ignore_general_keys + ignore_user_keys,
+            absent_ttl=absent_cache_ttl,
+            codec=codec,
         )
 
         self._chat_data = DataType(
             database=self._database,
             collection_input=collection_chatdata,
             ignore_keys=ignore_general_keys + ignore_chat_keys,
+            absent_ttl=absent_cache_ttl,
+            codec=codec,
         )
 
         self._bot_data = DataType(
             database=self._database,
             collection_input=collection_botdata,
             ignore_keys=ignore_general_keys + ignore_bot_keys,
+            absent_ttl=absent_cache_ttl,
+            codec=codec,
         )
 
         self._conversations_data = DataType(
             database=self._database,
             collection_input=collection_conversationsdata,
-            ignore_keys=[]
+            ignore_keys=[],
+            absent_ttl=absent_cache_ttl,
+            indexes=[
+                # get_conversations filters on the name prefix of the compound _id,
+                # which the _id index can not serve.
+                pymongo.IndexModel(
+                    [('_id.name', pymongo.ASCENDING)],
+                    name='conversation_name',
+                    background=True
+                )
+            ]
         )
 
+        self._callback_data = DataType(
+            database=self._database,
+            collection_input=collection_callbackdata,
+            ignore_keys=[],
+            indexes=[
+                # get_callback_data loads the most recently used keyboards.
+                pymongo.IndexModel(
+                    [('access_time', pymongo.DESCENDING)],
+                    name='callback_data_access_time',
+                    background=True
+                )
+            ]
+        )
+        self._callback_data_maxsize = callback_data_maxsize
+        self._prune_callback_data = prune_callback_data
+
+        self._partitioning = (
+            Partitioning(bot_data_partitions)
+            if bot_data_partitions is not None else None
+        )
+        # Filters of the documents of partitioned data that are not partitions
+        # anymore, per data id, removed once their keys are written again.
+        self._stale_partitions: dict[int, list[dict]] = {}
+        # Access time of every keyboard and keyboard of every query last persisted.
+        self._callback_keyboards: dict[str, float] = {}
+        self._callback_queries: dict[str, str] = {}
+
+        self._write_behind = write_behind
+        self._write_batch_size = write_batch_size
+        self._write_batch_delay = write_batch_delay
+        self._write_event: asyncio.Event | None = None
+        self._write_lock: asyncio.Lock | None = None
+        self._write_task: asyncio.Task | None = None
+
+        self._load_batch_size = load_batch_size
+        self._load_parallelism = load_parallelism
+
+        self._ensure_indexes = ensure_indexes
+        self._index_task: asyncio.Task | None = None
+
+        self._watch_changes = watch_changes
+        self._watch_retry_delay = watch_retry_delay
+        self._watch_tasks: list[asyncio.Task] = []
+
+        self._slow_operation_threshold = slow_operation_threshold
+        self._slow_operations: deque[SlowOperation] = deque(
+            maxlen=slow_operation_log_size
+        )
+        self._explain_slow_operations = explain_slow_operations
+        # Winning plans by (collection, filter shape), and the explains still running.
+        self._query_plans: dict[tuple[str, str], dict | None] = {}
+        self._explain_tasks: set[asyncio.Task] = set()
+
         super().__init__()
 
 
@@ -173,10 +729,47 @@ class MongoDBDataStore(BaseDataStore):
         await self._chat_data.post_init()
         await self._bot_data.post_init()
         await self._conversations_data.post_init()
+        await self._callback_data.post_init()
+
+        if self._write_behind:
+            self._write_event = asyncio.Event()
+            self._write_lock = asyncio.Lock()
+            self._write_task = asyncio.create_task(
+                self._write_behind_loop()
+            )
         
-        return await super().post_init(
+        await super().post_init(
             logger=logger
         )
+
+        if self._ensure_indexes:
+            self._index_task = asyncio.create_task(
+                self._create_indexes()
+            )
+
+
+    async def _create_indexes(self) -> None:
+        """Create the missing indexes of every configured data type."""
+        for data_type in self._data_types():
+            if not data_type.exists() or not data_type.indexes:
+                continue
+
+            for collection in data_type.collections:
+                collection_name = collection.name
+                index_names = [index.document['name'] for index in data_type.indexes]
+                self._logger.info(
+                    f'MongoDBDataStore: Ensuring indexes {index_names!r} on {collection_name!r}'
+                )
+                try:
+                    await collection.create_indexes(data_type.indexes)
+                except Exception:
+                    self._logger.exception(
+                        f'MongoDBDataStore: Failed to create indexes on {collection_name!r}'
+                    )
+                else:
+                    self._logger.info(
+                        f'MongoDBDataStore: Indexes {index_names!r} on {collection_name!r} are ready'
+                    )
     
     def _check_inited(self) -> None:
         """Raise RuntimeError if not yet initialized."""
@@ -197,19 +790,115 @@ class MongoDBDataStore(BaseDataStore):
         if not data_type.exists():
             return data
         
+        if self._is_partitioned(data_type):
+            if data_id is not None:
+                data_ids = [data_id]
+            else:
+                data_ids = await self._get_partitioned_ids(data_type)
+
+            for partitioned_id in data_ids:
+                partitioned_data = await self._load_partitions(
+                    data_type=data_type,
+                    data_id=partitioned_id
+                )
+                if partitioned_data is not None:
+                    data[partitioned_id] = partitioned_data
+            return data
 
-        cursor = data_type.collection.find(
-            filter=({'_id': data_id} if data_id is not None else {}),
-            batch_size=10000,
+        if data_id is not None:
+            scans = [(data_type.shards.collection_for(data_id), {'_id': data_id})]
+        else:
+            # Every collection of the data type is scanned at the same time.
+            scan_filters = await asyncio.gather(*map(
+                self._get_scan_filters, data_type.collections
+            ))
+            scans = [
+                (collection, doc_filter)
+                for collection, filters in zip(data_type.collections, scan_filters)
+                for doc_filter in filters
+            ]
+
+        await asyncio.gather(*(
+            self._load_data(
+                data=data,
+                data_type=data_type,
+                collection=collection,
+                doc_filter=doc_filter,
+                keep_revisions=data_id is None
+            )
+            for collection, doc_filter in scans
+        ))
+        
+        return data
+
+
+    async def _load_data(self,
+            data: dict,
+            data_type: DataType,
+            collection: AsyncIOMotorCollection,
+            doc_filter: dict,
+            keep_revisions: bool = False
+            ) -> None:
+        """
+        Stream the documents of ``collection`` matching ``doc_filter`` into ``data``.
+
+        With ``keep_revisions``, the revision of every document is remembered as held
+        by the local data, which is the case when the whole collection is loaded at startup.
+        """
+        projection = data_type.projection()
+        if keep_revisions:
+            projection.pop(_REVISION_FIELD)
+
+        cursor = collection.find(
+            filter=doc_filter,
+            projection=projection,
+            batch_size=self._load_batch_size,
             allow_disk_use=True
         )
 
         doc: dict
-        for doc in await cursor.to_list(length=None):
-            _id = doc.pop("_id")
-            data[_id] = doc
-        
-        return data
+        with self._timed(collection, 'find', doc_filter) as timer:
+            async for doc in cursor:
+                timer.add(doc)
+                _id = doc.pop("_id")
+                if keep_revisions:
+                    data_type.set_revision(_id, doc.pop(_REVISION_FIELD, None))
+                data[_id] = data_type.decode(doc, lazy=True)
+
+
+    async def _get_scan_filters(self, collection: AsyncIOMotorCollection) -> list[dict]:
+        """
+        Split a full collection scan into ``load_parallelism`` ranges of _id.
+
+        Ranges are only used when every _id is an integer, which is the case
+        for user and chat ids. Otherwise the collection is scanned at once.
+        """
+        if self._load_parallelism <= 1:
+            return [{}]
+
+        bounds = []
+        for direction in (pymongo.ASCENDING, pymongo.DESCENDING):
+            doc = await collection.find_one(
+                {},
+                projection={'_id': True},
+                sort=[('_id', direction)]
+            )
+            if doc is None:
+                return [{}]
+            bounds.append(doc['_id'])
+
+        lowest, highest = bounds
+        if not all(
+                isinstance(bound, int) and not isinstance(bound, bool)
+                for bound in bounds
+                ):
+            return [{}]
+
+        step = (highest - lowest) // self._load_parallelism + 1
+        return [
+            {'_id': {'$gte': start, '$lt': start + step}}
+            for start in range(lowest, highest + 1, step)
+        ]
 
 
     @log_method
@@ -220,15 +909,65 @@ class MongoDBDataStore(BaseDataStore):
         if not data_type.exists():
             return
         
-        local_data = copy.deepcopy(local_data)
+        local_data = dict(local_data)
         data_type.cleanup_local_data(local_data)
 
-        await data_type.collection.replace_one(
-            {"_id": data_id},
-            local_data,
-            upsert=True
+        if self._is_partitioned(data_type):
+            await self._update_partitions(
+                data_type=data_type,
+                data_id=data_id,
+                local_data=local_data
+            )
+            return
+
+        await self._update_document(
+            data_type=data_type,
+            key=data_id,
+            doc_filter={"_id": data_id},
+            local_data=local_data
+        )
+
+
+    async def _update_document(self,
+            data_type: DataType,
+            key: object,
+            doc_filter: dict,
+            local_data: dict
+            ) -> None:
+        """Write ``local_data`` to a document, if it changed since the last write."""
+        fingerprints = data_type.fingerprint(local_data)
+        if fingerprints == data_type.get_fingerprints(key):
+            # Nothing changed since the last write.
+            return
+
+        document = data_type.encode(local_data)
+        update = None
+        # Queued writes are sent later, without knowing the stored document: a diff
+        # upserted after another worker dropped it would only hold the changed keys.
+        if document is None and not self._write_behind:
+            update = data_type.build_update(
+                data_id=key,
+                data=local_data,
+                fingerprints=fingerprints
             )
 
+        if document is not None:
+            write = ('replace', document)
+        elif update is None:
+            write = ('replace', copy.deepcopy(local_data))
+        else:
+            write = ('update', update)
+
+        await self._write(
+            data_type=data_type,
+            key=key,
+            doc_filter=doc_filter,
+            write=write,
+            local_data=local_data
+        )
+        data_type.set_fingerprints(key, fingerprints)
+        data_type.set_encoded(key, document is not None)
+
 
     @log_method
     async def refresh_data(self, data_type, data_id: int, local_data: dict) -> None:
@@ -237,13 +976,66 @@ class MongoDBDataStore(BaseDataStore):
         data_type = self._get_data_type(data_type)
         if not data_type.exists():
             return
-        
-        db_data: dict | None = await data_type.collection.find_one(
-            {"_id": data_id},
-        )
+
+        if self._is_partitioned(data_type):
+            await self._refresh_partitions(
+                data_type=data_type,
+                data_id=data_id,
+                local_data=local_data
+            )
+            return
+
+        pending = data_type.writes.get(data_id)
+        if pending is None and data_type.is_absent(data_id):
+            return
+
+        doc_filter = {"_id": data_id}
+        revision = data_type.get_revision(data_id)
+        if revision is not None and local_data:
+            # Only fetch the document if it changed since local_data got it.
+            doc_filter[_REVISION_FIELD] = {'$ne': revision}
+
+        collection = data_type.shards.collection_for(data_id)
+        with self._timed(collection, 'find_one', doc_filter) as timer:
+            db_data: dict | None = await collection.find_one(
+                doc_filter,
+            )
+            timer.add(db_data)
+        if db_data is None and _REVISION_FIELD not in doc_filter:
+            data_type.mark_absent(data_id)
+
+        pending = data_type.writes.get(data_id)
+        if pending is not None:
+            # Queued writes are part of the stored data.
+            db_data = apply_write(db_data, pending)
+
         if db_data is None: return
 
+        self._merge_data(
+            data_type=data_type,
+            data_id=data_id,
+            local_data=local_data,
+            db_data=db_data
+        )
+
+
+    def _merge_data(self,
+            data_type: DataType,
+            data_id: int,
+            local_data: dict,
+            db_data: dict
+            ) -> None:
         db_data.pop('_id', None)
+        data_type.set_revision(
+            data_id, db_data.pop(_REVISION_FIELD, None)
+        )
+        encoded = BLOB_FIELD in db_data
+        db_data = data_type.decode(db_data)
+        data_type.cleanup_local_data(db_data)
+        data_type.set_fingerprints(
+            data_id, data_type.fingerprint(db_data)
+        )
+        data_type.set_encoded(data_id, encoded)
 
         # Synchronize local data object with current data in database.
         local_data.update(
@@ -259,8 +1051,204 @@ class MongoDBDataStore(BaseDataStore):
         if not data_type.exists():
             return
 
-        await data_type.collection.delete_one({
-            "_id": data_id}
+        if self._is_partitioned(data_type):
+            for key in self._partitioning.keys(data_id):
+                await self._write(
+                    data_type=data_type,
+                    key=key,
+                    doc_filter={'_id': Partitioning.doc_id(*key)},
+                    write=('delete', None)
+                )
+                data_type.forget_fingerprints(key)
+            await self._delete_stale_partitions(data_type, data_id)
+            return
+
+        await self._write(
+            data_type=data_type,
+            key=data_id,
+            doc_filter={"_id": data_id},
+            write=('delete', None)
+        )
+        data_type.forget_fingerprints(data_id)
+
+
+    def forget_data(self, data_type, data_id: int) -> None:
+        self._get_data_type(data_type).forget(data_id)
+
+
+    def _is_partitioned(self, data_type: DataType) -> bool:
+        return data_type is self._bot_data and self._partitioning is not None
+
+
+    async def _get_partitioned_ids(self, data_type: DataType) -> list[int]:
+        """The data ids stored in partitions or, from before, as one document."""
+        data_ids = []
+        cursor = data_type.collection.find({}, projection={'_id': True})
+        doc: dict
+        async for doc in cursor:
+            data_id = Partitioning.data_id_of(doc['_id'])
+            if data_id not in data_ids:
+                data_ids.append(data_id)
+        return data_ids
+
+
+    async def _load_partitions(self, data_type: DataType, data_id: int) -> dict | None:
+        """
+        Fetch every partition of ``data_id`` concurrently and merge them.
+
+        Documents written with a greater number of partitions or as one document
+        are merged too, and removed by the next update.
+        """
+        partitioning = self._partitioning
+
+        async def find_partition(partition: int) -> dict | None:
+            doc_filter = {'_id': partitioning.doc_id(data_id, partition)}
+            with self._timed(data_type.collection, 'find_one', doc_filter) as timer:
+                doc = await data_type.collection.find_one(doc_filter)
+                timer.add(doc)
+            return doc
+
+        async def find_stale() -> list[dict]:
+            doc_filter = partitioning.stale_filter(data_id)
+            with self._timed(data_type.collection, 'find', doc_filter) as timer:
+                docs = await data_type.collection.find(doc_filter).to_list(length=None)
+                for doc in docs:
+                    timer.add(doc)
+            return docs
+
+        *partition_docs, stale_docs = await asyncio.gather(
+            *map(find_partition, range(partitioning.partitions)),
+            find_stale()
+        )
+
+        if not any(partition_docs) and not stale_docs:
+            return None
+
+        # Keys in their own partition take precedence over keys found elsewhere.
+        stale_data = {}
+        for doc in stale_docs:
+            stale_data.update(
+                data_type.decode({
+                    key: value
+                    for key, value in doc.items()
+                    if key not in ('_id', _REVISION_FIELD)
+                })
+            )
+        misplaced_data = {}
+        data = {}
+        for partition, doc in enumerate(partition_docs):
+            key = (data_id, partition)
+            if doc is None:
+                data_type.set_revision(key, None)
+                data_type.set_fingerprints(key, {})
+                continue
+
+            partition_data = {}
+            self._merge_data(
+                data_type=data_type,
+                data_id=key,
+                local_data=partition_data,
+                db_data=doc
+            )
+            for data_key, value in partition_data.items():
+                if partitioning.partition_of(data_key) == partition:
+                    data[data_key] = value
+                else:
+                    # Moved by the diff of the next update.
+                    misplaced_data[data_key] = value
+
+        if stale_docs:
+            self._stale_partitions[data_id] = [
+                {'_id': doc['_id']} for doc in stale_docs
+            ]
+
+        data_type.cleanup_local_data(stale_data)
+        return {**stale_data, **misplaced_data, **data}
+
+
+    async def _update_partitions(self,
+            data_type: DataType,
+            data_id: int,
+            local_data: dict
+            ) -> None:
+        partition_data = self._partitioning.split(local_data)
+
+        await asyncio.gather(*(
+            self._update_document(
+                data_type=data_type,
+                key=(data_id, partition),
+                doc_filter={'_id': Partitioning.doc_id(data_id, partition)},
+                local_data=data
+            )
+            for partition, data in enumerate(partition_data)
+        ))
+        await self._delete_stale_partitions(data_type, data_id)
+
+
+    async def _delete_stale_partitions(self, data_type: DataType, data_id: int) -> None:
+        stale_filters = self._stale_partitions.pop(data_id, [])
+        for index, doc_filter in enumerate(stale_filters):
+            await self._write(
+                data_type=data_type,
+                key=('stale', data_id, index),
+                doc_filter=doc_filter,
+                write=('delete', None)
+            )
+
+
+    async def _refresh_partitions(self,
+            data_type: DataType,
+            data_id: int,
+            local_data: dict
+            ) -> None:
+        """Fetch in one query the partitions that changed since local_data got them."""
+        doc_ids = []
+        known_revisions = []
+        unknown_keys = []
+        for key in self._partitioning.keys(data_id):
+            if data_type.writes.get(key) is None and data_type.is_absent(key):
+                continue
+            doc_ids.append(Partitioning.doc_id(*key))
+            revision = data_type.get_revision(key)
+            if revision is not None and local_data:
+                known_revisions.append(revision)
+            else:
+                unknown_keys.append(key)
+
+        db_docs: dict[tuple[int, int], dict] = {}
+        if doc_ids:
+            doc_filter = {'_id': {'$in': doc_ids}}
+            if known_revisions:
+                # Only fetch the partitions that changed since local data got them.
+                doc_filter[_REVISION_FIELD] = {'$nin': known_revisions}
+
+            cursor = data_type.collection.find(doc_filter)
+            doc: dict
+            with self._timed(data_type.collection, 'find', doc_filter) as timer:
+                async for doc in cursor:
+                    timer.add(doc)
+                    db_docs[(data_id, doc['_id']['partition'])] = doc
+
+        for key in unknown_keys:
+            if key not in db_docs:
+                data_type.mark_absent(key)
+
+        for key in self._partitioning.keys(data_id):
+            db_data = db_docs.get(key)
+
+            pending = data_type.writes.get(key)
+            if pending is not None:
+                # Queued writes are part of the stored data.
+                db_data = apply_write(db_data, pending)
+
+            if db_data is None:
+                continue
+
+            self._merge_data(
+                data_type=data_type,
+                data_id=key,
+                local_data=local_data,
+                db_data=db_data
             )
 
 
@@ -275,19 +1263,87 @@ class MongoDBDataStore(BaseDataStore):
             return {}
 
 
+        doc_filter = {"_id.name": name}
         cursor = data_type.collection.find(
-            {"_id.name": name},
-            batch_size=10000,
+            doc_filter,
+            batch_size=self._load_batch_size,
             allow_disk_use=True
             )
         
         convs: dict[tuple[int | str], int] = {}
-        async for doc in cursor:
-            convs[ast.literal_eval(doc['_id']['key'])] = doc['state']
+        legacy_keys = 0
+        with self._timed(data_type.collection, 'find', doc_filter) as timer:
+            async for doc in cursor:
+                timer.add(doc)
+                key = doc['_id']['key']
+                if isinstance(key, str):
+                    legacy_keys += 1
+                    continue
+                convs[_decode_conversation_key(key)] = doc['state']
+
+        if legacy_keys:
+            self._logger.warning(
+                f'MongoDBDataStore: Skipped {legacy_keys} conversations of {name!r}'
+                ' stored with the old string key format.'
+                ' Run MongoDBDataStore.migrate_conversation_keys() to convert them.'
+            )
 
         return convs
 
 
+    async def migrate_conversation_keys(self) -> int:
+        """
+        Convert conversations stored with ``str(key)`` keys to the BSON array format.
+
+        Safe to run more than once and while workers are running. Returns the number
+        of converted documents. Also available as a command:
+
+            python -m ptb_persistence.utils.migrate conversation-keys \\
+                --uri mongodb://... --database <name> --collection <name>
+        """
+        self._check_inited()
+
+        data_type = self._get_data_type(
+            data_type='conversations'
+        )
+        if not data_type.exists():
+            return 0
+
+        cursor = data_type.collection.find(
+            {'_id.key': {'$not': {'$type': 'array'}}},
+            batch_size=self._load_batch_size
+        )
+
+        migrated = 0
+        operations = []
+        async for doc in cursor:
+            old_id = doc.pop('_id')
+            new_id = _conversation_doc_id(
+                name=old_id['name'],
+                key=ast.literal_eval(old_id['key'])
+            )
+            operations.append(
+                pymongo.UpdateOne(
+                    {'_id': new_id},
+                    {'$setOnInsert': doc},
+                    upsert=True
+                )
+            )
+            operations.append(
+                pymongo.DeleteOne({'_id': old_id})
+            )
+            migrated += 1
+
+            if len(operations) >= self._write_batch_size:
+                await data_type.collection.bulk_write(operations)
+                operations = []
+
+        if operations:
+            await data_type.collection.bulk_write(operations)
+
+        return migrated
+
+
     @log_method
     async def refresh_conversation(
         self,
@@ -303,19 +1359,111 @@ class MongoDBDataStore(BaseDataStore):
         if not data_type.exists():
             return
 
-        doc_id = {'name': name, 'key': str(key)}
-        db_data: dict | None = await data_type.collection.find_one(
-            {'_id': doc_id}
+        await self._refresh_conversations(
+            data_type=data_type,
+            conversations=[(name, key, local_data)]
         )
 
-        if db_data is None: return
 
-        # Synchronize local data object with current data in database.
-        local_data.update(
-            {key: db_data['state']}
+    @log_method
+    async def refresh_conversations(
+        self,
+        conversations: Sequence[
+            Tuple[str, Tuple[Union[int, str], ...], ConversationDict]
+        ],
+        ) -> None:
+        self._check_inited()
+
+        data_type = self._get_data_type(
+            data_type='conversations'
+        )
+        if not data_type.exists() or not conversations:
+            return
+
+        await self._refresh_conversations(
+            data_type=data_type,
+            conversations=conversations
         )
 
 
+    async def _refresh_conversations(
+        self,
+        data_type: DataType,
+        conversations: Sequence[
+            Tuple[str, Tuple[Union[int, str], ...], ConversationDict]
+        ],
+        ) -> None:
+        doc_ids = []
+        known_revisions = []
+        queried_keys = set()
+        for name, key, local_data in conversations:
+            if (
+                data_type.writes.get((name, key)) is None and
+                data_type.is_absent((name, key))
+                ):
+                continue
+            doc_ids.append(_conversation_doc_id(name, key))
+            queried_keys.add((name, tuple(key)))
+            revision = data_type.get_revision((name, key))
+            if revision is not None and key in local_data:
+                known_revisions.append(revision)
+
+        db_docs: dict[tuple, dict] = {}
+        if doc_ids:
+            doc_filter = {'_id': {'$in': doc_ids}}
+            pipeline = [{'$match': doc_filter}]
+            if known_revisions:
+                # Every document is returned, so that the ones deleted are known, but
+                # the state only of those that changed since local data got them.
+                pipeline.append({'$project': {
+                    _REVISION_FIELD: True,
+                    'state': {'$cond': [
+                        {'$in': [f'${_REVISION_FIELD}', known_revisions]},
+                        '$$REMOVE',
+                        '$state'
+                    ]}
+                }})
+
+            doc: dict
+            with self._timed(data_type.collection, 'aggregate', doc_filter) as timer:
+                cursor = await self._aggregate(data_type.collection, pipeline)
+                async for doc in cursor:
+                    timer.add(doc)
+                    doc_id = doc.pop('_id')
+                    db_docs[
+                        (doc_id['name'], _decode_conversation_key(doc_id['key']))
+                    ] = doc
+
+        for name, key, local_data in conversations:
+            if (name, tuple(key)) not in queried_keys:
+                continue
+            db_data = db_docs.get((name, tuple(key)))
+
+            pending = data_type.writes.get((name, key))
+            if pending is not None:
+                # Queued writes are part of the stored data.
+                db_data = apply_write(db_data, pending)
+
+            if db_data is None:
+                if pending is None:
+                    data_type.mark_absent((name, key))
+                data_type.set_revision((name, key), None)
+                _remove_ended_conversation(local_data, key)
+                continue
+
+            data_type.set_revision(
+                (name, key), db_data.get(_REVISION_FIELD)
+            )
+            if 'state' not in db_data:
+                # Unchanged since the last refresh.
+                continue
+
+            # Synchronize local data object with current data in database.
+            local_data.update(
+                {key: db_data['state']}
+            )
+
+
     @log_method
     async def update_conversation(self,
             name: str,
@@ -331,26 +1479,760 @@ class MongoDBDataStore(BaseDataStore):
             return
         
 
-        doc_id = {'name': name, 'key': str(key)}
+        doc_id = _conversation_doc_id(name, key)
         
         if local_state is None:
             # Remove unnecessary data from the document.
-            await data_type.collection.delete_one(
-                {'_id': doc_id}
+            write = ('delete', None)
+        else:
+            write = ('replace', {'state': local_state})
+
+        await self._write(
+            data_type=data_type,
+            key=(name, key),
+            doc_filter={'_id': doc_id},
+            write=write
+        )
+
+
+    @log_method
+    async def get_callback_data(self) -> CallbackData | None:
+        """
+        Load the ``callback_data_maxsize`` most recently used keyboards and their callback
+        queries. Nothing is deleted unless ``prune_callback_data`` is set: other workers
+        sharing the collection may still use the keyboards over the maxsize.
+        """
+        self._check_inited()
+
+        data_type = self._callback_data
+        if not data_type.exists():
+            return None
+
+        keyboards = []
+        doc_filter = {'_id': {'$regex': f'^{_KEYBOARD_PREFIX}'}}
+        cursor = data_type.collection.find(
+            doc_filter,
+            sort=[('access_time', pymongo.DESCENDING)],
+            limit=self._callback_data_maxsize
+        )
+        doc: dict
+        with self._timed(data_type.collection, 'find', doc_filter) as timer:
+            async for doc in cursor:
+                timer.add(doc)
+                keyboards.append((
+                    doc['_id'][len(_KEYBOARD_PREFIX):],
+                    doc['access_time'],
+                    pickle.loads(doc['buttons'])
+                ))
+
+        if self._prune_callback_data and len(keyboards) >= self._callback_data_maxsize:
+            # Least recently used keyboards, that the cache would have dropped.
+            await data_type.collection.delete_many({
+                '_id': {'$regex': f'^{_KEYBOARD_PREFIX}'},
+                'access_time': {'$lt': keyboards[-1][1]}
+            })
+
+        keyboard_uuids = {keyboard_uuid for keyboard_uuid, _, _ in keyboards}
+        queries = {}
+        stale_queries = []
+        doc_filter = {'_id': {'$regex': f'^{_QUERY_PREFIX}'}}
+        cursor = data_type.collection.find(doc_filter)
+        with self._timed(data_type.collection, 'find', doc_filter) as timer:
+            async for doc in cursor:
+                timer.add(doc)
+                if doc['keyboard'] in keyboard_uuids:
+                    queries[doc['_id'][len(_QUERY_PREFIX):]] = doc['keyboard']
+                else:
+                    stale_queries.append(doc['_id'])
+        if self._prune_callback_data and stale_queries:
+            await data_type.collection.delete_many({'_id': {'$in': stale_queries}})
+
+        self._callback_keyboards = {
+            keyboard_uuid: access_time
+            for keyboard_uuid, access_time, _ in keyboards
+        }
+        self._callback_queries = dict(queries)
+
+        if not keyboards and not queries:
+            return None
+
+        # Oldest first, the order of the LRU cache they are loaded into.
+        keyboards.reverse()
+        return keyboards, queries
+
+
+    @log_method
+    async def update_callback_data(self, data: CallbackData) -> None:
+        """
+        Write what changed since the last call: new keyboards with their pickled button
+        data, the access time of used keyboards, and the removal of keyboards dropped
+        from the cache. Button data is never changed by PTB once a keyboard is created.
+        """
+        self._check_inited()
+
+        data_type = self._callback_data
+        if not data_type.exists():
+            return
+
+        keyboards, queries = data
+        operations = []
+
+        current_keyboards = {}
+        for keyboard_uuid, access_time, buttons in keyboards:
+            current_keyboards[keyboard_uuid] = access_time
+            previous = self._callback_keyboards.get(keyboard_uuid)
+            doc_id = _KEYBOARD_PREFIX + keyboard_uuid
+            if previous is None:
+                operations.append(
+                    pymongo.ReplaceOne(
+                        {'_id': doc_id},
+                        {
+                            'access_time': access_time,
+                            'buttons': bson.Binary(
+                                pickle.dumps(buttons, protocol=pickle.HIGHEST_PROTOCOL)
+                            )
+                        },
+                        upsert=True
+                    )
+                )
+            elif previous != access_time:
+                operations.append(
+                    pymongo.UpdateOne(
+                        {'_id': doc_id},
+                        {'$set': {'access_time': access_time}}
+                    )
+                )
+        for keyboard_uuid in self._callback_keyboards.keys() - current_keyboards.keys():
+            operations.append(
+                pymongo.DeleteOne({'_id': _KEYBOARD_PREFIX + keyboard_uuid})
+            )
+
+        for query_id, keyboard_uuid in queries.items():
+            if self._callback_queries.get(query_id) != keyboard_uuid:
+                operations.append(
+                    pymongo.ReplaceOne(
+                        {'_id': _QUERY_PREFIX + query_id},
+                        {'keyboard': keyboard_uuid},
+                        upsert=True
+                    )
+                )
+        for query_id in self._callback_queries.keys() - queries.keys():
+            operations.append(
+                pymongo.DeleteOne({'_id': _QUERY_PREFIX + query_id})
+            )
+
+        if not operations:
+            return
+
+        try:
+            with self._timed(data_type.collection, 'bulk_write'):
+                await data_type.collection.bulk_write(operations, ordered=False)
+        except BaseException:
+            # Rewrite everything next time. Removals are lost, but the keyboards
+            # over the maxsize are removed on the next load with prune_callback_data.
+            self._callback_keyboards = {}
+            self._callback_queries = {}
+            raise
+
+        self._callback_keyboards = current_keyboards
+        self._callback_queries = dict(queries)
+
+
+    @log_method
+    async def watch(self,
+            data: Mapping[
+                Literal['user', 'chat', 'bot'], MutableMapping[int, dict]
+            ],
+            conversations: Mapping[str, ConversationDict] | None = None
+            ) -> bool:
+        self._check_inited()
+
+        if not self._watch_changes or self._watch_tasks:
+            return bool(self._watch_tasks)
+
+        for data_type_name, mapping in data.items():
+            data_type = self._get_data_type(data_type_name)
+            if not data_type.exists():
+                continue
+            for shard, collection in enumerate(data_type.collections):
+                self._watch_tasks.append(
+                    asyncio.create_task(
+                        follow_change_stream(
+                            collection=collection,
+                            open_change_stream=self._open_change_stream,
+                            apply_change=functools.partial(
+                                self._apply_data_change, data_type, mapping
+                            ),
+                            reload=functools.partial(
+                                self._reload_data, data_type, mapping, shard
+                            ),
+                            logger=self._logger,
+                            retry_delay=self._watch_retry_delay
+                        )
+                    )
+                )
+
+        data_type = self._conversations_data
+        if conversations is not None and data_type.exists():
+            self._watch_tasks.append(
+                asyncio.create_task(
+                    follow_change_stream(
+                        collection=data_type.collection,
+                        open_change_stream=self._open_change_stream,
+                        apply_change=functools.partial(
+                            self._apply_conversation_change, data_type, conversations
+                        ),
+                        reload=functools.partial(
+                            self._reload_conversations, data_type, conversations
+                        ),
+                        logger=self._logger,
+                        retry_delay=self._watch_retry_delay
+                    )
+                )
             )
+
+        return True
+
+
+    def _apply_data_change(self,
+            data_type: DataType,
+            mapping: MutableMapping[int, dict],
+            change: dict
+            ) -> None:
+        """Apply a change event to the local data, if it is in memory."""
+        key = self._doc_key(data_type, change['documentKey']['_id'])
+        if key is None:
+            # Not a partition, its keys were merged into the partitions when loaded.
             return
-        
-        await data_type.collection.replace_one(
-            {'_id': doc_id},
-            {'state': local_state},
-            upsert=True
+        data_id = key[0] if self._is_partitioned(data_type) else key
+        self._track_existence(data_type, key, change)
+
+        local_data = mapping.get(data_id)
+        if local_data is None:
+            # Not in memory, it is fetched from the database when needed.
+            return
+
+        db_data: dict | None = change.get('fullDocument')
+        if (
+            db_data is not None and
+            db_data.get(_REVISION_FIELD) is not None and
+            db_data.get(_REVISION_FIELD) == data_type.get_revision(key)
+            ):
+            # Already held by the local data (e.g. written by this process).
+            return
+
+        pending = data_type.writes.get(key)
+        if pending is not None:
+            # Queued writes are part of the stored data.
+            db_data = apply_write(db_data, pending)
+
+        if db_data is None:
+            # Deleted by another process.
+            if self._is_partitioned(data_type):
+                for data_key in list(local_data):
+                    if self._partitioning.partition_of(data_key) == key[1]:
+                        local_data.pop(data_key)
+            else:
+                local_data.clear()
+            data_type.forget_fingerprints(key)
+            data_type.forget_revision(key)
+            return
+
+        update_description = change.get('updateDescription') or {}
+        for field_name in update_description.get('removedFields', []):
+            local_data.pop(field_name, None)
+
+        self._merge_data(
+            data_type=data_type,
+            data_id=key,
+            local_data=local_data,
+            db_data=db_data
         )
 
 
+    def _doc_id(self, data_type: DataType, key: object) -> object:
+        """The _id of the document of ``key``."""
+        if self._is_partitioned(data_type):
+            return Partitioning.doc_id(*key)
+        return key
+
+
+    def _doc_key(self, data_type: DataType, doc_id: object) -> object | None:
+        """The key of the document ``doc_id``, or None if it is not a current partition."""
+        if not self._is_partitioned(data_type):
+            return doc_id
+        return self._partitioning.key_of(doc_id)
+
+
+    def _track_existence(self, data_type: DataType, key: object, change: dict) -> None:
+        operation = change.get('operationType')
+        if operation == 'delete':
+            data_type.mark_absent(key)
+        elif operation is not None:
+            data_type.forget_absent(key)
+
+
+    async def _reload_data(self,
+            data_type: DataType,
+            mapping: MutableMapping[int, dict],
+            shard: int | None = None
+            ) -> None:
+        """
+        Fetch again the in-memory entries that changed since the local data got them.
+
+        If ``shard`` is given, only the entries stored in that collection are fetched.
+        """
+        # Documents may have been created while changes were not watched.
+        data_type.clear_absent()
+
+        keys = []
+        for data_id in mapping.keys():
+            if self._is_partitioned(data_type):
+                keys.extend(self._partitioning.keys(data_id))
+            else:
+                keys.append(data_id)
+
+        for index, shard_keys in data_type.shards.group_by_shard(keys).items():
+            if shard is None or index == shard:
+                await self._reload_shard(
+                    data_type=data_type,
+                    mapping=mapping,
+                    collection=data_type.collections[index],
+                    keys=shard_keys
+                )
+
+
+    async def _reload_shard(self,
+            data_type: DataType,
+            mapping: MutableMapping[int, dict],
+            collection: AsyncIOMotorCollection,
+            keys: list[object]
+            ) -> None:
+        for start in range(0, len(keys), self._load_batch_size):
+            batch = keys[start:start + self._load_batch_size]
+
+            revisions = {}
+            cursor = collection.find(
+                {'_id': {'$in': [self._doc_id(data_type, key) for key in batch]}},
+                projection={_REVISION_FIELD: True}
+            )
+            doc: dict
+            async for doc in cursor:
+                revisions[self._doc_key(data_type, doc['_id'])] = doc.get(_REVISION_FIELD)
+
+            changed_ids = []
+            for key in batch:
+                if key not in revisions:
+                    if data_type.get_revision(key) is None:
+                        # Possibly never stored, keep it.
+                        continue
+                    self._apply_data_change(
+                        data_type, mapping,
+                        {'documentKey': {'_id': self._doc_id(data_type, key)}}
+                    )
+                elif (
+                    revisions[key] is None or
+                    revisions[key] != data_type.get_revision(key)
+                    ):
+                    changed_ids.append(self._doc_id(data_type, key))
+
+            if not changed_ids:
+                continue
+
+            cursor = collection.find({'_id': {'$in': changed_ids}})
+            async for doc in cursor:
+                self._apply_data_change(
+                    data_type, mapping,
+                    {'documentKey': {'_id': doc['_id']}, 'fullDocument': doc}
+                )
+
+
+    def _apply_conversation_change(self,
+            data_type: DataType,
+            conversations: Mapping[str, ConversationDict],
+            change: dict
+            ) -> None:
+        """Apply a change event to the states of a persistent ConversationHandler."""
+        doc_id = change['documentKey']['_id']
+        if not isinstance(doc_id, dict) or not isinstance(doc_id.get('key'), list):
+            # Old string key format, see migrate_conversation_keys().
+            return
+
+        name = doc_id['name']
+        key = _decode_conversation_key(doc_id['key'])
+        self._track_existence(data_type, (name, key), change)
+
+        local_data = conversations.get(name)
+        if local_data is None:
+            return
+
+        if isinstance(local_data.get(key), PendingState):
+            # A non-blocking handler is running, its result sets the state.
+            return
+
+        db_data: dict | None = change.get('fullDocument')
+        if (
+            db_data is not None and
+            db_data.get(_REVISION_FIELD) is not None and
+            db_data.get(_REVISION_FIELD) == data_type.get_revision((name, key))
+            ):
+            return
+
+        pending = data_type.writes.get((name, key))
+        if pending is not None:
+            # Queued writes are part of the stored data.
+            db_data = apply_write(db_data, pending)
+
+        if db_data is None:
+            data_type.forget_revision((name, key))
+            _remove_ended_conversation(local_data, key)
+            return
+
+        data_type.set_revision(
+            (name, key), db_data.get(_REVISION_FIELD)
+        )
+        _set_conversation_state(local_data, key, db_data['state'])
+
+
+    async def _reload_conversations(self,
+            data_type: DataType,
+            conversations: Mapping[str, ConversationDict]
+            ) -> None:
+        """
+        Fetch again every conversation of the watched handlers.
+
+        Local states missing from the database are kept, they may not be persisted yet.
+        """
+        data_type.clear_absent()
+
+        cursor = data_type.collection.find(
+            {'_id.name': {'$in': list(conversations)}},
+            batch_size=self._load_batch_size
+        )
+        doc: dict
+        async for doc in cursor:
+            self._apply_conversation_change(
+                data_type, conversations,
+                {'documentKey': {'_id': doc['_id']}, 'fullDocument': doc}
+            )
+
+
     @log_method
     async def flush(self) -> None:
+        if self._index_task is not None:
+            # The server keeps building an index it already started.
+            self._index_task.cancel()
+            self._index_task = None
+
+        for task in self._watch_tasks:
+            task.cancel()
+        self._watch_tasks = []
+
+        for task in self._explain_tasks:
+            task.cancel()
+
+        if self._write_lock is not None:
+            await self._write_pending()
+
+        if self._write_task is not None:
+            self._write_task.cancel()
+            self._write_task = None
+
         if self._close_client:
-            self._client.close()
+            await self._disconnect()
+
+
+    async def _disconnect(self) -> None:
+        self._client.close()
+
+
+    async def _open_change_stream(self,
+            collection: AsyncIOMotorCollection,
+            **kwargs
+            ) -> AsyncIOMotorChangeStream:
+        return collection.watch(**kwargs)
+
+
+    async def _aggregate(self,
+            collection: AsyncIOMotorCollection,
+            pipeline: list[dict]
+            ) -> AsyncIOMotorCommandCursor:
+        return collection.aggregate(pipeline)
+
+
+    async def _write(self,
+            data_type: DataType,
+            key: object,
+            doc_filter: dict,
+            write: Write,
+            local_data: dict | None = None
+            ) -> None:
+        """
+        Send a write now, or queue it when write-behind is enabled.
+
+        Every write stamps the document with a new revision. The revision is only
+        remembered as held by the local data when the write is known to leave the
+        stored document equal to it.
+
+        An 'update' upserting a document dropped in the meantime is followed by a
+        replacement with ``local_data``, the whole data it was built from.
+        """
+        kind, document = write
+        revision = bson.ObjectId()
+        if kind == 'replace':
+            document[_REVISION_FIELD] = revision
+        elif kind == 'update':
+            document.setdefault('$set', {})[_REVISION_FIELD] = revision
+
+        if kind == 'delete':
+            data_type.mark_absent(key)
+        else:
+            data_type.forget_absent(key)
+
+        if not self._write_behind:
+            collection = data_type.shards.collection_for(key)
+            if kind == 'replace':
+                with self._timed(collection, 'replace_one', doc_filter) as timer:
+                    timer.add(document)
+                    await collection.replace_one(
+                        doc_filter, document, upsert=True
+                    )
+                data_type.set_revision(key, revision)
+
+            elif kind == 'update':
+                with self._timed(collection, 'find_one_and_update', doc_filter) as timer:
+                    timer.add(document)
+                    previous = await collection.find_one_and_update(
+                        doc_filter,
+                        document,
+                        projection={_REVISION_FIELD: True},
+                        upsert=True,
+                        return_document=pymongo.ReturnDocument.BEFORE
+                    )
+                known_revision = data_type.get_revision(key)
+                if previous is None:
+                    # Dropped in between: the upsert created it with the changed keys only.
+                    document = copy.deepcopy(local_data)
+                    document[_REVISION_FIELD] = revision
+                    with self._timed(collection, 'replace_one', doc_filter) as timer:
+                        timer.add(document)
+                        await collection.replace_one(
+                            doc_filter, document, upsert=True
+                        )
+                    data_type.set_revision(key, revision)
+                elif (
+                    known_revision is not None and
+                    previous.get(_REVISION_FIELD) == known_revision
+                    ):
+                    data_type.set_revision(key, revision)
+                else:
+                    # Someone else changed the document in between.
+                    data_type.forget_revision(key)
+
+            else:
+                with self._timed(collection, 'delete_one', doc_filter):
+                    await collection.delete_one(doc_filter)
+                data_type.forget_revision(key)
+            return
+
+        data_type.forget_revision(key)
+        pending = data_type.writes.put(
+            key=key,
+            doc_filter=doc_filter,
+            write=write
+        )
+        if pending >= self._write_batch_size:
+            self._write_event.set()
+
+
+    async def _write_behind_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(
+                    self._write_event.wait(),
+                    timeout=self._write_batch_delay
+                )
+            except asyncio.TimeoutError:
+                pass
+            self._write_event.clear()
+
+            try:
+                await self._write_pending()
+            except Exception:
+                self._logger.exception(
+                    'MongoDBDataStore: Failed to send queued writes. Retrying later.'
+                )
+
+
+    async def _write_pending(self) -> None:
+        """Send all queued writes as unordered bulk_write batches, to the collections of a data type at once."""
+        async with self._write_lock:
+            for data_type in self._data_types():
+                while writes := data_type.writes.take(self._write_batch_size):
+                    shards: dict[int, list[tuple[object, dict, Write]]] = {}
+                    for write in writes:
+                        shards.setdefault(data_type.shards.shard_of(write[0]), []).append(write)
+
+                    results = await asyncio.gather(
+                        *(
+                            self._bulk_write(data_type, data_type.collections[shard], shard_writes)
+                            for shard, shard_writes in shards.items()
+                        ),
+                        return_exceptions=True
+                    )
+                    failed_writes = [
+                        write
+                        for result in results if not isinstance(result, BaseException)
+                        for write in result
+                    ]
+                    # Retried on the next round, before any newer write to the same
+                    # documents, rather than over and over in this one.
+                    data_type.writes.requeue(failed_writes)
+                    for result in results:
+                        if isinstance(result, BaseException):
+                            raise result
+                    if failed_writes:
+                        break
+
+
+    async def _bulk_write(self,
+            data_type: DataType,
+            collection: AsyncIOMotorCollection,
+            writes: list[tuple[object, dict, Write]]
+            ) -> list[tuple[object, dict, Write]]:
+        """Send ``writes`` in one batch. Returns the failed writes to send again."""
+        try:
+            with self._timed(collection, 'bulk_write') as timer:
+                for _, _, (_, document) in writes:
+                    timer.add(document)
+                await collection.bulk_write(
+                    [
+                        to_operation(doc_filter, write)
+                        for _, doc_filter, write in writes
+                    ],
+                    ordered=False
+                )
+        except pymongo.errors.BulkWriteError as error:
+            # Other operations of the batch were applied. Forget what we know
+            # about the failed documents so they are replaced in full next time.
+            failed_writes = []
+            for write_error in error.details.get('writeErrors', []):
+                write = writes[write_error['index']]
+                data_type.forget_fingerprints(write[0])
+                if write_error.get('code') != _DUPLICATE_KEY_ERROR:
+                    failed_writes.append(write)
+            self._logger.error(
+                f'MongoDBDataStore: {len(error.details.get("writeErrors", []))}'
+                f' queued writes failed, {len(failed_writes)} will be sent again:'
+                f' {error.details.get("writeErrors")!r}'
+                )
+            return failed_writes
+        except BaseException:
+            # Includes cancellation. Replaying a write is harmless.
+            data_type.writes.requeue(writes)
+            raise
+        return []
+
+
+    def _timed(self,
+            collection: AsyncIOMotorCollection,
+            operation: str,
+            doc_filter: dict | None = None
+            ) -> _OperationTimer | _NullTimer:
+        """
+        Time the operation run in the block, e.g.:
+
+            with self._timed(collection, 'find_one', doc_filter) as timer:
+                timer.add(await collection.find_one(doc_filter))
+        """
+        if self._slow_operation_threshold is None:
+            return _NULL_TIMER
+        return _OperationTimer(self, collection, operation, doc_filter)
+
+
+    def _record_slow_operation(self,
+            collection: AsyncIOMotorCollection,
+            operation: str,
+            doc_filter: dict | None,
+            started_at: float,
+            duration: float,
+            documents: list[dict]
+            ) -> None:
+        shape = repr(_query_shape(doc_filter)) if doc_filter is not None else None
+        shape_key = (collection.full_name, shape)
+
+        slow_operation = SlowOperation(
+            collection=collection.full_name,
+            operation=operation,
+            filter=doc_filter,
+            started_at=started_at,
+            duration=duration,
+            documents=len(documents),
+            document_bytes=sum(map(_bson_size, documents)),
+            shape=shape,
+            plan=self._query_plans.get(shape_key)
+        )
+        self._slow_operations.append(slow_operation)
+        self._logger.warning(
+            'MongoDBDataStore: Slow %s on %r: %.4f seconds, %d documents (%d bytes). Filter: %s',
+            operation, collection.full_name, duration,
+            slow_operation.documents, slow_operation.document_bytes, _Truncated(doc_filter)
+        )
+
+        if (
+                self._explain_slow_operations and
+                shape is not None and
+                shape_key not in self._query_plans
+                ):
+            # Explained once per shape, even if the explain fails.
+            self._query_plans[shape_key] = None
+            task = asyncio.create_task(
+                self._explain(collection, doc_filter, slow_operation)
+            )
+            self._explain_tasks.add(task)
+            task.add_done_callback(self._explain_tasks.discard)
+
+
+    async def _explain(self,
+            collection: AsyncIOMotorCollection,
+            doc_filter: dict,
+            slow_operation: SlowOperation
+            ) -> None:
+        """Fetch the query plan of ``doc_filter``, without running the query."""
+        try:
+            reply = await collection.database.command({
+                'explain': {'find': collection.name, 'filter': doc_filter},
+                'verbosity': 'queryPlanner'
+            })
+        except Exception:
+            self._logger.exception(
+                f'MongoDBDataStore: Failed to explain the slow query {slow_operation.shape}'
+                f' on {collection.full_name!r}'
+            )
+            return
+
+        plan = reply.get('queryPlanner', {}).get('winningPlan', {})
+        self._query_plans[(collection.full_name, slow_operation.shape)] = plan
+        slow_operation.plan = plan
+        self._logger.warning(
+            'MongoDBDataStore: Plan of the slow query %s on %r: %s',
+            slow_operation.shape, collection.full_name, _plan_stages(plan)
+        )
+
+
+    def get_slow_operations(self) -> list[SlowOperation]:
+        """The most recent slow operations, oldest first, if ``slow_operation_threshold`` is set."""
+        return list(self._slow_operations)
+
+
+    def get_codec_stats(self,
+            data_type: Literal['user', 'chat', 'bot']
+            ) -> CodecStats | None:
+        """Statistics of the codec of a data type, or None if no codec is used."""
+        data_type = self._get_data_type(data_type)
+        if data_type.codec is None:
+            return None
+        return data_type.codec_stats
 
 
     def build_persistence_input(self) -> PersistenceInput:
@@ -358,11 +2240,21 @@ class MongoDBDataStore(BaseDataStore):
             bot_data=self._bot_data.exists(),
             chat_data=self._chat_data.exists(),
             user_data=self._user_data.exists(),
-            callback_data=False
+            callback_data=self._callback_data.exists()
         )
         return persistence_input
 
 
+    def _data_types(self) -> tuple[DataType, ...]:
+        return (
+            self._user_data,
+            self._chat_data,
+            self._bot_data,
+            self._conversations_data,
+            self._callback_data
+        )
+
+
     def _get_data_type(self,
             data_type: Literal['user', 'chat', 'bot', 'conversations']
             ) -> DataType:
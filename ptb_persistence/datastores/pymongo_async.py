@@ -0,0 +1,57 @@
+from .mongodb import MongoDBDataStore
+
+try:
+    from pymongo import AsyncMongoClient
+    from pymongo.asynchronous.change_stream import AsyncChangeStream
+    from pymongo.asynchronous.collection import AsyncCollection
+    from pymongo.asynchronous.command_cursor import AsyncCommandCursor
+    from pymongo.asynchronous.database import AsyncDatabase
+except ImportError as error:  # pymongo < 4.13
+    raise ImportError(
+        'PyMongoDataStore requires the asyncio API of pymongo 4.13 or newer.'
+        ' Install it with: pip install "pymongo>=4.13"'
+    ) from error
+
+
+
+class PyMongoDataStore(MongoDBDataStore):
+    """
+    :class:`MongoDBDataStore` built on the native asyncio client of PyMongo.
+
+    Motor runs every call of the synchronous PyMongo driver on a thread pool.
+    :class:`pymongo.AsyncMongoClient` does the network I/O on the event loop
+    instead, which saves a thread hand-off per operation.
+
+    Takes the same parameters as :class:`MongoDBDataStore`, with ``client_or_uri``
+    an :class:`~pymongo.AsyncMongoClient` or a connection uri, and ``database`` and
+    the collections instances of its asynchronous API or names.
+
+        from ptb_persistence.datastores.pymongo_async import PyMongoDataStore
+
+        data_store = PyMongoDataStore(
+            client_or_uri='mongodb://localhost:27017',
+            database='bot',
+            collection_userdata='userdata'
+        )
+    """
+
+    _client_class = AsyncMongoClient
+    _database_class = AsyncDatabase
+
+
+    async def _disconnect(self) -> None:
+        await self._client.close()
+
+
+    async def _open_change_stream(self,
+            collection: AsyncCollection,
+            **kwargs
+            ) -> AsyncChangeStream:
+        return await collection.watch(**kwargs)
+
+
+    async def _aggregate(self,
+            collection: AsyncCollection,
+            pipeline: list[dict]
+            ) -> AsyncCommandCursor:
+        return await collection.aggregate(pipeline)
@@ -0,0 +1,518 @@
+from .base import BaseDataStore, _remove_ended_conversation
+from .._types import ConversationDict
+from ..instrumentation import log_method
+
+try:
+    from redis.asyncio import Redis
+except ImportError as error:  # Optional dependency
+    raise ImportError(
+        'RedisDataStore requires the redis package.'
+        ' Install it with: pip install "ptb-persistence[redis]"'
+    ) from error
+
+from dataclasses import dataclass, field
+from typing import (
+    Any,
+    Callable,
+    Literal,
+    Sequence,
+    Tuple,
+    Union
+    )
+
+from telegram.ext import PersistenceInput
+from logging import Logger
+import asyncio
+import hashlib
+import pickle
+import json
+
+
+
+def _dumps(value: object) -> bytes:
+    return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _digest(value: bytes) -> bytes:
+    return hashlib.blake2b(value, digest_size=16).digest()
+
+
+def _encode_conversation_key(key: Tuple[Union[int, str], ...]) -> str:
+    return json.dumps(list(key), separators=(',', ':'))
+
+
+def _decode_conversation_key(key: bytes) -> Tuple[Union[int, str], ...]:
+    return tuple(json.loads(key))
+
+
+def _decode_hash(fields: dict[bytes, bytes]) -> dict:
+    return {
+        pickle.loads(name): pickle.loads(value)
+        for name, value in fields.items()
+    }
+
+
+def _escape_pattern(value: str) -> str:
+    """Escape the glob characters of ``value`` for SCAN MATCH."""
+    for char in '\\*?[]':
+        value = value.replace(char, '\\' + char)
+    return value
+
+
+
+@dataclass
+class DataType:
+    prefix: str | None = None
+    ignore_keys: list[str] = field(default_factory=list)
+
+
+    def __post_init__(self) -> None:
+        # Digest of every field last persisted per data id.
+        self._fields: dict[int, dict[bytes, bytes]] = {}
+
+
+    def exists(self) -> bool:
+        return self.prefix is not None
+
+
+    def key(self, data_id: object) -> str:
+        return f'{self.prefix}:{data_id}'
+
+
+    def cleanup_local_data(self, data: dict) -> None:
+        for item in self.ignore_keys:
+            data.pop(item, None)
+
+
+    def get_fields(self, data_id: int) -> dict[bytes, bytes] | None:
+        return self._fields.get(data_id)
+
+
+    def set_fields(self, data_id: int, fields: dict[bytes, bytes]) -> None:
+        self._fields[data_id] = {
+            name: _digest(value)
+            for name, value in fields.items()
+        }
+
+
+    def forget_fields(self, data_id: int) -> None:
+        self._fields.pop(data_id, None)
+
+
+
+@dataclass
+class _WriteBatch:
+    """Commands waiting to be sent together, in order."""
+    future: asyncio.Future
+    commands: list[Callable[[Any], None]] = field(default_factory=list)
+
+
+
+class RedisDataStore(BaseDataStore):
+
+    def __init__(self,
+            client_or_url: Redis | str,
+            prefix_userdata: str | None = None,
+            prefix_chatdata: str | None = None,
+            prefix_botdata: str | None = None,
+            prefix_conversationsdata: str | None = None,
+            ignore_general_keys: list[str] = None,
+            ignore_user_keys: list[str] = None,
+            ignore_chat_keys: list[str] = None,
+            ignore_bot_keys: list[str] = None,
+            load_batch_size: int = 1000,
+            ) -> None:
+        """
+        A data store implementation for Redis.
+
+        The data of each user, chat and bot is a hash at ``<prefix>:<id>`` with one
+        field per top-level key, so an update only writes the keys that changed.
+        The states of a ConversationHandler are a hash at ``<prefix>:<name>``.
+        Keys and values are pickled.
+
+        Writes made in the same event loop iteration (e.g. by one persistence update)
+        are sent in one MULTI/EXEC pipeline, and a refresh of several entries is one
+        pipeline too.
+
+
+        :param client_or_url: Client instance (redis.asyncio.Redis) or connection url
+
+        :param prefix_userdata: Key prefix (If None, data will not be persisted)
+        :param prefix_chatdata: Key prefix (If None, data will not be persisted)
+        :param prefix_botdata: Key prefix (If None, data will not be persisted)
+        :param prefix_conversationsdata: Key prefix (If None, data will not be persisted)
+
+        :param ignore_general_keys: A list of keys to not persist in the data store.
+                Ex: ['_cache', 'ignored-key'] (Will be applied to all)
+        :param ignore_user_keys: A list of keys to not persist in the user data store
+        :param ignore_chat_keys: A list of keys to not persist in the chat data store
+        :param ignore_bot_keys: A list of keys to not persist in the bot data store
+
+        :param load_batch_size: Number of keys per SCAN step and per pipeline when
+                loading all the data of a type. Defaults to 1000.
+        """
+
+        if not isinstance(client_or_url, Redis):
+            self._client = Redis.from_url(client_or_url)
+            self._close_client = True
+        else:
+            self._client = client_or_url
+            self._close_client = False
+
+        ignore_general_keys = ignore_general_keys or []
+        ignore_user_keys = ignore_user_keys or []
+        ignore_chat_keys = ignore_chat_keys or []
+        ignore_bot_keys = ignore_bot_keys or []
+
+        self._user_data = DataType(
+            prefix=prefix_userdata,
+            ignore_keys=ignore_general_keys + ignore_user_keys,
+        )
+
+        self._chat_data = DataType(
+            prefix=prefix_chatdata,
+            ignore_keys=ignore_general_keys + ignore_chat_keys,
+        )
+
+        self._bot_data = DataType(
+            prefix=prefix_botdata,
+            ignore_keys=ignore_general_keys + ignore_bot_keys,
+        )
+
+        self._conversations_data = DataType(
+            prefix=prefix_conversationsdata,
+        )
+
+        self._load_batch_size = load_batch_size
+
+        self._write_batch: _WriteBatch | None = None
+        self._write_tasks: set[asyncio.Task] = set()
+
+        super().__init__()
+
+
+    def _check_inited(self) -> None:
+        """Raise RuntimeError if not yet initialized."""
+        if not self._inited:
+            raise RuntimeError(
+                'The DataStore must be initialized before any use.'
+                ' Initialize it with the .post_init(...) method.'
+            )
+
+
+    async def _write(self, command: Callable[[Any], None]) -> None:
+        """
+        Add a command to the current write pipeline and wait until it is executed.
+
+        The pipeline is sent once the calls made in the same event loop iteration
+        have added theirs.
+        """
+        batch = self._write_batch
+        if batch is None:
+            batch = self._write_batch = _WriteBatch(
+                future=asyncio.get_running_loop().create_future()
+            )
+            task = asyncio.create_task(self._send_batch(batch))
+            self._write_tasks.add(task)
+            task.add_done_callback(self._write_tasks.discard)
+
+        batch.commands.append(command)
+        await asyncio.shield(batch.future)
+
+
+    async def _send_batch(self, batch: _WriteBatch) -> None:
+        self._write_batch = None
+
+        try:
+            async with self._client.pipeline(transaction=True) as pipe:
+                for command in batch.commands:
+                    command(pipe)
+                await pipe.execute()
+        except BaseException as error:
+            batch.future.set_exception(error)
+            # Retrieved here in case all callers were cancelled.
+            batch.future.exception()
+            if not isinstance(error, Exception):
+                raise
+        else:
+            batch.future.set_result(None)
+
+
+    @log_method
+    async def get_data(self, data_type, data_id: int | None = None) -> dict:
+        self._check_inited()
+
+        data: dict = {}
+
+        data_type = self._get_data_type(data_type)
+        if not data_type.exists():
+            return data
+
+        if data_id is not None:
+            fields = await self._client.hgetall(data_type.key(data_id))
+            if fields:
+                data[data_id] = _decode_hash(fields)
+            return data
+
+        prefix = f'{data_type.prefix}:'
+        keys = []
+        async for key in self._client.scan_iter(
+                match=_escape_pattern(prefix) + '*',
+                count=self._load_batch_size
+                ):
+            keys.append(key)
+            if len(keys) >= self._load_batch_size:
+                await self._load_data(data, prefix, keys)
+                keys = []
+        if keys:
+            await self._load_data(data, prefix, keys)
+
+        return data
+
+
+    async def _load_data(self, data: dict, prefix: str, keys: list[bytes]) -> None:
+        """Fetch the hashes at ``keys`` into ``data``, by id."""
+        ids = []
+        for key in keys:
+            try:
+                ids.append(int(key[len(prefix):]))
+            except ValueError:
+                # Not written by this data store.
+                ids.append(None)
+
+        async with self._client.pipeline(transaction=False) as pipe:
+            for key, _id in zip(keys, ids):
+                if _id is not None:
+                    pipe.hgetall(key)
+            results = iter(await pipe.execute())
+
+        for _id in ids:
+            if _id is None:
+                continue
+            fields = next(results)
+            if fields:
+                data[_id] = _decode_hash(fields)
+
+
+    @log_method
+    async def update_data(self, data_type, data_id: int, local_data: dict) -> None:
+        self._check_inited()
+
+        data_type = self._get_data_type(data_type)
+        if not data_type.exists():
+            return
+
+        local_data = dict(local_data)
+        data_type.cleanup_local_data(local_data)
+
+        fields = {
+            _dumps(name): _dumps(value)
+            for name, value in local_data.items()
+        }
+        previous = data_type.get_fields(data_id)
+        key = data_type.key(data_id)
+
+        if previous is None:
+            # Nothing is known about the stored hash, replace it.
+            def command(pipe) -> None:
+                pipe.delete(key)
+                if fields:
+                    pipe.hset(key, mapping=fields)
+        else:
+            changed = {
+                name: value
+                for name, value in fields.items()
+                if previous.get(name) != _digest(value)
+            }
+            removed = [name for name in previous if name not in fields]
+            if not changed and not removed:
+                # Nothing changed since the last write.
+                return
+
+            def command(pipe) -> None:
+                if changed:
+                    pipe.hset(key, mapping=changed)
+                if removed:
+                    pipe.hdel(key, *removed)
+
+        await self._write(command)
+        data_type.set_fields(data_id, fields)
+
+
+    @log_method
+    async def refresh_data(self, data_type, data_id: int, local_data: dict) -> None:
+        await self.refresh_many(
+            data=[(data_type, data_id, local_data)],
+            conversations=[]
+        )
+
+
+    async def refresh_many(
+        self,
+        data: Sequence[
+            Tuple[Literal['user', 'chat', 'bot'], int, dict]
+        ],
+        conversations: Sequence[
+            Tuple[str, Tuple[Union[int, str], ...], ConversationDict]
+        ],
+        ) -> None:
+        self._check_inited()
+
+        data = [
+            (self._get_data_type(data_type), data_id, local_data)
+            for data_type, data_id, local_data in data
+            if self._get_data_type(data_type).exists()
+        ]
+        if not self._conversations_data.exists():
+            conversations = []
+
+        if not data and not conversations:
+            return
+
+        async with self._client.pipeline(transaction=False) as pipe:
+            for data_type, data_id, local_data in data:
+                pipe.hgetall(data_type.key(data_id))
+            for name, key, local_data in conversations:
+                pipe.hget(
+                    self._conversations_data.key(name),
+                    _encode_conversation_key(key)
+                )
+            results = iter(await pipe.execute())
+
+        for data_type, data_id, local_data in data:
+            fields = next(results)
+            if not fields:
+                continue
+            data_type.set_fields(data_id, fields)
+
+            # Synchronize local data object with current data in database.
+            local_data.update(
+                _decode_hash(fields)
+            )
+
+        for name, key, local_data in conversations:
+            state = next(results)
+            if state is None:
+                _remove_ended_conversation(local_data, key)
+                continue
+            local_data.update({key: pickle.loads(state)})
+
+
+    @log_method
+    async def drop_data(self, data_type, data_id: int) -> None:
+        self._check_inited()
+
+        data_type = self._get_data_type(data_type)
+        if not data_type.exists():
+            return
+
+        key = data_type.key(data_id)
+        await self._write(lambda pipe: pipe.delete(key))
+        data_type.forget_fields(data_id)
+
+
+    def forget_data(self, data_type, data_id: int) -> None:
+        self._get_data_type(data_type).forget_fields(data_id)
+
+
+    @log_method
+    async def get_conversations(self, name: str) -> dict:
+        self._check_inited()
+
+        if not self._conversations_data.exists():
+            return {}
+
+        convs: dict[tuple[int | str], object] = {}
+        async for key, state in self._client.hscan_iter(
+                self._conversations_data.key(name),
+                count=self._load_batch_size
+                ):
+            convs[_decode_conversation_key(key)] = pickle.loads(state)
+        return convs
+
+
+    @log_method
+    async def refresh_conversation(
+        self,
+        name: str,
+        key: Tuple[Union[int, str], ...],
+        local_data: ConversationDict
+        ) -> None:
+        await self.refresh_many(
+            data=[],
+            conversations=[(name, key, local_data)]
+        )
+
+
+    @log_method
+    async def refresh_conversations(
+        self,
+        conversations: Sequence[
+            Tuple[str, Tuple[Union[int, str], ...], ConversationDict]
+        ],
+        ) -> None:
+        await self.refresh_many(
+            data=[],
+            conversations=conversations
+        )
+
+
+    @log_method
+    async def update_conversation(self,
+            name: str,
+            key: Tuple[Union[int, str], ...],
+            local_state: object | None
+            ) -> None:
+        self._check_inited()
+
+        if not self._conversations_data.exists():
+            return
+
+        conversations_key = self._conversations_data.key(name)
+        field_name = _encode_conversation_key(key)
+
+        if local_state is None:
+            # Remove unnecessary data from the hash.
+            await self._write(
+                lambda pipe: pipe.hdel(conversations_key, field_name)
+            )
+        else:
+            state = _dumps(local_state)
+            await self._write(
+                lambda pipe: pipe.hset(conversations_key, field_name, state)
+            )
+
+
+    @log_method
+    async def flush(self) -> None:
+        if self._write_tasks:
+            await asyncio.gather(*self._write_tasks, return_exceptions=True)
+
+        if self._close_client:
+            await self._client.aclose()
+
+
+    def build_persistence_input(self) -> PersistenceInput:
+        persistence_input = PersistenceInput(
+            bot_data=self._bot_data.exists(),
+            chat_data=self._chat_data.exists(),
+            user_data=self._user_data.exists(),
+            callback_data=False
+        )
+        return persistence_input
+
+
+    def _get_data_type(self,
+            data_type: Literal['user', 'chat', 'bot']
+            ) -> DataType:
+
+        if data_type == 'user':
+            return self._user_data
+
+        elif data_type == 'chat':
+            return self._chat_data
+
+        elif data_type == 'bot':
+            return self._bot_data
+
+        raise ValueError(f'Invalid Data Type: {data_type}')
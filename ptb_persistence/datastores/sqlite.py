@@ -0,0 +1,502 @@
+from .base import BaseDataStore, _remove_ended_conversation
+from .._types import ConversationDict
+from ..instrumentation import log_method
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import (
+    Any,
+    Callable,
+    Literal,
+    Sequence,
+    Tuple,
+    Union
+    )
+
+from telegram.ext import PersistenceInput
+from logging import Logger
+import functools
+import asyncio
+import sqlite3
+import pickle
+import json
+
+
+
+def _encode_conversation_key(key: Tuple[Union[int, str], ...]) -> str:
+    return json.dumps(list(key), separators=(',', ':'))
+
+
+def _decode_conversation_key(key: str) -> Tuple[Union[int, str], ...]:
+    return tuple(json.loads(key))
+
+
+def _dumps(value: object) -> bytes:
+    return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+
+@dataclass
+class DataType:
+    table: str | None = None
+    ignore_keys: list[str] = field(default_factory=list)
+
+
+    def exists(self) -> bool:
+        return self.table is not None
+
+
+    def cleanup_local_data(self, data: dict) -> None:
+        for item in self.ignore_keys:
+            data.pop(item, None)
+
+
+
+@dataclass
+class _WriteBatch:
+    """Statements waiting to be sent together, in order."""
+    future: asyncio.Future
+    statements: list[tuple[str, list[tuple]]] = field(default_factory=list)
+
+
+    def add(self, sql: str, params: tuple) -> None:
+        if self.statements and self.statements[-1][0] == sql:
+            self.statements[-1][1].append(params)
+        else:
+            self.statements.append((sql, [params]))
+
+
+
+class SQLiteDataStore(BaseDataStore):
+
+    def __init__(self,
+            path: str,
+            table_userdata: str | None = None,
+            table_chatdata: str | None = None,
+            table_botdata: str | None = None,
+            table_conversationsdata: str | None = None,
+            ignore_general_keys: list[str] = None,
+            ignore_user_keys: list[str] = None,
+            ignore_chat_keys: list[str] = None,
+            ignore_bot_keys: list[str] = None,
+            busy_timeout: float = 5.0,
+            ) -> None:
+        """
+        A data store implementation for SQLite, for bots running on a single host.
+
+        Each data type has its own table, with the data of an id pickled in one row.
+        The database runs in WAL mode: reads and writes run in two dedicated threads
+        with their own connection, so the event loop is never blocked. Writes made in
+        the same event loop iteration (e.g. by one persistence update) are sent in a
+        single transaction with ``executemany``.
+
+
+        :param path: Path of the database file
+
+        :param table_userdata: Table name (If None, data will not be persisted)
+        :param table_chatdata: Table name (If None, data will not be persisted)
+        :param table_botdata: Table name (If None, data will not be persisted)
+        :param table_conversationsdata: Table name (If None, data will not be persisted)
+
+        :param ignore_general_keys: A list of keys to not persist in the data store.
+                Ex: ['_cache', 'ignored-key'] (Will be applied to all)
+        :param ignore_user_keys: A list of keys to not persist in the user data store
+        :param ignore_chat_keys: A list of keys to not persist in the chat data store
+        :param ignore_bot_keys: A list of keys to not persist in the bot data store
+
+        :param busy_timeout: Time (in seconds) to wait for a lock held by another
+                process using the same database. Defaults to 5 seconds.
+        """
+
+        self._path = path
+        self._busy_timeout = busy_timeout
+
+        ignore_general_keys = ignore_general_keys or []
+        ignore_user_keys = ignore_user_keys or []
+        ignore_chat_keys = ignore_chat_keys or []
+        ignore_bot_keys = ignore_bot_keys or []
+
+        self._user_data = DataType(
+            table=table_userdata,
+            ignore_keys=ignore_general_keys + ignore_user_keys,
+        )
+
+        self._chat_data = DataType(
+            table=table_chatdata,
+            ignore_keys=ignore_general_keys + ignore_chat_keys,
+        )
+
+        self._bot_data = DataType(
+            table=table_botdata,
+            ignore_keys=ignore_general_keys + ignore_bot_keys,
+        )
+
+        self._conversations_data = DataType(
+            table=table_conversationsdata,
+        )
+
+        self._reader: ThreadPoolExecutor | None = None
+        self._writer: ThreadPoolExecutor | None = None
+        self._read_connection: sqlite3.Connection | None = None
+        self._write_connection: sqlite3.Connection | None = None
+
+        self._write_batch: _WriteBatch | None = None
+        self._write_tasks: set[asyncio.Task] = set()
+
+        super().__init__()
+
+
+    async def post_init(self, logger: Logger) -> None:
+        if self._inited:
+            return
+
+        self._writer = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='SQLiteDataStore-writer'
+        )
+        self._reader = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='SQLiteDataStore-reader'
+        )
+
+        # The journal mode is set (and the tables created) before the reader connects.
+        self._write_connection = await self._run(self._writer, self._connect)
+        await self._run(self._writer, self._create_tables)
+        self._read_connection = await self._run(self._reader, self._connect)
+
+        await super().post_init(
+            logger=logger
+        )
+
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(
+            self._path,
+            timeout=self._busy_timeout,
+            check_same_thread=False
+        )
+        connection.execute('PRAGMA journal_mode=WAL')
+        # Durable at each checkpoint, which is enough in WAL mode.
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+
+    def _create_tables(self) -> None:
+        with self._write_connection as connection:
+            for data_type in (self._user_data, self._chat_data, self._bot_data):
+                if not data_type.exists():
+                    continue
+                connection.execute(
+                    f'CREATE TABLE IF NOT EXISTS "{data_type.table}"'
+                    ' (id INTEGER PRIMARY KEY, data BLOB NOT NULL)'
+                )
+
+            if self._conversations_data.exists():
+                # The primary key serves lookups by name and by (name, key).
+                connection.execute(
+                    f'CREATE TABLE IF NOT EXISTS "{self._conversations_data.table}"'
+                    ' (name TEXT NOT NULL, key TEXT NOT NULL, state BLOB NOT NULL,'
+                    ' PRIMARY KEY (name, key)) WITHOUT ROWID'
+                )
+
+
+    async def _run(self, executor: ThreadPoolExecutor, function: Callable, *args: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(
+            executor, functools.partial(function, *args)
+        )
+
+
+    def _check_inited(self) -> None:
+        """Raise RuntimeError if not yet initialized."""
+        if not self._inited:
+            raise RuntimeError(
+                'The DataStore must be initialized before any use.'
+                ' Initialize it with the .post_init(...) method.'
+            )
+
+
+    async def _read(self, sql: str, params: tuple = ()) -> list[tuple]:
+        def _fetch() -> list[tuple]:
+            return self._read_connection.execute(sql, params).fetchall()
+        return await self._run(self._reader, _fetch)
+
+
+    async def _write(self, sql: str, params: tuple) -> None:
+        """
+        Add a statement to the current write batch and wait until it is committed.
+
+        The batch is sent once the calls made in the same event loop iteration
+        have added theirs.
+        """
+        batch = self._write_batch
+        if batch is None:
+            batch = self._write_batch = _WriteBatch(
+                future=asyncio.get_running_loop().create_future()
+            )
+            task = asyncio.create_task(self._send_batch(batch))
+            self._write_tasks.add(task)
+            task.add_done_callback(self._write_tasks.discard)
+
+        batch.add(sql, params)
+        await asyncio.shield(batch.future)
+
+
+    async def _send_batch(self, batch: _WriteBatch) -> None:
+        self._write_batch = None
+
+        def _execute() -> None:
+            with self._write_connection as connection:
+                for sql, rows in batch.statements:
+                    connection.executemany(sql, rows)
+
+        try:
+            await self._run(self._writer, _execute)
+        except BaseException as error:
+            batch.future.set_exception(error)
+            # Retrieved here in case all callers were cancelled.
+            batch.future.exception()
+            if not isinstance(error, Exception):
+                raise
+        else:
+            batch.future.set_result(None)
+
+
+    @log_method
+    async def get_data(self, data_type, data_id: int | None = None) -> dict:
+        self._check_inited()
+
+        data_type = self._get_data_type(data_type)
+        if not data_type.exists():
+            return {}
+
+        if data_id is not None:
+            rows = await self._read(
+                f'SELECT id, data FROM "{data_type.table}" WHERE id = ?', (data_id,)
+            )
+        else:
+            rows = await self._read(
+                f'SELECT id, data FROM "{data_type.table}"'
+            )
+
+        def _decode() -> dict:
+            return {_id: pickle.loads(data) for _id, data in rows}
+        return await self._run(self._reader, _decode)
+
+
+    @log_method
+    async def update_data(self, data_type, data_id: int, local_data: dict) -> None:
+        self._check_inited()
+
+        data_type = self._get_data_type(data_type)
+        if not data_type.exists():
+            return
+
+        local_data = dict(local_data)
+        data_type.cleanup_local_data(local_data)
+
+        await self._write(
+            f'INSERT INTO "{data_type.table}" (id, data) VALUES (?, ?)'
+            ' ON CONFLICT (id) DO UPDATE SET data = excluded.data',
+            (data_id, _dumps(local_data))
+        )
+
+
+    @log_method
+    async def refresh_data(self, data_type, data_id: int, local_data: dict) -> None:
+        await self.refresh_many(
+            data=[(data_type, data_id, local_data)],
+            conversations=[]
+        )
+
+
+    async def refresh_many(
+        self,
+        data: Sequence[
+            Tuple[Literal['user', 'chat', 'bot'], int, dict]
+        ],
+        conversations: Sequence[
+            Tuple[str, Tuple[Union[int, str], ...], ConversationDict]
+        ],
+        ) -> None:
+        self._check_inited()
+
+        queries = []
+        for data_type, data_id, local_data in data:
+            data_type = self._get_data_type(data_type)
+            if data_type.exists():
+                queries.append((
+                    f'SELECT data FROM "{data_type.table}" WHERE id = ?',
+                    (data_id,)
+                ))
+
+        conversations_table = self._conversations_data.table
+        if not self._conversations_data.exists():
+            conversations = []
+        for name, key, local_data in conversations:
+            queries.append((
+                f'SELECT state FROM "{conversations_table}" WHERE name = ? AND key = ?',
+                (name, _encode_conversation_key(key))
+            ))
+
+        if not queries:
+            return
+
+        def _fetch() -> list[object | None]:
+            # One read transaction, so all values come from the same snapshot.
+            with self._read_connection:
+                self._read_connection.execute('BEGIN')
+                rows = [
+                    self._read_connection.execute(sql, params).fetchone()
+                    for sql, params in queries
+                ]
+            return [
+                pickle.loads(row[0]) if row is not None else None
+                for row in rows
+            ]
+
+        values = iter(await self._run(self._reader, _fetch))
+
+        for data_type, data_id, local_data in data:
+            if not self._get_data_type(data_type).exists():
+                continue
+            db_data = next(values)
+            if db_data is None:
+                continue
+            # Synchronize local data object with current data in database.
+            local_data.update(db_data)
+
+        for name, key, local_data in conversations:
+            state = next(values)
+            if state is None:
+                _remove_ended_conversation(local_data, key)
+                continue
+            local_data.update({key: state})
+
+
+    @log_method
+    async def drop_data(self, data_type, data_id: int) -> None:
+        self._check_inited()
+
+        data_type = self._get_data_type(data_type)
+        if not data_type.exists():
+            return
+
+        await self._write(
+            f'DELETE FROM "{data_type.table}" WHERE id = ?',
+            (data_id,)
+        )
+
+
+    @log_method
+    async def get_conversations(self, name: str) -> dict:
+        self._check_inited()
+
+        if not self._conversations_data.exists():
+            return {}
+
+        rows = await self._read(
+            f'SELECT key, state FROM "{self._conversations_data.table}" WHERE name = ?',
+            (name,)
+        )
+
+        def _decode() -> dict:
+            return {
+                _decode_conversation_key(key): pickle.loads(state)
+                for key, state in rows
+            }
+        return await self._run(self._reader, _decode)
+
+
+    @log_method
+    async def refresh_conversation(
+        self,
+        name: str,
+        key: Tuple[Union[int, str], ...],
+        local_data: ConversationDict
+        ) -> None:
+        await self.refresh_many(
+            data=[],
+            conversations=[(name, key, local_data)]
+        )
+
+
+    @log_method
+    async def refresh_conversations(
+        self,
+        conversations: Sequence[
+            Tuple[str, Tuple[Union[int, str], ...], ConversationDict]
+        ],
+        ) -> None:
+        await self.refresh_many(
+            data=[],
+            conversations=conversations
+        )
+
+
+    @log_method
+    async def update_conversation(self,
+            name: str,
+            key: Tuple[Union[int, str], ...],
+            local_state: object | None
+            ) -> None:
+        self._check_inited()
+
+        if not self._conversations_data.exists():
+            return
+
+        table = self._conversations_data.table
+        if local_state is None:
+            # Remove unnecessary data from the table.
+            await self._write(
+                f'DELETE FROM "{table}" WHERE name = ? AND key = ?',
+                (name, _encode_conversation_key(key))
+            )
+        else:
+            await self._write(
+                f'INSERT INTO "{table}" (name, key, state) VALUES (?, ?, ?)'
+                ' ON CONFLICT (name, key) DO UPDATE SET state = excluded.state',
+                (name, _encode_conversation_key(key), _dumps(local_state))
+            )
+
+
+    @log_method
+    async def flush(self) -> None:
+        if self._write_tasks:
+            await asyncio.gather(*self._write_tasks, return_exceptions=True)
+
+        if self._write_connection is not None:
+            await self._run(self._writer, self._write_connection.close)
+            self._write_connection = None
+        if self._read_connection is not None:
+            await self._run(self._reader, self._read_connection.close)
+            self._read_connection = None
+
+        for executor in (self._writer, self._reader):
+            if executor is not None:
+                executor.shutdown(wait=False)
+        self._writer = self._reader = None
+        self._inited = False
+
+
+    def build_persistence_input(self) -> PersistenceInput:
+        persistence_input = PersistenceInput(
+            bot_data=self._bot_data.exists(),
+            chat_data=self._chat_data.exists(),
+            user_data=self._user_data.exists(),
+            callback_data=False
+        )
+        return persistence_input
+
+
+    def _get_data_type(self,
+            data_type: Literal['user', 'chat', 'bot']
+            ) -> DataType:
+
+        if data_type == 'user':
+            return self._user_data
+
+        elif data_type == 'chat':
+            return self._chat_data
+
+        elif data_type == 'bot':
+            return self._bot_data
+
+        raise ValueError(f'Invalid Data Type: {data_type}')
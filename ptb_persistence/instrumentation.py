@@ -0,0 +1,526 @@
+"""
+Instrumentation of the methods of PTBPersistence and of the data stores.
+
+Nothing is measured or formatted for a call unless a hook is installed or the
+logger of the instance has DEBUG enabled:
+
+    from ptb_persistence.instrumentation import MetricsRecorder, add_hook
+
+    recorder = MetricsRecorder()
+    add_hook(recorder)
+    ...
+    recorder.metrics[('MongoDBDataStore', 'refresh_data')].latency.quantile(0.99)
+
+A hook is any callable taking a :class:`MethodCall`, called once every instrumented
+method returns or raises. It runs inline, so it should be quick (e.g. record a
+metric or end a tracing span started at ``MethodCall.started_at``).
+
+Data store calls can also be accounted per update (or any block of code) with
+:func:`account`, and checked against a :class:`QueryBudget`.
+"""
+from .abc import DataStore
+from collections import Counter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import (
+    Any,
+    Callable,
+    Iterator,
+    Literal,
+    Mapping
+    )
+from logging import DEBUG, getLogger, Logger
+import contextlib
+import functools
+import itertools
+import bisect
+import inspect
+import reprlib
+import pickle
+import time
+import sys
+
+
+
+Hook = Callable[['MethodCall'], None]
+
+_hooks: list[Hook] = []
+
+
+def add_hook(hook: Hook) -> None:
+    """Call ``hook`` after every instrumented method call."""
+    if hook not in _hooks:
+        _hooks.append(hook)
+
+
+def remove_hook(hook: Hook) -> None:
+    if hook in _hooks:
+        _hooks.remove(hook)
+
+
+# Arguments holding the data of a single entry, and of several entries.
+_ENTRY_ARGUMENTS = ('local_data', 'local_state', 'data', 'user_data', 'chat_data', 'bot_data')
+_ENTRY_ID_ARGUMENTS = ('data_id', 'user_id', 'chat_id', 'key')
+_BATCH_ARGUMENTS = ('data', 'conversations')
+
+
+
+def _estimate_size(value: object) -> int:
+    try:
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return sys.getsizeof(value)
+
+
+def _is_batch(value: object) -> bool:
+    """Whether ``value`` is a sequence of (type or name, id or key, local data) entries."""
+    return (
+        isinstance(value, (list, tuple)) and
+        all(isinstance(entry, tuple) and len(entry) == 3 for entry in value)
+    )
+
+
+
+@dataclass
+class MethodCall:
+    component: str
+    method: str
+    # time.time() when the call started, and its duration in seconds.
+    started_at: float
+    duration: float
+    result: Any = None
+    error: BaseException | None = None
+    signature: inspect.Signature | None = field(default=None, repr=False)
+    args: tuple = field(default=(), repr=False)
+    kwargs: dict = field(default_factory=dict, repr=False)
+
+
+    @functools.cached_property
+    def arguments(self) -> dict[str, Any]:
+        """The arguments of the call by name, without self."""
+        if self.signature is None:
+            return dict(self.kwargs)
+        bound = self.signature.bind_partial(None, *self.args, **self.kwargs)
+        arguments = dict(bound.arguments)
+        arguments.pop(next(iter(self.signature.parameters)), None)
+        return arguments
+
+
+    def _payload(self) -> object:
+        if self.method.startswith('get_'):
+            return self.result
+
+        arguments = self.arguments
+        if 'name' in arguments and 'key' in arguments and 'local_data' in arguments:
+            # Only the state of this conversation, not every conversation of the handler.
+            return arguments['local_data'].get(arguments['key'])
+
+        batches = [name for name in _BATCH_ARGUMENTS if _is_batch(arguments.get(name))]
+        if batches:
+            return [
+                local_data.get(key) if name == 'conversations' else local_data
+                for name in batches
+                for _, key, local_data in arguments[name]
+            ]
+
+        for name in _ENTRY_ARGUMENTS:
+            if name in arguments:
+                return arguments[name]
+        return None
+
+
+    def documents(self) -> int:
+        """
+        The number of entries read or written: the size of the result of get methods,
+        the number of entries of batch refreshes and 1 for methods about one entry.
+        """
+        if self.method.startswith('get_'):
+            if isinstance(self.result, Mapping):
+                return len(self.result)
+            return int(self.result is not None)
+
+        batches = [
+            self.arguments[name]
+            for name in _BATCH_ARGUMENTS
+            if _is_batch(self.arguments.get(name))
+        ]
+        if batches:
+            return sum(map(len, batches))
+
+        if any(name in self.arguments for name in _ENTRY_ID_ARGUMENTS + _ENTRY_ARGUMENTS):
+            return 1
+        return 0
+
+
+    def payload_bytes(self) -> int:
+        """Estimated (pickled) size of the data read or written. Costs a pickle.dumps."""
+        payload = self._payload()
+        if payload is None:
+            return 0
+        return _estimate_size(payload)
+
+
+
+class LatencyHistogram:
+    """Counts of durations in buckets growing exponentially from 50 µs to about 100 s."""
+
+    BOUNDS: tuple[float, ...] = tuple(
+        0.00005 * 2 ** exponent for exponent in range(22)
+    )
+
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+
+    def record(self, duration: float) -> None:
+        self.counts[bisect.bisect_left(self.BOUNDS, duration)] += 1
+        self.count += 1
+        self.total += duration
+        if duration > self.max:
+            self.max = duration
+
+
+    def mean(self) -> float | None:
+        return self.total / self.count if self.count else None
+
+
+    def quantile(self, q: float) -> float | None:
+        """The upper bound of the bucket holding the ``q`` quantile (e.g. 0.99)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        for bound, seen in zip(self.BOUNDS, itertools.accumulate(self.counts)):
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+    def __repr__(self) -> str:
+        return (
+            f'{type(self).__name__}(count={self.count}, mean={self.mean()},'
+            f' p50={self.quantile(0.5)}, p99={self.quantile(0.99)}, max={self.max})'
+        )
+
+
+
+@dataclass
+class MethodMetrics:
+    latency: LatencyHistogram = field(default_factory=LatencyHistogram)
+    calls: int = 0
+    errors: int = 0
+    documents: int = 0
+    payload_bytes: int = 0
+
+
+
+class MetricsRecorder:
+    """
+    A hook keeping :class:`MethodMetrics` per (component, method).
+
+    :param payload_sizes: If False, payload sizes are not measured, which saves
+            pickling the data of every call. Defaults to True.
+    """
+
+    def __init__(self, payload_sizes: bool = True) -> None:
+        self.payload_sizes = payload_sizes
+        self.metrics: dict[tuple[str, str], MethodMetrics] = {}
+
+
+    def __call__(self, call: MethodCall) -> None:
+        metrics = self.metrics.get((call.component, call.method))
+        if metrics is None:
+            metrics = self.metrics[(call.component, call.method)] = MethodMetrics()
+
+        metrics.calls += 1
+        metrics.latency.record(call.duration)
+        if call.error is not None:
+            metrics.errors += 1
+            return
+
+        metrics.documents += call.documents()
+        if self.payload_sizes:
+            metrics.payload_bytes += call.payload_bytes()
+
+
+    def reset(self) -> None:
+        self.metrics.clear()
+
+
+
+@dataclass(frozen=True)
+class QueryBudget:
+    """
+    Limits on the data store calls made while processing one update.
+
+    :param max_operations: Maximum number of data store calls. Defaults to None.
+    :param max_bytes: Maximum estimated size of the data read and written. Defaults to None.
+    :param max_store_time: Maximum time (in seconds) spent in data store calls. Defaults to None.
+    :param action: 'log' to log a warning (once per update), or 'raise' to raise
+            :class:`QueryBudgetExceeded` from every data store call over the budget, which
+            then reaches the error handlers like any error of a handler. Defaults to 'log'.
+    """
+    max_operations: int | None = None
+    max_bytes: int | None = None
+    max_store_time: float | None = None
+    action: Literal['log', 'raise'] = 'log'
+
+
+    def __post_init__(self) -> None:
+        if self.action not in ('log', 'raise'):
+            raise ValueError(f'Invalid action: {self.action}')
+
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised by a data store call that made an update go over its :class:`QueryBudget`."""
+
+    def __init__(self, accounting: 'UpdateAccounting', reasons: list[str]) -> None:
+        super().__init__('Query budget exceeded: ' + ', '.join(reasons))
+        self.accounting = accounting
+        self.reasons = reasons
+
+
+
+@dataclass
+class UpdateAccounting:
+    """
+    The data store calls made while processing one update.
+
+    Calls made by a data store method itself (e.g. refresh_data calling
+    refresh_many) are counted once, as the outer call.
+    """
+    budget: QueryBudget | None = None
+    operations: int = 0
+    documents: int = 0
+    # Estimated (pickled) size of the data read and written.
+    bytes_in: int = 0
+    bytes_out: int = 0
+    # Time spent in data store calls, in seconds. Concurrent calls add up.
+    store_time: float = 0.0
+    # Number of calls per method, e.g. {'refresh_data': 2}.
+    calls: Counter = field(default_factory=Counter)
+    exceeded: bool = False
+
+
+    def record(self, call: MethodCall, logger: Logger | None) -> None:
+        self.operations += 1
+        self.calls[call.method] += 1
+        self.store_time += call.duration
+        if call.error is None:
+            self.documents += call.documents()
+            if call.method.startswith(('get_', 'refresh_')):
+                self.bytes_in += call.payload_bytes()
+            else:
+                self.bytes_out += call.payload_bytes()
+
+        reasons = self._over_budget()
+        if not reasons:
+            return
+
+        if self.budget.action == 'raise':
+            self.exceeded = True
+            # Do not hide the error of the call itself.
+            if call.error is None:
+                raise QueryBudgetExceeded(self, reasons)
+        elif not self.exceeded:
+            self.exceeded = True
+            (logger or getLogger(__name__)).warning(
+                'Query budget exceeded (%s) by %s.%s: %r',
+                ', '.join(reasons), call.component, call.method, self
+            )
+
+
+    def _over_budget(self) -> list[str]:
+        budget = self.budget
+        if budget is None:
+            return []
+
+        reasons = []
+        if budget.max_operations is not None and self.operations > budget.max_operations:
+            reasons.append(f'{self.operations} > {budget.max_operations} operations')
+        if budget.max_bytes is not None and self.bytes_in + self.bytes_out > budget.max_bytes:
+            reasons.append(f'{self.bytes_in + self.bytes_out} > {budget.max_bytes} bytes')
+        if budget.max_store_time is not None and self.store_time > budget.max_store_time:
+            reasons.append(f'{self.store_time:.4f} > {budget.max_store_time} seconds')
+        return reasons
+
+
+
+_accounting: ContextVar[UpdateAccounting | None] = ContextVar('_accounting', default=None)
+# Whether the current task is inside an accounted data store call.
+_in_store_call: ContextVar[bool] = ContextVar('_in_store_call', default=False)
+
+
+def current_accounting() -> UpdateAccounting | None:
+    """
+    The accounting of the update being processed, e.g. from a handler or an error
+    handler, or None if accounting is disabled.
+    """
+    return _accounting.get()
+
+
+@contextlib.contextmanager
+def account(budget: QueryBudget | None = None) -> Iterator[UpdateAccounting]:
+    """
+    Account for the data store calls made in this block, and in the tasks it creates.
+
+        with account(budget=QueryBudget(max_operations=3)) as accounting:
+            await application.process_update(update)
+        accounting.operations
+    """
+    accounting = UpdateAccounting(budget=budget)
+    token = _accounting.set(accounting)
+    try:
+        yield accounting
+    finally:
+        _accounting.reset(token)
+
+
+
+class _Repr(reprlib.Repr):
+    """A reprlib.Repr that also truncates dict subclasses, without sorting their keys."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.maxlevel = 3
+        self.maxdict = 10
+        self.maxlist = 10
+        self.maxtuple = 10
+        self.maxset = 10
+        self.maxstring = 100
+        self.maxother = 100
+
+
+    def repr1(self, x: object, level: int) -> str:
+        if isinstance(x, dict) and type(x) is not dict:
+            if getattr(x, 'loaded', lambda: True)() is False:
+                # A LazyDocument, do not decode it for a log line.
+                return repr(x)
+            return f'{type(x).__name__}({self.repr_dict(x, level)})'
+        return super().repr1(x, level)
+
+
+    def repr_dict(self, x: dict, level: int) -> str:
+        if not x:
+            return '{}'
+        if level <= 0:
+            return '{...}'
+        pieces = [
+            f'{self.repr1(key, level - 1)}: {self.repr1(value, level - 1)}'
+            for key, value in itertools.islice(x.items(), self.maxdict)
+        ]
+        if len(x) > self.maxdict:
+            pieces.append('...')
+        return '{' + ', '.join(pieces) + '}'
+
+
+_repr = _Repr()
+
+
+
+class _Truncated:
+    """Formats ``value`` with a truncated repr, only if the log record is emitted."""
+
+    __slots__ = ('value',)
+
+    def __init__(self, value: object) -> None:
+        self.value = value
+
+
+    def __str__(self) -> str:
+        return _repr.repr(self.value)
+
+
+
+def log_method(method):
+    """
+    Instrument an async method of an object with a ``_logger`` attribute.
+
+    With DEBUG enabled on that logger, the arguments and result of every call are
+    logged, truncated. Installed hooks are called with a :class:`MethodCall`.
+    """
+    method_name: str = method.__name__
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        logger = self._logger
+        debug = logger is not None and logger.isEnabledFor(DEBUG)
+        accounting = _accounting.get()
+        if not _hooks and not debug and accounting is None:
+            return await method(self, *args, **kwargs)
+
+        component = type(self).__name__
+        if debug:
+            logger.debug(
+                '%s: Calling %r method. Args: %s Kwargs: %s',
+                component, method_name, _Truncated(args), _Truncated(kwargs)
+            )
+
+        accounted = (
+            accounting is not None and
+            isinstance(self, DataStore) and
+            not _in_store_call.get()
+        )
+        if accounted:
+            token = _in_store_call.set(True)
+
+        started_at = time.time()
+        start = time.perf_counter()
+        result = error = None
+        try:
+            result = await method(self, *args, **kwargs)
+            return result
+        except BaseException as exception:
+            error = exception
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            if accounted:
+                _in_store_call.reset(token)
+
+            if debug:
+                if error is None:
+                    logger.debug(
+                        '%s: Result of %r method: %s (Elapsed Time: %.4f seconds)',
+                        component, method_name, _Truncated(result), duration
+                    )
+                else:
+                    logger.debug(
+                        '%s: %r method raised %r (Elapsed Time: %.4f seconds)',
+                        component, method_name, error, duration
+                    )
+
+            if _hooks or accounted:
+                call = MethodCall(
+                    component=component,
+                    method=method_name,
+                    started_at=started_at,
+                    duration=duration,
+                    result=result,
+                    error=error,
+                    signature=signature,
+                    args=args,
+                    kwargs=kwargs
+                )
+                if _hooks:
+                    _call_hooks(call)
+                if accounted:
+                    # May raise QueryBudgetExceeded.
+                    accounting.record(call, logger)
+
+    return wrapper
+
+
+def _call_hooks(call: MethodCall) -> None:
+    for hook in tuple(_hooks):
+        try:
+            hook(call)
+        except Exception:
+            getLogger(__name__).exception(
+                f'Instrumentation hook {hook!r} failed.'
+            )
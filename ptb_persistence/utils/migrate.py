@@ -0,0 +1,61 @@
+"""
+One-shot data migrations.
+
+Usage:
+python -m ptb_persistence.utils.migrate conversation-keys \
+    --uri mongodb://localhost:27017 --database <name> --collection <name>
+"""
+from ..datastores.mongodb import MongoDBDataStore
+from logging import getLogger
+import argparse
+import asyncio
+import logging
+
+
+
+async def migrate_conversation_keys(uri: str, database: str, collection: str) -> int:
+    data_store = MongoDBDataStore(
+        client_or_uri=uri,
+        database=database,
+        collection_conversationsdata=collection
+    )
+    await data_store.post_init(
+        logger=getLogger(__name__)
+    )
+    try:
+        return await data_store.migrate_conversation_keys()
+    finally:
+        await data_store.flush()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog='python -m ptb_persistence.utils.migrate'
+    )
+    subparsers = parser.add_subparsers(dest='migration', required=True)
+
+    conversation_keys = subparsers.add_parser(
+        'conversation-keys',
+        help='Convert conversation keys stored as str(key) to BSON arrays (MongoDB).'
+    )
+    conversation_keys.add_argument('--uri', required=True)
+    conversation_keys.add_argument('--database', required=True)
+    conversation_keys.add_argument('--collection', required=True)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.migration == 'conversation-keys':
+        migrated = asyncio.run(
+            migrate_conversation_keys(
+                uri=args.uri,
+                database=args.database,
+                collection=args.collection
+            )
+        )
+        print(f'Migrated {migrated} conversations.')
+
+
+
+if __name__ == '__main__':
+    main()
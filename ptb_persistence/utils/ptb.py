@@ -2,32 +2,38 @@ from telegram import Update
 from telegram.ext import (
     ExtBot,
     Application,
+    CallbackContext,
     ConversationHandler,
     ApplicationHandlerStop
     )
-from telegram.ext._application import (
-    _logger
-)
+try:
+    from telegram.ext._application import (
+        _LOGGER as _logger
+    )
+except ImportError:  # Older python-telegram-bot versions
+    from telegram.ext._application import (
+        _logger
+    )
 from telegram._utils.defaultvalue import (
     DEFAULT_TRUE
 )
+from types import MappingProxyType
 from typing import Coroutine
 
 from .. import PTBPersistence
+from .._types import ConversationKey
 
 
 
-async def _refresh_conversation_data(
+def _get_conversation_key(
         update: Update,
-        application: Application,
         handler: ConversationHandler
-        ) -> None:
+        ) -> ConversationKey | None:
+    """The conversation key of ``update`` for ``handler``, or None if it has none."""
     
     if (
         not isinstance(update, Update) or
-        not isinstance(application, Application) or
         not isinstance(handler, ConversationHandler) or
-        not isinstance(application.persistence, PTBPersistence) or
         not handler.persistent
         ):
         return None
@@ -45,18 +51,137 @@ async def _refresh_conversation_data(
         return None
     
 
-    key = handler._get_key(update)
+    assert handler.name, 'The handler needs a name'
+
+    return handler._get_key(update)
+
+
+async def _refresh_update(
+        update: object,
+        application: Application
+        ) -> set[str]:
+    """
+    Refresh the state of ``update`` in every persistent ConversationHandler, along with
+    the bot data and the user/chat data already in memory, with a single data store
+    call, before the handlers check the update.
+
+    Returns the data types refreshed ('user', 'chat', 'bot'). Nothing is refreshed if
+    the update has no conversation and no user/chat data in memory.
+    """
+    if (
+        not isinstance(update, Update) or
+        not isinstance(application.persistence, PTBPersistence)
+        ):
+        return set()
+
+    conversations = []
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            key = _get_conversation_key(
+                update=update,
+                handler=handler
+            )
+            if key is None:
+                continue
+            conversations.append(
+                (handler.name, key, handler._conversations)
+            )
 
     persistence: PTBPersistence = application.persistence
-    
-    assert handler.name, 'The handler needs a name'
 
-    await persistence.refresh_conversation(
-        name=handler.name,
-        key=key,
-        conversations_data=handler._conversations
+    # Entries are not created here: if no handler matches the update, there is
+    # nothing to keep for it in memory.
+    user_id = update.effective_user.id if update.effective_user else None
+    if user_id not in application._user_data or not persistence.store_data.user_data:
+        user_id = None
+    chat_id = update.effective_chat.id if update.effective_chat else None
+    if chat_id not in application._chat_data or not persistence.store_data.chat_data:
+        chat_id = None
+
+    if not conversations and user_id is None and chat_id is None:
+        return set()
+
+    await persistence.refresh_many(
+        user_id=user_id,
+        user_data=(
+            application._user_data[user_id]
+            if user_id is not None else None
+        ),
+        chat_id=chat_id,
+        chat_data=(
+            application._chat_data[chat_id]
+            if chat_id is not None else None
+        ),
+        bot_data=application.bot_data,
+        conversations=conversations
     )
 
+    refreshed = {'bot'}
+    if user_id is not None:
+        refreshed.add('user')
+    if chat_id is not None:
+        refreshed.add('chat')
+    return refreshed
+
+
+async def _refresh_context_data(
+        context: CallbackContext,
+        application: Application,
+        refreshed: set[str]
+        ) -> None:
+    """
+    Refresh the user, chat and bot data of ``context`` not ``refreshed`` by
+    :func:`_refresh_update` with a single data store call. Called once a handler
+    matched the update, as ``context.refresh_data()`` is.
+    """
+    if not isinstance(application.persistence, PTBPersistence):
+        return await context.refresh_data()
+
+    persistence: PTBPersistence = application.persistence
+
+    user_id = context._user_id if 'user' not in refreshed else None
+    chat_id = context._chat_id if 'chat' not in refreshed else None
+    if user_id is None and chat_id is None and 'bot' in refreshed:
+        return
+
+    # A handler matched: the user/chat data entries may be created, as PTB does.
+    await persistence.refresh_many(
+        user_id=user_id,
+        user_data=(
+            context.user_data
+            if user_id is not None and persistence.store_data.user_data else None
+        ),
+        chat_id=chat_id,
+        chat_data=(
+            context.chat_data
+            if chat_id is not None and persistence.store_data.chat_data else None
+        ),
+        bot_data=context.bot_data if 'bot' not in refreshed else None
+    )
+
+
+def _install_bounded_data(application: Application) -> None:
+    """Replace the user/chat data mappings by bounded ones, if configured."""
+    persistence: PTBPersistence = application.persistence
+
+    user_data = persistence.build_data_mapping(
+        data_type='user',
+        default_factory=application.context_types.user_data
+    )
+    if user_data is not None:
+        user_data.update(application._user_data)
+        application._user_data = user_data
+        application.user_data = MappingProxyType(user_data)
+
+    chat_data = persistence.build_data_mapping(
+        data_type='chat',
+        default_factory=application.context_types.chat_data
+    )
+    if chat_data is not None:
+        chat_data.update(application._chat_data)
+        application._chat_data = chat_data
+        application.chat_data = MappingProxyType(chat_data)
+
 
 async def _process_update(self: Application, update: object) -> None:
     """Processes a single update and marks the update to be updated by the persistence later.
@@ -81,28 +206,33 @@ async def _process_update(self: Application, update: object) -> None:
     context = None
     any_blocking = False  # Flag which is set to True if any handler specifies block=True
 
+    # [ Modified part ]
+    refreshed = set()
+    try:
+        refreshed = await _refresh_update(
+            update=update,
+            application=self
+            )
+    except Exception as exc:
+        if await self.process_error(update=update, error=exc):
+            _logger.debug("Error handler stopped further handlers.")
+            return
+    # [ Ends Modified part ]
+
     for handlers in self.handlers.values():
         try:
             for handler in handlers:
-
-                # [ Modified part ]
-                if (
-                    isinstance(self.persistence, PTBPersistence) and
-                    isinstance(handler, ConversationHandler) and
-                    handler.persistent
-                    ):
-                    await _refresh_conversation_data(
-                        update=update,
-                        application=self,
-                        handler=handler
-                        )
-                # [ Ends Modified part ]
-
                 check = handler.check_update(update)  # Should the handler handle this update?
                 if not (check is None or check is False):  # if yes,
                     if not context:  # build a context if not already built
                         context = self.context_types.context.from_update(update, self)
-                        await context.refresh_data()
+                        # [ Modified part ]
+                        await _refresh_context_data(
+                            context=context,
+                            application=self,
+                            refreshed=refreshed
+                        )
+                        # [ Ends Modified part ]
                     coroutine: Coroutine = handler.handle_update(update, self, check, context)
 
                     if not handler.block or (  # if handler is running with block=False,
@@ -170,11 +300,55 @@ application = Application.builder().application_class(CustomApplication).token("
 # Another very important point: In the PTB ConversationHandler class,
 # you must define the parameters persistent=True and name='<any-name-here>'.
 # Example: ConversationHandler(..., persistent=True, name='my-handler')
+#
+# CustomApplication is also required to bound the in-memory user/chat data
+# (PTBPersistence(..., max_user_data_entries=...)), to receive the changes
+# watched by the data store (MongoDBDataStore(..., watch_changes=True)) and to
+# account for the data store calls of each update (PTBPersistence(..., query_budget=...)).
 """
 class CustomApplication(Application):
-    async def process_update(self, update: object) -> None:
-        return await _process_update(
-            self=self,
-            update=update
+    async def initialize(self) -> None:
+        if self._initialized or not isinstance(self.persistence, PTBPersistence):
+            return await super().initialize()
+
+        _install_bounded_data(application=self)
+        await super().initialize()
+
+        # After loading, the data store catches up with changes made meanwhile.
+        await self.persistence.watch(
+            user_data=self._user_data,
+            chat_data=self._chat_data,
+            bot_data=self.bot_data,
+            conversations=self._conversation_handler_conversations
         )
+
+
+    async def process_update(self, update: object) -> None:
+        if not isinstance(self.persistence, PTBPersistence):
+            return await _process_update(
+                self=self,
+                update=update
+            )
+
+        # Handlers run with block=False and error handlers are tasks created in
+        # this context, so they are accounted for this update too.
+        with self.persistence.account_update():
+            return await _process_update(
+                self=self,
+                update=update
+            )
+
+
+    async def update_persistence(self) -> None:
+        await super().update_persistence()
+
+        if isinstance(self.persistence, PTBPersistence):
+            await self.persistence.evict_data(
+                data_type='user',
+                ids_to_update=self._user_ids_to_be_updated_in_persistence
+            )
+            await self.persistence.evict_data(
+                data_type='chat',
+                ids_to_update=self._chat_ids_to_be_updated_in_persistence
+            )
     
@@ -1,13 +1,16 @@
 import pytest_asyncio
-import config
 
 from motor.motor_asyncio import AsyncIOMotorClient
 
+try:
+    import config
+except ImportError:  # Only the MongoDB tests need it
+    config = None
+
 _motor_client = AsyncIOMotorClient(
     config.MONGO_DB_URI
-    )
+    ) if config is not None else None
 
 @pytest_asyncio.fixture()
 async def motor_client():
     return _motor_client
-
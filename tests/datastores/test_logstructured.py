@@ -0,0 +1,262 @@
+from ptb_persistence.datastores.logstructured import LogStructuredDataStore
+from telegram.ext import PersistenceInput
+import asyncio
+import pytest
+import os
+
+import logging
+
+
+logger = logging.getLogger(name='PTBPersistence')
+
+
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+
+
+async def test_update_refresh_and_drop_data(tmp_path):
+
+    data_store = LogStructuredDataStore(
+        directory=str(tmp_path),
+        ignore_general_keys=['_cache']
+    )
+    await data_store.post_init(logger=logger)
+
+    await data_store.update_data(
+        data_type='user',
+        data_id=12345678,
+        local_data={'a': 1, '_cache': 1}
+    )
+    await data_store.update_data(
+        data_type='user',
+        data_id=12345678,
+        local_data={'a': 2}
+    )
+
+    local_user_data = {'unsaved': True}
+    await data_store.refresh_data(
+        data_type='user',
+        data_id=12345678,
+        local_data=local_user_data
+    )
+    assert local_user_data == {'a': 2, 'unsaved': True}
+
+    await data_store.drop_data(
+        data_type='user',
+        data_id=12345678
+    )
+    assert await data_store.get_data(data_type='user') == {}
+
+    await data_store.flush()
+
+
+async def test_conversations(tmp_path):
+
+    data_store = LogStructuredDataStore(
+        directory=str(tmp_path)
+    )
+    await data_store.post_init(logger=logger)
+
+    await data_store.update_conversation(
+        name='chatconv',
+        key=(12345678, 'inline'),
+        local_state=1
+    )
+
+    conversations_data = {}
+    await data_store.refresh_conversation(
+        name='chatconv',
+        key=(12345678, 'inline'),
+        local_data=conversations_data
+    )
+    assert conversations_data == {(12345678, 'inline'): 1}
+
+    await data_store.update_conversation(
+        name='chatconv',
+        key=(12345678, 'inline'),
+        local_state=None
+    )
+    assert await data_store.get_conversations(name='chatconv') == {}
+
+    await data_store.flush()
+
+
+async def test_restart_loads_hint_files(tmp_path):
+
+    data_store = LogStructuredDataStore(
+        directory=str(tmp_path)
+    )
+    await data_store.post_init(logger=logger)
+    await asyncio.gather(*(
+        data_store.update_data(
+            data_type='chat',
+            data_id=-chat_id,
+            local_data={'chat_id': -chat_id}
+        )
+        for chat_id in range(100)
+    ))
+    await data_store.update_conversation(
+        name='chatconv',
+        key=(1, 1),
+        local_state='state'
+    )
+    await data_store.flush()
+
+    assert any(name.endswith('.hint') for name in os.listdir(tmp_path))
+
+    data_store = LogStructuredDataStore(
+        directory=str(tmp_path)
+    )
+    await data_store.post_init(logger=logger)
+
+    data = await data_store.get_data(data_type='chat')
+    assert len(data) == 100
+    assert data[-42] == {'chat_id': -42}
+    assert await data_store.get_conversations(name='chatconv') == {(1, 1): 'state'}
+
+    await data_store.flush()
+
+
+async def test_restart_after_torn_write(tmp_path):
+
+    data_store = LogStructuredDataStore(
+        directory=str(tmp_path)
+    )
+    await data_store.post_init(logger=logger)
+    await data_store.update_data(
+        data_type='bot',
+        data_id=1,
+        local_data={'a': 1}
+    )
+    # Crash: no hint file is written and the last record is incomplete.
+    segment_path = data_store._active.path
+    segment_size = data_store._active.size
+    data_store._active_file.write(b'\x00' * 7)
+    data_store._active_file.close()
+
+    data_store = LogStructuredDataStore(
+        directory=str(tmp_path)
+    )
+    await data_store.post_init(logger=logger)
+
+    assert await data_store.get_data(data_type='bot') == {1: {'a': 1}}
+    assert os.path.getsize(segment_path) == segment_size
+
+    await data_store.update_data(
+        data_type='bot',
+        data_id=1,
+        local_data={'a': 2}
+    )
+    assert await data_store.get_data(data_type='bot') == {1: {'a': 2}}
+
+    await data_store.flush()
+
+
+async def test_compaction(tmp_path):
+
+    data_store = LogStructuredDataStore(
+        directory=str(tmp_path),
+        segment_size=4096,
+        compaction_min_size=0
+    )
+    await data_store.post_init(logger=logger)
+
+    for version in range(50):
+        await asyncio.gather(*(
+            data_store.update_data(
+                data_type='user',
+                data_id=user_id,
+                local_data={'version': version, 'padding': 'x' * 100}
+            )
+            for user_id in range(10)
+        ))
+        await asyncio.sleep(0)
+    await data_store.drop_data(
+        data_type='user',
+        data_id=9
+    )
+    while data_store._compaction_task is not None:
+        await asyncio.sleep(0.01)
+
+    data = await data_store.get_data(data_type='user')
+    assert sorted(data) == list(range(9))
+    assert all(user_data['version'] == 49 for user_data in data.values())
+
+    total_size = sum(
+        os.path.getsize(tmp_path / name)
+        for name in os.listdir(tmp_path)
+        if name.endswith('.log')
+    )
+    # 500 writes of about 150 bytes each.
+    assert total_size < 50 * 10 * 150 / 2
+
+    await data_store.flush()
+
+    data_store = LogStructuredDataStore(
+        directory=str(tmp_path)
+    )
+    await data_store.post_init(logger=logger)
+    assert await data_store.get_data(data_type='user') == data
+    await data_store.flush()
+
+
+async def test_batches_in_flight_roll_over_once(tmp_path):
+
+    data_store = LogStructuredDataStore(
+        directory=str(tmp_path),
+        segment_size=2048,
+        compaction_min_size=1024 * 1024
+    )
+    await data_store.post_init(logger=logger)
+
+    async def write(user_id: int) -> None:
+        # Spread over event loop iterations, so that batches are sent while
+        # others are in the writer thread.
+        for _ in range(user_id % 7):
+            await asyncio.sleep(0)
+        await data_store.update_data(
+            data_type='user',
+            data_id=user_id,
+            local_data={'padding': 'x' * 200}
+        )
+        # Read back from the active segment, which keeps growing.
+        assert await data_store.get_data(data_type='user', data_id=user_id) == {
+            user_id: {'padding': 'x' * 200}
+        }
+
+    for start in range(0, 200, 40):
+        await asyncio.gather(*(write(user_id) for user_id in range(start, start + 40)))
+
+    closed = [
+        segment for segment in data_store._segments.values()
+        if segment is not data_store._active
+    ]
+    assert len(closed) > 1
+    # Each was filled up before the next one was started.
+    assert all(segment.size >= 2048 for segment in closed)
+    assert not any(segment.appending for segment in closed)
+
+    await data_store.flush()
+
+    data_store = LogStructuredDataStore(
+        directory=str(tmp_path)
+    )
+    await data_store.post_init(logger=logger)
+    assert sorted(await data_store.get_data(data_type='user')) == list(range(200))
+    await data_store.flush()
+
+
+async def test_build_persistence_input(tmp_path):
+
+    data_store = LogStructuredDataStore(
+        directory=str(tmp_path),
+        store_bot_data=False
+    )
+    await data_store.post_init(logger=logger)
+
+    result = data_store.build_persistence_input()
+
+    assert isinstance(result, PersistenceInput)
+    assert result.bot_data is False
+
+    await data_store.flush()
@@ -0,0 +1,268 @@
+from ptb_persistence.datastores.memory import MemoryDataStore, MemoryStorage
+from ptb_persistence.instrumentation import account
+from telegram.ext import PersistenceInput
+from telegram.ext._utils.trackingdict import TrackingDict
+import pytest
+import time
+
+import logging
+
+
+logger = logging.getLogger(name='PTBPersistence')
+
+
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+
+
+async def test_update_and_get_data():
+
+    data_store = MemoryDataStore()
+    await data_store.post_init(logger=logger)
+
+    local_user_data = {'my_key': 'value of my key'}
+    result = await data_store.update_data(
+        data_type='user',
+        data_id=12345678,
+        local_data=local_user_data
+    )
+    assert result is None
+
+    # Stored as a copy.
+    local_user_data['my_key'] = 'changed'
+
+    data = await data_store.get_data(
+        data_type='user'
+    )
+    assert data == {
+        12345678: {'my_key': 'value of my key'}
+    }
+
+
+async def test_refresh_data():
+
+    data_store = MemoryDataStore()
+    await data_store.post_init(logger=logger)
+
+    await data_store.update_data(
+        data_type='chat',
+        data_id=-100,
+        local_data={'a': 1}
+    )
+
+    local_chat_data = {'unsaved': True}
+    result = await data_store.refresh_data(
+        data_type='chat',
+        data_id=-100,
+        local_data=local_chat_data
+    )
+
+    assert result is None
+    assert local_chat_data == {'a': 1, 'unsaved': True}
+
+
+async def test_drop_data():
+
+    data_store = MemoryDataStore()
+    await data_store.post_init(logger=logger)
+
+    await data_store.update_data(
+        data_type='user',
+        data_id=12345678,
+        local_data={'a': 1}
+    )
+    drop_result = await data_store.drop_data(
+        data_type='user',
+        data_id=12345678
+    )
+    assert drop_result is None
+
+    data_found = await data_store.get_data(
+        data_type='user',
+        data_id=12345678
+    )
+    assert data_found == {}
+
+
+async def test_ignore_keys():
+
+    data_store = MemoryDataStore(
+        ignore_general_keys=['_cache'],
+        ignore_user_keys=['_session']
+    )
+    await data_store.post_init(logger=logger)
+
+    await data_store.update_data(
+        data_type='user',
+        data_id=12345678,
+        local_data={'a': 1, '_cache': 1, '_session': 1}
+    )
+    await data_store.update_data(
+        data_type='bot',
+        data_id=1,
+        local_data={'b': 1, '_cache': 1, '_session': 1}
+    )
+
+    assert await data_store.get_data(data_type='user') == {
+        12345678: {'a': 1}
+    }
+    assert await data_store.get_data(data_type='bot') == {
+        1: {'b': 1, '_session': 1}
+    }
+
+
+async def test_conversations():
+
+    data_store = MemoryDataStore()
+    await data_store.post_init(logger=logger)
+
+    await data_store.update_conversation(
+        name='chatconv',
+        key=(12345678, 12345678),
+        local_state=1
+    )
+
+    conversations_data = {}
+    await data_store.refresh_conversation(
+        name='chatconv',
+        key=(12345678, 12345678),
+        local_data=conversations_data
+    )
+    assert conversations_data == {
+        (12345678, 12345678): 1
+    }
+    assert await data_store.get_conversations(name='chatconv') == {
+        (12345678, 12345678): 1
+    }
+
+    await data_store.update_conversation(
+        name='chatconv',
+        key=(12345678, 12345678),
+        local_state=None
+    )
+    assert await data_store.get_conversations(name='chatconv') == {}
+
+
+async def test_refresh_conversations():
+
+    # MemoryDataStore refreshes them one by one, as BaseDataStore does.
+    data_store = MemoryDataStore()
+    await data_store.post_init(logger=logger)
+
+    await data_store.update_conversation(name='order', key=(1, 1), local_state=1)
+    await data_store.update_conversation(name='order', key=(2, 2), local_state=2)
+    await data_store.update_conversation(name='support', key=(1,), local_state='open')
+
+    order = {}
+    support = {}
+    with account() as accounting:
+        await data_store.refresh_conversations([
+            ('order', (1, 1), order),
+            ('order', (2, 2), order),
+            ('support', (1,), support),
+            ('support', (9,), support),
+        ])
+
+    assert order == {(1, 1): 1, (2, 2): 2}
+    assert support == {(1,): 'open'}
+    assert accounting.calls == {'refresh_conversation': 4}
+
+
+async def test_shared_storage():
+
+    storage = MemoryStorage()
+    worker_a = MemoryDataStore(storage=storage)
+    worker_b = MemoryDataStore(storage=storage)
+    await worker_a.post_init(logger=logger)
+    await worker_b.post_init(logger=logger)
+
+    await worker_a.update_data(
+        data_type='user',
+        data_id=12345678,
+        local_data={'a': 1}
+    )
+
+    local_user_data = {}
+    await worker_b.refresh_data(
+        data_type='user',
+        data_id=12345678,
+        local_data=local_user_data
+    )
+    assert local_user_data == {'a': 1}
+
+
+async def test_ended_conversations_are_removed():
+
+    storage = MemoryStorage()
+    worker_a = MemoryDataStore(storage=storage)
+    worker_b = MemoryDataStore(storage=storage)
+    await worker_a.post_init(logger=logger)
+    await worker_b.post_init(logger=logger)
+
+    await worker_a.update_conversation(name='order', key=(1, 1), local_state=1)
+    order = {}
+    await worker_b.refresh_conversation(name='order', key=(1, 1), local_data=order)
+    assert order == {(1, 1): 1}
+
+    # Worker A ends the conversation.
+    await worker_a.update_conversation(name='order', key=(1, 1), local_state=None)
+    await worker_b.refresh_conversation(name='order', key=(1, 1), local_data=order)
+    assert order == {}
+
+    # States PTB has not saved yet are kept.
+    tracking = TrackingDict()
+    tracking[(2, 2)] = 0
+    await worker_b.refresh_conversations([('order', (2, 2), tracking)])
+    assert tracking == {(2, 2): 0}
+
+
+async def test_latency():
+
+    data_store = MemoryDataStore(latency=0.05)
+    await data_store.post_init(logger=logger)
+
+    start_time = time.monotonic()
+    await data_store.refresh_many(
+        data=[
+            ('user', 1, {}),
+            ('chat', 1, {}),
+            ('bot', 1, {})
+        ],
+        conversations=[]
+    )
+    elapsed_time = time.monotonic() - start_time
+
+    # Concurrent refreshes wait for about one round trip.
+    assert 0.05 <= elapsed_time < 0.15
+
+
+async def test_callback_data():
+
+    data_store = MemoryDataStore(
+        store_callback_data=True
+    )
+    await data_store.post_init(logger=logger)
+
+    assert await data_store.get_callback_data() is None
+
+    callback_data = (
+        [('keyboard-a', 1.0, {'button-1': 'a'})],
+        {'query-1': 'keyboard-a'}
+    )
+    await data_store.update_callback_data(callback_data)
+
+    assert await data_store.get_callback_data() == callback_data
+
+
+async def test_build_persistence_input():
+
+    data_store = MemoryDataStore(
+        store_bot_data=False
+    )
+    await data_store.post_init(logger=logger)
+
+    result = data_store.build_persistence_input()
+
+    assert isinstance(result, PersistenceInput)
+    assert result.bot_data is False
+    assert result.user_data is True
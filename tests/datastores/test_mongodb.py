@@ -1,7 +1,12 @@
+from ptb_persistence import PTBPersistence
 from ptb_persistence.datastores.mongodb import MongoDBDataStore
+from ptb_persistence.codec import LazyDocument, ValueCodec
 from motor.motor_asyncio import AsyncIOMotorClient
 from telegram.ext import PersistenceInput
+from telegram.ext._utils.trackingdict import TrackingDict
 import pymongo.errors
+import bson
+import asyncio
 import pytest
 import config
 
@@ -109,6 +114,199 @@ async def test_drop_data(motor_client: AsyncIOMotorClient):
     assert 12345678 not in data_found
 
 
+async def test_update_data_writes_only_changed_keys(motor_client: AsyncIOMotorClient):
+
+    worker_a = MongoDBDataStore(
+        client_or_uri=motor_client,
+        database=config.MONGO_DB_NAME,
+        collection_userdata='userdata'
+    )
+    worker_b = MongoDBDataStore(
+        client_or_uri=motor_client,
+        database=config.MONGO_DB_NAME,
+        collection_userdata='userdata'
+    )
+    await worker_a.post_init(logger=logger)
+    await worker_b.post_init(logger=logger)
+
+    await worker_a.update_data(
+        data_type='user',
+        data_id=87654321,
+        local_data={'a': 1, 'removed': True}
+    )
+
+    local_user_data = {}
+    await worker_b.refresh_data(
+        data_type='user',
+        data_id=87654321,
+        local_data=local_user_data
+    )
+    local_user_data['b'] = 2
+    await worker_b.update_data(
+        data_type='user',
+        data_id=87654321,
+        local_data=local_user_data
+    )
+
+    # Worker A does not know about key 'b' and must not overwrite it.
+    await worker_a.update_data(
+        data_type='user',
+        data_id=87654321,
+        local_data={'a': 3}
+    )
+
+    data = await worker_a.get_data(
+        data_type='user',
+        data_id=87654321
+    )
+    assert data[87654321] == {'a': 3, 'b': 2}
+
+    await worker_a.drop_data(
+        data_type='user',
+        data_id=87654321
+    )
+
+
+@pytest.mark.parametrize('write_behind', [False, True])
+async def test_update_data_after_drop_by_other_worker(
+        motor_client: AsyncIOMotorClient,
+        write_behind: bool
+        ):
+
+    worker_a = MongoDBDataStore(
+        client_or_uri=motor_client,
+        database=config.MONGO_DB_NAME,
+        collection_userdata='userdata',
+        write_behind=write_behind,
+        write_batch_delay=60
+    )
+    worker_b = MongoDBDataStore(
+        client_or_uri=motor_client,
+        database=config.MONGO_DB_NAME,
+        collection_userdata='userdata'
+    )
+    await worker_a.post_init(logger=logger)
+    await worker_b.post_init(logger=logger)
+
+    await worker_a.update_data(
+        data_type='user',
+        data_id=55667788,
+        local_data={'a': 1, 'b': 2}
+    )
+    if write_behind:
+        await worker_a._write_pending()
+
+    await worker_b.drop_data(
+        data_type='user',
+        data_id=55667788
+    )
+
+    # Only 'b' changed, but the document must be written in full.
+    await worker_a.update_data(
+        data_type='user',
+        data_id=55667788,
+        local_data={'a': 1, 'b': 3}
+    )
+    if write_behind:
+        await worker_a._write_pending()
+
+    data = await worker_b.get_data(
+        data_type='user',
+        data_id=55667788
+    )
+    assert data[55667788] == {'a': 1, 'b': 3}
+
+    await worker_b.drop_data(
+        data_type='user',
+        data_id=55667788
+    )
+    await worker_a.flush()
+
+
+async def test_refresh_data_skips_unchanged_document(motor_client: AsyncIOMotorClient):
+
+    worker_a = MongoDBDataStore(
+        client_or_uri=motor_client,
+        database=config.MONGO_DB_NAME,
+        collection_userdata='userdata'
+    )
+    worker_b = MongoDBDataStore(
+        client_or_uri=motor_client,
+        database=config.MONGO_DB_NAME,
+        collection_userdata='userdata'
+    )
+    await worker_a.post_init(logger=logger)
+    await worker_b.post_init(logger=logger)
+
+    local_user_data = {'a': 1}
+    await worker_a.update_data(
+        data_type='user',
+        data_id=55667788,
+        local_data=local_user_data
+    )
+
+    # Not stored yet, and kept because the stored document did not change.
+    local_user_data['unsaved'] = True
+    await worker_a.refresh_data(
+        data_type='user',
+        data_id=55667788,
+        local_data=local_user_data
+    )
+    assert local_user_data == {'a': 1, 'unsaved': True}
+
+    await worker_b.update_data(
+        data_type='user',
+        data_id=55667788,
+        local_data={'a': 2}
+    )
+
+    await worker_a.refresh_data(
+        data_type='user',
+        data_id=55667788,
+        local_data=local_user_data
+    )
+    assert local_user_data == {'a': 2, 'unsaved': True}
+
+    await worker_a.drop_data(
+        data_type='user',
+        data_id=55667788
+    )
+
+
+async def test_get_data_parallel_ranges(motor_client: AsyncIOMotorClient):
+
+    data_store = MongoDBDataStore(
+        client_or_uri=motor_client,
+        database=config.MONGO_DB_NAME,
+        collection_chatdata='chatdata',
+        ignore_chat_keys=['_cache'],
+        load_batch_size=3,
+        load_parallelism=4
+    )
+    await data_store.post_init(logger=logger)
+
+    chat_ids = list(range(-1000, 1000, 97))
+    for chat_id in chat_ids:
+        await data_store.update_data(
+            data_type='chat',
+            data_id=chat_id,
+            local_data={'chat_id': chat_id}
+        )
+    await data_store._chat_data.collection.update_one(
+        {'_id': chat_ids[0]},
+        {'$set': {'_cache': 'stale'}}
+    )
+
+    data = await data_store.get_data(
+        data_type='chat'
+    )
+
+    assert sorted(data) == chat_ids
+    assert data[chat_ids[0]] == {'chat_id': chat_ids[0]}
+
+    await data_store._chat_data.collection.delete_many({})
+
+
 async def test_update_conversation(motor_client: AsyncIOMotorClient):
 
     data_store = MongoDBDataStore(
@@ -150,6 +348,57 @@ async def test_refresh_conversation(motor_client: AsyncIOMotorClient):
     }
 
 
+async def test_refresh_conversations(motor_client: AsyncIOMotorClient):
+
+    data_store, other_data_store = (
+        MongoDBDataStore(
+            client_or_uri=motor_client,
+            database=config.MONGO_DB_NAME,
+            collection_conversationsdata='conversations_refresh'
+        )
+        for _ in range(2)
+    )
+    await data_store.post_init(logger=logger)
+    await other_data_store.post_init(logger=logger)
+    collection = data_store._conversations_data.collection
+    await collection.delete_many({})
+
+    await data_store.update_conversation(name='order', key=(1, 1), local_state=1)
+    await data_store.update_conversation(name='order', key=(2, 2), local_state=2)
+    await data_store.update_conversation(name='support', key=(1,), local_state='open')
+
+    order = {}
+    support = {(9,): 'ended elsewhere'}
+    conversations = [
+        ('order', (1, 1), order),
+        ('order', (2, 2), order),
+        ('support', (1,), support),
+        ('support', (9,), support),
+    ]
+    await data_store.refresh_conversations(conversations)
+    assert order == {(1, 1): 1, (2, 2): 2}
+    # Not in the data store: removed.
+    assert support == {(1,): 'open'}
+
+    # Changed without a new revision: skipped as unchanged.
+    await collection.update_one({'state': 1}, {'$set': {'state': 99}})
+    # Changed and ended by another worker.
+    await other_data_store.update_conversation(name='order', key=(2, 2), local_state=3)
+    await other_data_store.update_conversation(name='support', key=(1,), local_state=None)
+
+    await data_store.refresh_conversations(conversations)
+    assert order == {(1, 1): 1, (2, 2): 3}
+    assert support == {}
+
+    # States PTB has not saved yet are kept.
+    tracking = TrackingDict()
+    tracking[(5, 5)] = 0
+    await data_store.refresh_conversations([('order', (5, 5), tracking)])
+    assert tracking == {(5, 5): 0}
+
+    await collection.delete_many({})
+
+
 async def test_get_conversations(motor_client: AsyncIOMotorClient):
 
     data_store = MongoDBDataStore(
@@ -194,6 +443,52 @@ async def test_update_conversation_state_none(motor_client: AsyncIOMotorClient):
     assert (12345678, 12345678) not in result
 
 
+async def test_migrate_conversation_keys(motor_client: AsyncIOMotorClient):
+
+    data_store = MongoDBDataStore(
+        client_or_uri=motor_client,
+        database=config.MONGO_DB_NAME,
+        collection_conversationsdata='conversations'
+    )
+    await data_store.post_init(logger=logger)
+
+    collection = data_store._conversations_data.collection
+    await collection.insert_one({
+        '_id': {'name': 'legacyconv', 'key': str((12345678, 'inline'))},
+        'state': 3
+    })
+
+    assert await data_store.get_conversations(name='legacyconv') == {}
+
+    migrated = await data_store.migrate_conversation_keys()
+
+    assert migrated == 1
+    assert await data_store.get_conversations(name='legacyconv') == {
+        (12345678, 'inline'): 3
+    }
+
+    await data_store.update_conversation(
+        name='legacyconv',
+        key=(12345678, 'inline'),
+        local_state=None
+    )
+
+
+async def test_post_init_creates_indexes(motor_client: AsyncIOMotorClient):
+
+    data_store = MongoDBDataStore(
+        client_or_uri=motor_client,
+        database=config.MONGO_DB_NAME,
+        collection_conversationsdata='conversations'
+    )
+    await data_store.post_init(logger=logger)
+    await data_store._index_task
+
+    indexes = await data_store._conversations_data.collection.index_information()
+
+    assert 'conversation_name' in indexes
+
+
 async def test_build_persistence_input(motor_client: AsyncIOMotorClient):
 
     data_store = MongoDBDataStore(
@@ -237,3 +532,557 @@ async def test_flush_close_client():
     with pytest.raises(pymongo.errors.InvalidOperation):
         await data_store._client.admin.command('ping')
 
+
+
+async def test_write_behind_flush(motor_client: AsyncIOMotorClient):
+
+    data_store = MongoDBDataStore(
+        client_or_uri=motor_client,
+        database=config.MONGO_DB_NAME,
+        collection_userdata='userdata',
+        collection_conversationsdata='conversations',
+        write_behind=True,
+        write_batch_delay=60
+    )
+    await data_store.post_init(logger=logger)
+
+    await data_store.update_data(
+        data_type='user',
+        data_id=11223344,
+        local_data={'first': 1}
+    )
+    await data_store.update_data(
+        data_type='user',
+        data_id=11223344,
+        local_data={'second': 2}
+    )
+    await data_store.update_conversation(
+        name='writebehindconv',
+        key=(11223344, 11223344),
+        local_state=2
+    )
+
+    # Nothing is sent before the delay expires or the batch is full.
+    assert 11223344 not in await data_store.get_data(
+        data_type='user',
+        data_id=11223344
+    )
+
+    collection = data_store._user_data.collection
+    conversations = data_store._conversations_data.collection
+
+    await data_store.flush()
+
+    assert await collection.find_one(
+        {'_id': 11223344},
+        projection={'_rev': False}
+    ) == {
+        '_id': 11223344,
+        'second': 2
+    }
+    assert await conversations.count_documents(
+        {'_id.name': 'writebehindconv'}
+    ) == 1
+
+    await collection.delete_one({'_id': 11223344})
+    await conversations.delete_many({'_id.name': 'writebehindconv'})
+
+
+async def test_write_behind_partial_failure(motor_client: AsyncIOMotorClient):
+
+    database = motor_client[config.MONGO_DB_NAME]
+    await database.drop_collection('userdata_validated')
+    await database.create_collection(
+        'userdata_validated',
+        validator={'score': {'$type': 'int'}}
+    )
+
+    data_store = MongoDBDataStore(
+        client_or_uri=motor_client,
+        database=config.MONGO_DB_NAME,
+        collection_userdata='userdata_validated',
+        write_behind=True,
+        write_batch_delay=60
+    )
+    await data_store.post_init(logger=logger)
+
+    collection = data_store._user_data.collection
+    await collection.create_index('name', unique=True, sparse=True)
+    await collection.insert_one({'_id': 1, 'name': 'taken'})
+
+    await data_store.update_data(data_type='user', data_id=2, local_data={'score': 1})
+    await data_store.update_data(data_type='user', data_id=3, local_data={'score': 'high'})
+    await data_store.update_data(data_type='user', data_id=4, local_data={'name': 'taken'})
+    await data_store._write_pending()
+
+    # The other writes of the batch are applied.
+    assert await collection.find_one({'_id': 2}, projection={'_rev': False}) == {'_id': 2, 'score': 1}
+    assert await collection.find_one({'_id': 3}) is None
+    assert await collection.find_one({'_id': 4}) is None
+
+    # Failed validation: sent again, with the later changes. Duplicate key: dropped.
+    assert data_store._user_data.writes.get(3) is not None
+    assert data_store._user_data.writes.get(4) is None
+
+    await data_store.update_data(data_type='user', data_id=3, local_data={'score': 3})
+    await data_store.flush()
+
+    assert await collection.find_one({'_id': 3}, projection={'_rev': False}) == {'_id': 3, 'score': 3}
+
+    await database.drop_collection('userdata_validated')
+
+
+async def test_reload_watched_data(motor_client: AsyncIOMotorClient):
+
+    worker_a = MongoDBDataStore(
+        client_or_uri=motor_client,
+        database=config.MONGO_DB_NAME,
+        collection_userdata='userdata',
+        watch_changes=True
+    )
+    worker_b = MongoDBDataStore(
+        client_or_uri=motor_client,
+        database=config.MONGO_DB_NAME,
+        collection_userdata='userdata'
+    )
+    await worker_a.post_init(logger=logger)
+    await worker_b.post_init(logger=logger)
+
+    await worker_b.update_data(
+        data_type='user',
+        data_id=99887766,
+        local_data={'a': 1}
+    )
+    await worker_b.update_data(
+        data_type='user',
+        data_id=99887767,
+        local_data={'b': 1}
+    )
+
+    user_data = await worker_a.get_data(
+        data_type='user'
+    )
+    user_data[99887768] = {'not_stored': True}
+
+    # Changed while worker A was not watching.
+    await worker_b.update_data(
+        data_type='user',
+        data_id=99887766,
+        local_data={'a': 2}
+    )
+    await worker_b.drop_data(
+        data_type='user',
+        data_id=99887767
+    )
+
+    await worker_a._reload_data(worker_a._user_data, user_data)
+
+    assert user_data[99887766] == {'a': 2}
+    assert user_data[99887767] == {}
+    assert user_data[99887768] == {'not_stored': True}
+
+    await worker_b.drop_data(
+        data_type='user',
+        data_id=99887766
+    )
+
+
+async def test_refresh_data_skips_known_absent(motor_client: AsyncIOMotorClient):
+
+    data_store = MongoDBDataStore(
+        client_or_uri=motor_client,
+        database=config.MONGO_DB_NAME,
+        collection_userdata='userdata',
+        absent_cache_ttl=60
+    )
+    await data_store.post_init(logger=logger)
+
+    local_user_data = {}
+    await data_store.refresh_data(
+        data_type='user',
+        data_id=44556677,
+        local_data=local_user_data
+    )
+    assert local_user_data == {}
+
+    # Created behind the data store's back: not seen until the ttl expires.
+    collection = data_store._user_data.collection
+    await collection.insert_one({'_id': 44556677, 'a': 1})
+    await data_store.refresh_data(
+        data_type='user',
+        data_id=44556677,
+        local_data=local_user_data
+    )
+    assert local_user_data == {}
+
+    # Its own writes are seen at once.
+    await data_store.update_data(
+        data_type='user',
+        data_id=44556677,
+        local_data={'a': 2}
+    )
+    await data_store.refresh_data(
+        data_type='user',
+        data_id=44556677,
+        local_data=local_user_data
+    )
+    assert local_user_data == {'a': 2}
+
+    await data_store.drop_data(
+        data_type='user',
+        data_id=44556677
+    )
+
+
+async def test_evicted_data_is_forgotten(motor_client: AsyncIOMotorClient):
+
+    data_store = MongoDBDataStore(
+        client_or_uri=motor_client,
+        database=config.MONGO_DB_NAME,
+        collection_userdata='userdata_evicted',
+        absent_cache_ttl=60,
+        codec=ValueCodec(threshold=1024)
+    )
+    persistence = PTBPersistence(
+        data_store=data_store,
+        max_user_data_entries=1
+    )
+    await persistence.get_user_data()
+    collection = data_store._user_data.collection
+    await collection.delete_many({})
+
+    mapping = persistence.build_data_mapping(data_type='user', default_factory=dict)
+
+    # Stored as a blob, with its fingerprints and revision known.
+    await persistence.refresh_user_data(1, mapping[1])
+    mapping[1]['history'] = 'x' * 2048
+    await persistence.update_user_data(1, mapping[1])
+    await persistence.refresh_user_data(1, mapping[1])
+    # Known absent.
+    await persistence.refresh_user_data(2, mapping[2])
+    await persistence.refresh_user_data(3, mapping[3])
+
+    user_data = data_store._user_data
+    assert 1 in user_data._fingerprints
+    assert 1 in user_data._encoded
+    assert 1 in user_data._revisions
+    assert user_data.is_absent(2)
+
+    await persistence.evict_data(data_type='user', ids_to_update=set())
+    assert list(mapping) == [3]
+
+    for state in (
+            user_data._fingerprints,
+            user_data._encoded,
+            user_data._revisions,
+            user_data._absent
+            ):
+        assert 1 not in state
+        assert 2 not in state
+
+    await collection.delete_many({})
+
+
+async def test_callback_data(motor_client: AsyncIOMotorClient):
+
+    data_store = MongoDBDataStore(
+        client_or_uri=motor_client,
+        database=config.MONGO_DB_NAME,
+        collection_callbackdata='callbackdata',
+        callback_data_maxsize=2
+    )
+    await data_store.post_init(logger=logger)
+
+    assert data_store.build_persistence_input().callback_data is True
+
+    await data_store.update_callback_data((
+        [('keyboard-a', 1.0, {'button-1': 'a'}), ('keyboard-b', 2.0, {'button-1': ('b', 1)})],
+        {'query-1': 'keyboard-a'}
+    ))
+    # keyboard-a is used, keyboard-b dropped from the cache and keyboard-c added.
+    await data_store.update_callback_data((
+        [('keyboard-a', 3.0, {'button-1': 'a'}), ('keyboard-c', 4.0, {'button-1': 'c'})],
+        {'query-1': 'keyboard-a'}
+    ))
+
+    collection = data_store._callback_data.collection
+    assert await collection.count_documents({}) == 3
+
+    data_store = MongoDBDataStore(
+        client_or_uri=motor_client,
+        database=config.MONGO_DB_NAME,
+        collection_callbackdata='callbackdata',
+        callback_data_maxsize=2
+    )
+    await data_store.post_init(logger=logger)
+
+    assert await data_store.get_callback_data() == (
+        [('keyboard-a', 3.0, {'button-1': 'a'}), ('keyboard-c', 4.0, {'button-1': 'c'})],
+        {'query-1': 'keyboard-a'}
+    )
+
+    # A worker with a smaller cache loads less, but leaves the rest to the others.
+    data_store = MongoDBDataStore(
+        client_or_uri=motor_client,
+        database=config.MONGO_DB_NAME,
+        collection_callbackdata='callbackdata',
+        callback_data_maxsize=1
+    )
+    await data_store.post_init(logger=logger)
+
+    assert await data_store.get_callback_data() == (
+        [('keyboard-c', 4.0, {'button-1': 'c'})],
+        {}
+    )
+    assert await collection.count_documents({}) == 3
+
+    # Unless pruning is enabled.
+    data_store = MongoDBDataStore(
+        client_or_uri=motor_client,
+        database=config.MONGO_DB_NAME,
+        collection_callbackdata='callbackdata',
+        callback_data_maxsize=1,
+        prune_callback_data=True
+    )
+    await data_store.post_init(logger=logger)
+
+    assert await data_store.get_callback_data() == (
+        [('keyboard-c', 4.0, {'button-1': 'c'})],
+        {}
+    )
+    assert await collection.count_documents({}) == 1
+
+    await collection.delete_many({})
+
+
+async def test_codec(motor_client: AsyncIOMotorClient):
+
+    data_store = MongoDBDataStore(
+        client_or_uri=motor_client,
+        database=config.MONGO_DB_NAME,
+        collection_userdata='userdata',
+        codec=ValueCodec(threshold=1024)
+    )
+    await data_store.post_init(logger=logger)
+
+    await data_store.update_data(
+        data_type='user',
+        data_id=12345678,
+        local_data={'small': 'value'}
+    )
+    await data_store.update_data(
+        data_type='user',
+        data_id=87654321,
+        local_data={'history': list(range(1000)), 'not_bson': {1, 2, 3}}
+    )
+
+    collection = data_store._user_data.collection
+    assert 'small' in await collection.find_one({'_id': 12345678})
+    assert '_blob' in await collection.find_one({'_id': 87654321})
+
+    stats = data_store.get_codec_stats('user')
+    assert (stats.plain, stats.encoded) == (1, 1)
+    assert stats.compression_ratio < 1
+
+    data_store = MongoDBDataStore(
+        client_or_uri=motor_client,
+        database=config.MONGO_DB_NAME,
+        collection_userdata='userdata',
+        codec=ValueCodec(threshold=1024)
+    )
+    await data_store.post_init(logger=logger)
+
+    data = await data_store.get_data('user')
+    assert isinstance(data[87654321], LazyDocument)
+    assert data_store.get_codec_stats('user').decoded == 0
+
+    assert data[87654321]['not_bson'] == {1, 2, 3}
+    assert data_store.get_codec_stats('user').decoded == 1
+
+    await collection.delete_many({'_id': {'$in': [12345678, 87654321]}})
+
+
+async def test_bot_data_partitions(motor_client: AsyncIOMotorClient):
+
+    data_store = MongoDBDataStore(
+        client_or_uri=motor_client,
+        database=config.MONGO_DB_NAME,
+        collection_botdata='botdata'
+    )
+    await data_store.post_init(logger=logger)
+
+    collection = data_store._bot_data.collection
+    await collection.delete_many({})
+
+    # Stored as one document before partitioning.
+    await data_store.update_data(
+        data_type='bot',
+        data_id=12345678,
+        local_data={'key-0': 0}
+    )
+
+    data_store = MongoDBDataStore(
+        client_or_uri=motor_client,
+        database=config.MONGO_DB_NAME,
+        collection_botdata='botdata',
+        bot_data_partitions=4
+    )
+    await data_store.post_init(logger=logger)
+
+    bot_data = (await data_store.get_data(data_type='bot', data_id=12345678))[12345678]
+    assert bot_data == {'key-0': 0}
+
+    bot_data.update({f'key-{i}': i for i in range(1, 20)})
+    await data_store.update_data(
+        data_type='bot',
+        data_id=12345678,
+        local_data=bot_data
+    )
+
+    # The single document was replaced by the partitions.
+    assert await collection.count_documents({'_id': 12345678}) == 0
+    assert await collection.count_documents({'_id.bot': 12345678}) == 4
+
+    data_store = MongoDBDataStore(
+        client_or_uri=motor_client,
+        database=config.MONGO_DB_NAME,
+        collection_botdata='botdata',
+        bot_data_partitions=4
+    )
+    await data_store.post_init(logger=logger)
+
+    assert await data_store.get_data(data_type='bot') == {12345678: bot_data}
+
+    await collection.delete_many({})
+
+
+async def test_sharded_collections(motor_client: AsyncIOMotorClient):
+
+    collections = ['userdata_shard_0', 'userdata_shard_1', 'userdata_shard_2']
+
+    data_store = MongoDBDataStore(
+        client_or_uri=motor_client,
+        database=config.MONGO_DB_NAME,
+        collection_userdata=collections,
+        write_behind=True
+    )
+    await data_store.post_init(logger=logger)
+
+    for user_id in range(100):
+        await data_store.update_data(
+            data_type='user',
+            data_id=user_id,
+            local_data={'user_id': user_id}
+        )
+    await data_store.flush()
+
+    counts = [
+        await collection.count_documents({})
+        for collection in data_store._user_data.collections
+    ]
+    assert sum(counts) == 100
+    assert all(counts)
+
+    # The order of the collections does not matter.
+    data_store = MongoDBDataStore(
+        client_or_uri=motor_client,
+        database=config.MONGO_DB_NAME,
+        collection_userdata=list(reversed(collections))
+    )
+    await data_store.post_init(logger=logger)
+
+    data = await data_store.get_data(data_type='user')
+    assert data == {user_id: {'user_id': user_id} for user_id in range(100)}
+
+    assert await data_store.get_data(data_type='user', data_id=42) == {42: {'user_id': 42}}
+
+    await data_store.drop_data(data_type='user', data_id=42)
+    assert await data_store.get_data(data_type='user', data_id=42) == {}
+
+    for collection in data_store._user_data.collections:
+        await collection.drop()
+
+
+async def test_slow_operations(motor_client: AsyncIOMotorClient):
+
+    data_store = MongoDBDataStore(
+        client_or_uri=motor_client,
+        database=config.MONGO_DB_NAME,
+        collection_userdata='userdata',
+        collection_conversationsdata='conversationsdata',
+        # Every operation is slow.
+        slow_operation_threshold=0,
+        slow_operation_log_size=2,
+        explain_slow_operations=True
+    )
+    await data_store.post_init(logger=logger)
+
+    await data_store.update_data(
+        data_type='user',
+        data_id=12345678,
+        local_data={'my_key': 'value of my key'}
+    )
+    await data_store.refresh_data(
+        data_type='user',
+        data_id=12345678,
+        local_data={}
+    )
+    await data_store.get_conversations(name='slow-handler')
+
+    refresh, get_conversations = data_store.get_slow_operations()
+
+    assert refresh.collection.endswith('.userdata')
+    assert refresh.operation == 'find_one'
+    assert refresh.filter == {'_id': 12345678}
+    assert refresh.shape == "{'_id': '?'}"
+    assert refresh.documents == 1
+    assert refresh.document_bytes > 0
+
+    assert get_conversations.operation == 'find'
+    assert get_conversations.filter == {'_id.name': 'slow-handler'}
+    assert get_conversations.documents == 0
+
+    # One explain per collection and filter shape, attached to the first
+    # operation of the shape.
+    assert len(data_store._query_plans) == 2
+    await asyncio.gather(*data_store._explain_tasks)
+    assert get_conversations.plan is not None
+
+    await data_store._user_data.collection.delete_one({'_id': 12345678})
+
+
+async def test_apply_change_with_removed_fields(motor_client: AsyncIOMotorClient):
+
+    data_store = MongoDBDataStore(
+        client_or_uri=motor_client,
+        database=config.MONGO_DB_NAME,
+        collection_userdata='userdata'
+    )
+    await data_store.post_init(logger=logger)
+
+    await data_store.update_data(
+        data_type='user',
+        data_id=12345678,
+        local_data={'a': 1, 'b': 2}
+    )
+
+    # Another process removed 'b'.
+    revision = bson.ObjectId()
+    user_data = {12345678: {'a': 1, 'b': 2}}
+    data_store._apply_data_change(
+        data_store._user_data,
+        user_data,
+        {
+            'operationType': 'update',
+            'documentKey': {'_id': 12345678},
+            'fullDocument': {'_id': 12345678, 'a': 1, '_rev': revision},
+            'updateDescription': {'updatedFields': {'_rev': revision}, 'removedFields': ['b']}
+        }
+    )
+
+    assert user_data == {12345678: {'a': 1}}
+    assert data_store._user_data._revisions == {12345678: revision}
+    assert list(data_store._user_data._fingerprints) == [12345678]
+    assert list(data_store._user_data.get_fingerprints(12345678)) == ['a']
+
+    await data_store._user_data.collection.delete_one({'_id': 12345678})
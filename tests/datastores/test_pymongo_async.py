@@ -0,0 +1,95 @@
+import pytest
+
+pytest.importorskip('pymongo.asynchronous')
+
+from ptb_persistence.datastores.pymongo_async import PyMongoDataStore
+from pymongo import AsyncMongoClient
+import pymongo.errors
+import pytest_asyncio
+import config
+
+import logging
+
+
+logger = logging.getLogger(name='PTBPersistence')
+
+
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+
+
+@pytest_asyncio.fixture()
+async def pymongo_client():
+    client = AsyncMongoClient(config.MONGO_DB_URI)
+    yield client
+    await client.close()
+
+
+
+async def test_update_and_get_data(pymongo_client: AsyncMongoClient):
+
+    data_store = PyMongoDataStore(
+        client_or_uri=pymongo_client,
+        database=config.MONGO_DB_NAME,
+        collection_userdata='userdata_pymongo'
+    )
+    await data_store.post_init(logger=logger)
+
+    await data_store.update_data(
+        data_type='user',
+        data_id=12345678,
+        local_data={'my_key': 'value of my key'}
+    )
+
+    assert await data_store.get_data(data_type='user', data_id=12345678) == {
+        12345678: {'my_key': 'value of my key'}
+    }
+
+    local_data = {}
+    await data_store.refresh_data(
+        data_type='user',
+        data_id=12345678,
+        local_data=local_data
+    )
+    assert local_data == {'my_key': 'value of my key'}
+
+    await data_store.drop_data(data_type='user', data_id=12345678)
+    assert await data_store.get_data(data_type='user', data_id=12345678) == {}
+
+
+async def test_update_conversation(pymongo_client: AsyncMongoClient):
+
+    data_store = PyMongoDataStore(
+        client_or_uri=pymongo_client,
+        database=config.MONGO_DB_NAME,
+        collection_conversationsdata='conversations_pymongo'
+    )
+    await data_store.post_init(logger=logger)
+
+    await data_store.update_conversation(
+        name='my_conversation',
+        key=(123, 456),
+        local_state=1
+    )
+    assert await data_store.get_conversations('my_conversation') == {(123, 456): 1}
+
+    await data_store.update_conversation(
+        name='my_conversation',
+        key=(123, 456),
+        local_state=None
+    )
+    assert await data_store.get_conversations('my_conversation') == {}
+
+
+async def test_flush_close_client():
+
+    data_store = PyMongoDataStore(
+        client_or_uri=config.MONGO_DB_URI,
+        database=config.MONGO_DB_NAME
+    )
+    await data_store.post_init(logger=logger)
+
+    await data_store.flush()
+
+    with pytest.raises(pymongo.errors.InvalidOperation):
+        await data_store._client.admin.command('ping')
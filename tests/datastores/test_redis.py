@@ -0,0 +1,190 @@
+import pytest
+
+fakeredis = pytest.importorskip('fakeredis')
+
+from ptb_persistence.datastores.redis import RedisDataStore
+from telegram.ext import PersistenceInput
+import asyncio
+
+import logging
+
+
+logger = logging.getLogger(name='PTBPersistence')
+
+
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+
+
+@pytest.fixture()
+def redis_client():
+    return fakeredis.FakeAsyncRedis()
+
+
+
+async def test_update_and_get_data(redis_client):
+
+    data_store = RedisDataStore(
+        client_or_url=redis_client,
+        prefix_userdata='userdata',
+        ignore_general_keys=['_cache'],
+        load_batch_size=10
+    )
+    await data_store.post_init(logger=logger)
+
+    await asyncio.gather(*(
+        data_store.update_data(
+            data_type='user',
+            data_id=user_id,
+            local_data={'user_id': user_id, '_cache': 1}
+        )
+        for user_id in range(25)
+    ))
+
+    data = await data_store.get_data(
+        data_type='user'
+    )
+    assert len(data) == 25
+    assert data[7] == {'user_id': 7}
+
+    assert await data_store.get_data(
+        data_type='user',
+        data_id=7
+    ) == {7: {'user_id': 7}}
+
+
+async def test_update_data_writes_only_changed_keys(redis_client):
+
+    worker_a = RedisDataStore(
+        client_or_url=redis_client,
+        prefix_userdata='userdata'
+    )
+    worker_b = RedisDataStore(
+        client_or_url=redis_client,
+        prefix_userdata='userdata'
+    )
+    await worker_a.post_init(logger=logger)
+    await worker_b.post_init(logger=logger)
+
+    await worker_a.update_data(
+        data_type='user',
+        data_id=87654321,
+        local_data={'a': 1, 'removed': True}
+    )
+
+    local_user_data = {}
+    await worker_b.refresh_data(
+        data_type='user',
+        data_id=87654321,
+        local_data=local_user_data
+    )
+    local_user_data['b'] = 2
+    await worker_b.update_data(
+        data_type='user',
+        data_id=87654321,
+        local_data=local_user_data
+    )
+
+    # Worker A does not know about key 'b' and must not overwrite it.
+    await worker_a.update_data(
+        data_type='user',
+        data_id=87654321,
+        local_data={'a': 3}
+    )
+
+    data = await worker_a.get_data(
+        data_type='user',
+        data_id=87654321
+    )
+    assert data[87654321] == {'a': 3, 'b': 2}
+
+
+async def test_refresh_many_and_drop_data(redis_client):
+
+    data_store = RedisDataStore(
+        client_or_url=redis_client,
+        prefix_userdata='userdata',
+        prefix_chatdata='chatdata',
+        prefix_conversationsdata='conversations'
+    )
+    await data_store.post_init(logger=logger)
+
+    await data_store.update_data(
+        data_type='user',
+        data_id=1,
+        local_data={'a': 1}
+    )
+    await data_store.update_data(
+        data_type='chat',
+        data_id=-1,
+        local_data={'b': 1}
+    )
+    await data_store.update_conversation(
+        name='chatconv',
+        key=(1, -1),
+        local_state=2
+    )
+
+    user_data, chat_data, conversations_data = {}, {}, {}
+    await data_store.refresh_many(
+        data=[
+            ('user', 1, user_data),
+            ('chat', -1, chat_data)
+        ],
+        conversations=[
+            ('chatconv', (1, -1), conversations_data),
+            ('chatconv', (2, -2), conversations_data)
+        ]
+    )
+    assert user_data == {'a': 1}
+    assert chat_data == {'b': 1}
+    assert conversations_data == {(1, -1): 2}
+
+    await data_store.drop_data(
+        data_type='user',
+        data_id=1
+    )
+    assert await data_store.get_data(
+        data_type='user',
+        data_id=1
+    ) == {}
+
+
+async def test_conversations(redis_client):
+
+    data_store = RedisDataStore(
+        client_or_url=redis_client,
+        prefix_conversationsdata='conversations'
+    )
+    await data_store.post_init(logger=logger)
+
+    await data_store.update_conversation(
+        name='chatconv',
+        key=(12345678, 'inline'),
+        local_state=1
+    )
+    assert await data_store.get_conversations(name='chatconv') == {
+        (12345678, 'inline'): 1
+    }
+
+    await data_store.update_conversation(
+        name='chatconv',
+        key=(12345678, 'inline'),
+        local_state=None
+    )
+    assert await data_store.get_conversations(name='chatconv') == {}
+
+
+async def test_build_persistence_input(redis_client):
+
+    data_store = RedisDataStore(
+        client_or_url=redis_client,
+        prefix_userdata='userdata'
+    )
+    await data_store.post_init(logger=logger)
+
+    result = data_store.build_persistence_input()
+
+    assert isinstance(result, PersistenceInput)
+    assert result.user_data is True
+    assert result.bot_data is False
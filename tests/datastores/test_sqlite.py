@@ -0,0 +1,225 @@
+from ptb_persistence.datastores.sqlite import SQLiteDataStore
+from telegram.ext import PersistenceInput
+from telegram.ext._utils.trackingdict import TrackingDict
+import asyncio
+import pytest
+
+import logging
+
+
+logger = logging.getLogger(name='PTBPersistence')
+
+
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+
+
+@pytest.fixture()
+def database_path(tmp_path) -> str:
+    return str(tmp_path / 'persistence.sqlite3')
+
+
+
+async def test_update_and_get_data(database_path: str):
+
+    data_store = SQLiteDataStore(
+        path=database_path,
+        table_userdata='userdata',
+        ignore_general_keys=['_cache']
+    )
+    await data_store.post_init(logger=logger)
+
+    result = await data_store.update_data(
+        data_type='user',
+        data_id=12345678,
+        local_data={'my_key': 'value of my key', '_cache': 1}
+    )
+    assert result is None
+
+    data = await data_store.get_data(
+        data_type='user'
+    )
+    assert data == {
+        12345678: {'my_key': 'value of my key'}
+    }
+
+    await data_store.flush()
+
+
+async def test_refresh_and_drop_data(database_path: str):
+
+    data_store = SQLiteDataStore(
+        path=database_path,
+        table_chatdata='chatdata'
+    )
+    await data_store.post_init(logger=logger)
+
+    await data_store.update_data(
+        data_type='chat',
+        data_id=-100,
+        local_data={'a': 1}
+    )
+
+    local_chat_data = {'unsaved': True}
+    await data_store.refresh_data(
+        data_type='chat',
+        data_id=-100,
+        local_data=local_chat_data
+    )
+    assert local_chat_data == {'a': 1, 'unsaved': True}
+
+    await data_store.drop_data(
+        data_type='chat',
+        data_id=-100
+    )
+    assert await data_store.get_data(
+        data_type='chat',
+        data_id=-100
+    ) == {}
+
+    await data_store.flush()
+
+
+async def test_concurrent_writes_are_batched(database_path: str):
+
+    data_store = SQLiteDataStore(
+        path=database_path,
+        table_userdata='userdata'
+    )
+    await data_store.post_init(logger=logger)
+
+    await asyncio.gather(*(
+        data_store.update_data(
+            data_type='user',
+            data_id=user_id,
+            local_data={'user_id': user_id}
+        )
+        for user_id in range(100)
+    ))
+
+    data = await data_store.get_data(
+        data_type='user'
+    )
+    assert len(data) == 100
+    assert data[42] == {'user_id': 42}
+
+    await data_store.flush()
+
+
+async def test_conversations(database_path: str):
+
+    data_store = SQLiteDataStore(
+        path=database_path,
+        table_conversationsdata='conversations'
+    )
+    await data_store.post_init(logger=logger)
+
+    await data_store.update_conversation(
+        name='chatconv',
+        key=(12345678, 'inline'),
+        local_state=1
+    )
+
+    conversations_data = {}
+    await data_store.refresh_conversation(
+        name='chatconv',
+        key=(12345678, 'inline'),
+        local_data=conversations_data
+    )
+    assert conversations_data == {
+        (12345678, 'inline'): 1
+    }
+    assert await data_store.get_conversations(name='chatconv') == {
+        (12345678, 'inline'): 1
+    }
+
+    await data_store.update_conversation(
+        name='chatconv',
+        key=(12345678, 'inline'),
+        local_state=None
+    )
+    assert await data_store.get_conversations(name='chatconv') == {}
+
+    await data_store.flush()
+
+
+async def test_ended_conversations_are_removed(database_path: str):
+
+    worker_a = SQLiteDataStore(
+        path=database_path,
+        table_conversationsdata='conversations'
+    )
+    worker_b = SQLiteDataStore(
+        path=database_path,
+        table_conversationsdata='conversations'
+    )
+    await worker_a.post_init(logger=logger)
+    await worker_b.post_init(logger=logger)
+
+    await worker_a.update_conversation(name='order', key=(1, 1), local_state=1)
+    await worker_a.update_conversation(name='order', key=(2, 2), local_state=2)
+    order = {}
+    await worker_b.refresh_conversations([
+        ('order', (1, 1), order),
+        ('order', (2, 2), order),
+    ])
+    assert order == {(1, 1): 1, (2, 2): 2}
+
+    # Worker A ends the first conversation.
+    await worker_a.update_conversation(name='order', key=(1, 1), local_state=None)
+    await worker_b.refresh_conversations([
+        ('order', (1, 1), order),
+        ('order', (2, 2), order),
+    ])
+    assert order == {(2, 2): 2}
+
+    # States PTB has not saved yet are kept.
+    tracking = TrackingDict()
+    tracking[(3, 3)] = 0
+    await worker_b.refresh_conversation(name='order', key=(3, 3), local_data=tracking)
+    assert tracking == {(3, 3): 0}
+
+    await worker_a.flush()
+    await worker_b.flush()
+
+
+async def test_data_survives_restart(database_path: str):
+
+    data_store = SQLiteDataStore(
+        path=database_path,
+        table_botdata='botdata'
+    )
+    await data_store.post_init(logger=logger)
+    await data_store.update_data(
+        data_type='bot',
+        data_id=1,
+        local_data={'a': 1}
+    )
+    await data_store.flush()
+
+    data_store = SQLiteDataStore(
+        path=database_path,
+        table_botdata='botdata'
+    )
+    await data_store.post_init(logger=logger)
+
+    assert await data_store.get_data(data_type='bot') == {1: {'a': 1}}
+
+    await data_store.flush()
+
+
+async def test_build_persistence_input(database_path: str):
+
+    data_store = SQLiteDataStore(
+        path=database_path,
+        table_userdata='userdata'
+    )
+    await data_store.post_init(logger=logger)
+
+    result = data_store.build_persistence_input()
+
+    assert isinstance(result, PersistenceInput)
+    assert result.user_data is True
+    assert result.chat_data is False
+
+    await data_store.flush()
@@ -0,0 +1,96 @@
+from ptb_persistence import PTBPersistence
+from ptb_persistence._bounded import BoundedDataDict
+from ptb_persistence.datastores.memory import MemoryDataStore, MemoryStorage
+import pytest
+import copy
+
+import logging
+
+
+logger = logging.getLogger(name='PTBPersistence')
+
+
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+
+
+def test_lru_eviction_order():
+    mapping = BoundedDataDict(dict, max_entries=3)
+
+    for user_id in (1, 2, 3, 4, 5, 1):
+        mapping[user_id]['seen'] = True
+        mapping.touch(user_id)
+
+    assert mapping.eviction_candidates() == [2, 3]
+    assert (mapping.stats.hits, mapping.stats.misses) == (1, 5)
+
+    # Reads, like the copies made by PTB to update the persistence, are not uses.
+    for user_id in (2, 3, 4, 5, 1):
+        copy.deepcopy(mapping[user_id])
+    assert mapping.eviction_candidates() == [2, 3]
+    assert (mapping.stats.hits, mapping.stats.misses) == (1, 5)
+
+
+def test_evict_skips_entries_used_since():
+    mapping = BoundedDataDict(dict, max_entries=1)
+    for user_id in (1, 2):
+        mapping[user_id]['seen'] = True
+        mapping.touch(user_id)
+
+    assert mapping.eviction_candidates() == [1]
+    tick = mapping.tick(1)
+    mapping.touch(1)
+
+    assert not mapping.evict(1, tick)
+    assert mapping.evict(2, mapping.tick(2))
+    assert list(mapping) == [1]
+    assert mapping.stats.evictions == 1
+
+
+def test_byte_limit():
+    mapping = BoundedDataDict(dict, max_bytes=3000)
+    for user_id in range(5):
+        mapping[user_id]['blob'] = b'x' * 1000
+        mapping.touch(user_id)
+
+    candidates = mapping.eviction_candidates()
+    assert candidates == [0, 1, 2]
+
+    for user_id in candidates:
+        mapping.evict(user_id, mapping.tick(user_id))
+    assert mapping.total_bytes() <= 3000
+    assert mapping.eviction_candidates() == []
+
+
+async def test_write_before_eviction_and_reload():
+    storage = MemoryStorage()
+    persistence = PTBPersistence(
+        data_store=MemoryDataStore(storage=storage),
+        max_user_data_entries=2
+    )
+    mapping = persistence.build_data_mapping(data_type='user', default_factory=dict)
+
+    for user_id in (1, 2, 3):
+        await persistence.refresh_user_data(user_id, mapping[user_id])
+        mapping[user_id]['count'] = user_id
+    ids_to_update = {1, 2, 3}
+
+    await persistence.evict_data(data_type='user', ids_to_update=ids_to_update)
+
+    # The least recently used entry was written, then evicted.
+    assert ids_to_update == {2, 3}
+    assert storage.user_data == {1: {'count': 1}}
+    assert list(mapping) == [2, 3]
+    assert persistence.get_data_stats('user').evictions == 1
+
+    await persistence.refresh_user_data(1, mapping[1])
+    assert mapping[1] == {'count': 1}
+    # 1, 2 and 3 were new, and 1 was evicted.
+    assert persistence.get_data_stats('user').misses == 4
+
+    # An update of an evicted entry, not refreshed since, does not replace the stored data.
+    await persistence.evict_data(data_type='user', ids_to_update=ids_to_update)
+    assert ids_to_update == {3}
+    assert 2 not in mapping
+    await persistence.update_user_data(2, {'other': True})
+    assert storage.user_data[2] == {'count': 2, 'other': True}
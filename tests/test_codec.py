@@ -0,0 +1,84 @@
+from ptb_persistence.codec import LazyDocument, ValueCodec
+import pickle
+import pytest
+import copy
+
+
+
+@pytest.mark.parametrize(
+    'serializer, compressor',
+    [
+        ('pickle', 'zlib'),
+        ('pickle', None),
+        ('json', 'zlib'),
+        ('msgpack', 'zlib'),
+        ('pickle', 'zstd'),
+        ('pickle', 'lz4'),
+    ]
+)
+def test_round_trip(serializer: str, compressor: str | None):
+    try:
+        codec = ValueCodec(serializer=serializer, compressor=compressor)
+    except ImportError:
+        pytest.skip(f'{serializer}+{compressor} is not installed')
+
+    data = {'history': ['message'] * 1000, 'count': 3}
+    name, blob, raw_size = codec.encode(data)
+
+    assert ValueCodec.decode(name, blob) == data
+    if compressor is not None:
+        assert name == f'{serializer}+{compressor}'
+        assert len(blob) < raw_size
+
+
+def test_incompressible_data_is_not_compressed():
+    codec = ValueCodec()
+
+    name, blob, raw_size = codec.encode({'v': 1})
+
+    assert name == 'pickle'
+    assert len(blob) == raw_size
+
+
+def test_invalid_codec():
+    with pytest.raises(ValueError):
+        ValueCodec(serializer='xml')
+
+    with pytest.raises(ValueError):
+        ValueCodec(compressor='gzip')
+
+
+def test_lazy_document():
+    calls = []
+
+    def loader() -> dict:
+        calls.append(1)
+        return {'key': 'value'}
+
+    document = LazyDocument(loader)
+    assert isinstance(document, dict)
+    assert not document.loaded()
+
+    assert document['key'] == 'value'
+    assert document.loaded()
+
+    document['other'] = 1
+    assert dict(document) == {'key': 'value', 'other': 1}
+    assert len(calls) == 1
+
+
+def test_lazy_document_copies_are_plain_dicts():
+    for copier in (copy.copy, copy.deepcopy, lambda d: pickle.loads(pickle.dumps(d))):
+        document = LazyDocument(lambda: {'key': 'value'})
+
+        result = copier(document)
+
+        assert type(result) is dict
+        assert result == {'key': 'value'}
+
+
+def test_lazy_document_update():
+    local_data = {}
+    local_data.update(LazyDocument(lambda: {'key': 'value'}))
+
+    assert local_data == {'key': 'value'}
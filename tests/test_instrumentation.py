@@ -0,0 +1,201 @@
+from ptb_persistence import PTBPersistence
+from ptb_persistence.datastores.memory import MemoryDataStore
+from ptb_persistence.instrumentation import (
+    LatencyHistogram,
+    MethodCall,
+    MetricsRecorder,
+    QueryBudget,
+    QueryBudgetExceeded,
+    account,
+    add_hook,
+    current_accounting,
+    remove_hook
+    )
+import pytest_asyncio
+import pytest
+
+import logging
+
+
+logger = logging.getLogger(name='PTBPersistence')
+
+
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+
+
+@pytest_asyncio.fixture()
+async def recorder():
+    recorder = MetricsRecorder()
+    add_hook(recorder)
+    yield recorder
+    remove_hook(recorder)
+
+
+async def test_hook_receives_calls():
+    calls: list[MethodCall] = []
+    add_hook(calls.append)
+    try:
+        data_store = MemoryDataStore()
+        await data_store.post_init(logger=logger)
+        await data_store.update_data(
+            data_type='user',
+            data_id=1,
+            local_data={'a': 1}
+        )
+    finally:
+        remove_hook(calls.append)
+
+    call = calls[-1]
+    assert call.component == 'MemoryDataStore'
+    assert call.method == 'update_data'
+    assert call.error is None
+    assert call.duration >= 0
+    assert call.arguments == {'data_type': 'user', 'data_id': 1, 'local_data': {'a': 1}}
+
+
+async def test_metrics_recorder(recorder: MetricsRecorder):
+    data_store = MemoryDataStore()
+    await data_store.post_init(logger=logger)
+
+    for user_id in range(3):
+        await data_store.update_data(
+            data_type='user',
+            data_id=user_id,
+            local_data={'history': list(range(100))}
+        )
+    await data_store.get_data(data_type='user')
+    with pytest.raises(ValueError):
+        await data_store.get_data(data_type='invalid')
+
+    updates = recorder.metrics[('MemoryDataStore', 'update_data')]
+    assert updates.calls == 3
+    assert updates.documents == 3
+    assert updates.payload_bytes > 3 * 100
+    assert updates.latency.count == 3
+
+    gets = recorder.metrics[('MemoryDataStore', 'get_data')]
+    assert gets.calls == 2
+    assert gets.errors == 1
+    assert gets.documents == 3
+
+
+async def test_no_hook_no_debug():
+    calls: list[MethodCall] = []
+    add_hook(calls.append)
+    remove_hook(calls.append)
+
+    quiet_logger = logging.getLogger(name='PTBPersistence.quiet')
+    quiet_logger.setLevel(logging.INFO)
+
+    data_store = MemoryDataStore()
+    await data_store.post_init(logger=quiet_logger)
+    await data_store.update_data(data_type='user', data_id=1, local_data={'a': 1})
+
+    assert calls == []
+
+
+async def test_debug_log_truncated(caplog: pytest.LogCaptureFixture):
+    data_store = MemoryDataStore()
+    await data_store.post_init(logger=logger)
+
+    with caplog.at_level(logging.DEBUG, logger='PTBPersistence'):
+        await data_store.update_data(
+            data_type='user',
+            data_id=1,
+            local_data={str(key): 'x' * 1000 for key in range(100)}
+        )
+
+    messages = [record.getMessage() for record in caplog.records]
+    assert any(
+        message.startswith("MemoryDataStore: Calling 'update_data' method.")
+        for message in messages
+    )
+    assert all(len(message) < 2000 for message in messages)
+
+
+def test_latency_histogram():
+    histogram = LatencyHistogram()
+    assert histogram.quantile(0.5) is None
+
+    for _ in range(99):
+        histogram.record(0.001)
+    histogram.record(1.0)
+
+    assert histogram.count == 100
+    assert histogram.max == 1.0
+    assert 0.001 <= histogram.quantile(0.5) < 0.002
+    assert histogram.quantile(1.0) == 1.0
+
+
+async def test_account():
+    data_store = MemoryDataStore()
+    await data_store.post_init(logger=logger)
+    await data_store.update_data(data_type='user', data_id=1, local_data={'a': 1})
+
+    assert current_accounting() is None
+    with account() as accounting:
+        assert current_accounting() is accounting
+        # Each refresh_data run by refresh_many is a data store call of its own.
+        await data_store.refresh_many(
+            data=[('user', 1, {}), ('chat', 2, {})],
+            conversations=[]
+        )
+        await data_store.update_data(data_type='user', data_id=1, local_data={'a': 2})
+    assert current_accounting() is None
+
+    assert accounting.operations == 3
+    assert accounting.calls == {'refresh_data': 2, 'update_data': 1}
+    assert accounting.documents == 3
+    assert accounting.bytes_in > 0
+    assert accounting.bytes_out > 0
+    assert accounting.store_time > 0
+    assert not accounting.exceeded
+
+
+async def test_query_budget_raise():
+    data_store = MemoryDataStore()
+    await data_store.post_init(logger=logger)
+
+    with account(budget=QueryBudget(max_operations=2, action='raise')) as accounting:
+        for user_id in range(2):
+            await data_store.refresh_data(data_type='user', data_id=user_id, local_data={})
+
+        with pytest.raises(QueryBudgetExceeded) as exc_info:
+            await data_store.refresh_data(data_type='user', data_id=2, local_data={})
+
+    assert exc_info.value.accounting is accounting
+    assert exc_info.value.reasons == ['3 > 2 operations']
+    assert accounting.exceeded
+
+
+async def test_query_budget_log(caplog: pytest.LogCaptureFixture):
+    data_store = MemoryDataStore()
+    await data_store.post_init(logger=logger)
+
+    with caplog.at_level(logging.WARNING, logger='PTBPersistence'):
+        with account(budget=QueryBudget(max_bytes=100)) as accounting:
+            for user_id in range(3):
+                await data_store.update_data(
+                    data_type='user',
+                    data_id=user_id,
+                    local_data={'history': list(range(100))}
+                )
+
+    assert accounting.operations == 3
+    warnings = [record for record in caplog.records if record.levelno == logging.WARNING]
+    assert len(warnings) == 1
+    assert 'Query budget exceeded' in warnings[0].getMessage()
+
+
+async def test_account_update():
+    persistence = PTBPersistence(data_store=MemoryDataStore())
+    with persistence.account_update() as accounting:
+        assert accounting is None
+
+    persistence = PTBPersistence(
+        data_store=MemoryDataStore(),
+        query_budget=QueryBudget(max_operations=1)
+    )
+    with persistence.account_update() as accounting:
+        assert accounting.budget.max_operations == 1
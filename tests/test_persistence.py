@@ -0,0 +1,89 @@
+from ptb_persistence import PTBPersistence
+from ptb_persistence.datastores.memory import MemoryDataStore, MemoryStorage
+import pytest
+
+import logging
+
+
+logger = logging.getLogger(name='PTBPersistence')
+
+
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+
+
+def build_storage() -> MemoryStorage:
+    return MemoryStorage(
+        user_data={1: {'name': 'first'}, 2: {'name': 'second'}},
+        chat_data={-100: {'title': 'group'}}
+    )
+
+
+async def test_lazy_startup_loads_nothing():
+    persistence = PTBPersistence(
+        data_store=MemoryDataStore(storage=build_storage()),
+        logger=logger,
+        lazy_user_data=True,
+        lazy_chat_data=True
+    )
+
+    assert await persistence.get_user_data() == {}
+    assert await persistence.get_chat_data() == {}
+
+
+async def test_lazy_first_refresh_loads_entry():
+    persistence = PTBPersistence(
+        data_store=MemoryDataStore(storage=build_storage()),
+        logger=logger,
+        lazy_user_data=True,
+        lazy_chat_data=True
+    )
+    await persistence.get_user_data()
+
+    user_data = {}
+    await persistence.refresh_user_data(1, user_data)
+    assert user_data == {'name': 'first'}
+
+    chat_data = {}
+    await persistence.refresh_chat_data(-100, chat_data)
+    assert chat_data == {'title': 'group'}
+
+
+async def test_lazy_evicted_entry_is_reloaded():
+    storage = build_storage()
+    persistence = PTBPersistence(
+        data_store=MemoryDataStore(storage=storage),
+        logger=logger,
+        lazy_user_data=True,
+        max_user_data_entries=1
+    )
+    mapping = persistence.build_data_mapping(data_type='user', default_factory=dict)
+
+    await persistence.refresh_user_data(1, mapping[1])
+    await persistence.refresh_user_data(2, mapping[2])
+    await persistence.evict_data(data_type='user', ids_to_update=set())
+    assert list(mapping) == [2]
+
+    # Changed by another process meanwhile.
+    storage.user_data[1]['name'] = 'changed'
+
+    await persistence.refresh_user_data(1, mapping[1])
+    assert mapping[1] == {'name': 'changed'}
+
+
+async def test_lazy_update_of_unloaded_entry_merges_stored_data():
+    storage = build_storage()
+    persistence = PTBPersistence(
+        data_store=MemoryDataStore(storage=storage),
+        logger=logger,
+        lazy_user_data=True
+    )
+    await persistence.get_user_data()
+
+    # Marked for update without being refreshed first.
+    await persistence.update_user_data(2, {'score': 10})
+    assert storage.user_data[2] == {'name': 'second', 'score': 10}
+
+    # Loaded now: later updates are written as they are.
+    await persistence.update_user_data(2, {'score': 11})
+    assert storage.user_data[2] == {'score': 11}
@@ -0,0 +1,166 @@
+from ptb_persistence import PTBPersistence
+from ptb_persistence.datastores.memory import MemoryDataStore, MemoryStorage
+from ptb_persistence.instrumentation import account
+from ptb_persistence.utils.ptb import CustomApplication
+from telegram import Update
+from telegram.ext import (
+    Application,
+    CommandHandler,
+    ContextTypes,
+    ConversationHandler
+    )
+from telegram.request import BaseRequest, RequestData
+import pytest_asyncio
+import pytest
+
+import json
+
+
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+
+
+class OfflineRequest(BaseRequest):
+    """Answers getMe with a fake bot and any other Bot API request with True."""
+
+    async def initialize(self) -> None:
+        return
+
+
+    async def shutdown(self) -> None:
+        return
+
+
+    @property
+    def read_timeout(self) -> float | None:
+        return None
+
+
+    async def do_request(self,
+            url: str,
+            method: str,
+            request_data: RequestData | None = None,
+            read_timeout: float | None = None,
+            write_timeout: float | None = None,
+            connect_timeout: float | None = None,
+            pool_timeout: float | None = None
+            ) -> tuple[int, bytes]:
+        if url.endswith('/getMe'):
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Test', 'username': 'test_bot'}
+        else:
+            result = True
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+
+
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    context.user_data['started'] = True
+
+
+async def order(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    return 0
+
+
+def make_update(application: Application, user_id: int, text: str) -> Update:
+    return Update.de_json(
+        {
+            'update_id': 1,
+            'message': {
+                'message_id': 1,
+                'date': 0,
+                'chat': {'id': user_id, 'type': 'private'},
+                'from': {'id': user_id, 'is_bot': False, 'first_name': 'User'},
+                'text': text,
+                'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(text)}],
+            },
+        },
+        application.bot
+    )
+
+
+@pytest_asyncio.fixture()
+async def application():
+    storage = MemoryStorage(user_data={10: {'name': 'stored'}})
+    application = (
+        Application
+        .builder()
+        .application_class(CustomApplication)
+        .token('1:test')
+        .request(OfflineRequest())
+        .get_updates_request(OfflineRequest())
+        .persistence(
+            PTBPersistence(
+                data_store=MemoryDataStore(storage=storage),
+                lazy_user_data=True,
+                lazy_chat_data=True
+            )
+        )
+        .build()
+    )
+    application.add_handler(CommandHandler('start', start))
+    async with application:
+        yield application
+
+
+async def test_process_update_without_matching_handler(application: Application):
+    with account() as accounting:
+        await application.process_update(make_update(application, 10, '/unknown'))
+
+    assert accounting.operations == 0
+    assert 10 not in application.user_data
+    assert 10 not in application.chat_data
+
+
+async def test_process_update_with_matching_handler(application: Application):
+    with account() as accounting:
+        await application.process_update(make_update(application, 10, '/start'))
+
+    # The bot, chat and user data, refreshed by a single refresh_many.
+    assert accounting.calls == {'refresh_data': 3}
+    assert application.user_data[10] == {'name': 'stored', 'started': True}
+
+
+async def test_process_update_with_persistent_conversation(
+        application: Application,
+        monkeypatch: pytest.MonkeyPatch
+        ):
+    application.add_handler(
+        ConversationHandler(
+            entry_points=[CommandHandler('order', order)],
+            states={},
+            fallbacks=[],
+            name='order',
+            persistent=True
+        ),
+        group=-1
+    )
+
+    # Data store round trips made for each update.
+    data_store = application.persistence._data_store
+    refresh_many = data_store.refresh_many
+    round_trips = []
+    async def count_refresh_many(**kwargs) -> None:
+        round_trips.append(kwargs)
+        await refresh_many(**kwargs)
+    monkeypatch.setattr(data_store, 'refresh_many', count_refresh_many)
+
+    # The conversation state and the bot data are refreshed before the handlers
+    # check the update.
+    with account() as accounting:
+        await application.process_update(make_update(application, 20, '/unknown'))
+    assert accounting.calls == {'refresh_conversation': 1, 'refresh_data': 1}
+    assert len(round_trips) == 1
+    assert 20 not in application.user_data
+
+    # The user and chat data created for the matched update are fetched afterwards.
+    with account() as accounting:
+        await application.process_update(make_update(application, 20, '/order'))
+    assert accounting.calls == {'refresh_conversation': 1, 'refresh_data': 3}
+    assert len(round_trips) == 3
+
+    # Once in memory, they are refreshed along with the conversation state.
+    with account() as accounting:
+        await application.process_update(make_update(application, 20, '/order'))
+    assert accounting.calls == {'refresh_conversation': 1, 'refresh_data': 3}
+    assert len(round_trips) == 4
+    assert len(round_trips[-1]['data']) == 3